@@ -0,0 +1,58 @@
+"""notify cache listeners of user changes
+
+Revision ID: c4d2a9f7b813
+Revises: 290c4039b962
+Create Date: 2026-10-18 18:45:12.402119
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'c4d2a9f7b813'
+down_revision = '290c4039b962'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("""
+CREATE OR REPLACE FUNCTION cache_notify() RETURNS trigger AS $$
+DECLARE
+    pk text;
+BEGIN
+    IF current_setting('cache.notify', true) = 'off' THEN
+        RETURN NULL;
+    END IF;
+    IF TG_LEVEL = 'ROW' THEN
+        IF TG_OP = 'DELETE' THEN
+            pk := to_jsonb(OLD) ->> TG_ARGV[0];
+        ELSE
+            pk := to_jsonb(NEW) ->> TG_ARGV[0];
+        END IF;
+    END IF;
+    PERFORM pg_notify(
+        'cache_invalidation',
+        json_build_object(
+            'table', TG_TABLE_NAME, 'op', TG_OP, 'pk', pk, 'txid', txid_current()
+        )::text
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+""")
+    op.execute(
+        'CREATE TRIGGER user_cache_notify '
+        'AFTER INSERT OR UPDATE OR DELETE ON "user" '
+        "FOR EACH ROW EXECUTE FUNCTION cache_notify('id')"
+    )
+    op.execute(
+        'CREATE TRIGGER user_cache_notify_truncate '
+        'AFTER TRUNCATE ON "user" '
+        'FOR EACH STATEMENT EXECUTE FUNCTION cache_notify()'
+    )
+
+
+def downgrade() -> None:
+    op.execute('DROP TRIGGER IF EXISTS user_cache_notify ON "user"')
+    op.execute('DROP TRIGGER IF EXISTS user_cache_notify_truncate ON "user"')
+    op.execute('DROP FUNCTION IF EXISTS cache_notify()')
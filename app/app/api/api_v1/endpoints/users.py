@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import Any
 
-from fastapi import APIRouter, Body, Depends
+from fastapi import APIRouter, Body, Depends, Query
 from fastapi.encoders import jsonable_encoder
 from fastapi.exceptions import HTTPException
 from starlette import status
@@ -15,23 +15,30 @@ from app.api import deps
 from app.core import security
 from app.core.config import settings
 from app.core.security import get_password_hash
-from app.utils import APIResponseType, APIResponse
+from app.crud.base import AlreadyExists
+from app.crud.pagination import InvalidCursor
+from app.utils import APIResponseType, APIResponse, PaginatedContent
 from app import exceptions as exc
 from app.utils.user import (
     verify_password_reset_token,
 )
-from cache import cache, invalidate
-from cache.util import ONE_DAY_IN_SECONDS
+from cache import cache, invalidate, CacheRoute
+from cache.types import AdaptiveTTL, ListCacheOptions, WriteThrough
+from cache.util import ONE_DAY_IN_SECONDS, ONE_HOUR_IN_SECONDS
 
 
-router = APIRouter()
+router = APIRouter(route_class=CacheRoute)
 namespace = "user"
+# columns users can be paged by, users without a `created` or `modified` time
+# come after all others
+USER_SORT_FIELDS = {"id", "created", "modified", "email"}
 
 
 @router.post("/token")
 async def login(
     login_user_in: schemas.LoginUser,
-    db: Session = Depends(deps.get_db_async),
+    # a password changed moments ago must already be checked.
+    db: Session = Depends(deps.get_db_async_primary),
 ) -> Any:
     """
     Get access and refresh token.
@@ -144,11 +151,21 @@ async def reset_password(
 
 
 @router.get("/")
-@cache(namespace=namespace, expire=ONE_DAY_IN_SECONDS)
+@cache(
+    namespace=namespace,
+    expire=ONE_DAY_IN_SECONDS,
+    stale_while_revalidate=ONE_HOUR_IN_SECONDS,
+    early_refresh_beta=1.0,
+    tags=["user:list"],
+    vary_by=(),
+    auth_check=deps.is_superuser_request,
+    list_cache=ListCacheOptions(item_tag="user:{id}", items_field="content"),
+)
 async def read_users(
     db: AsyncSession = Depends(deps.get_db_async),
-    skip: int = 0,
-    limit: int = 100,
+    skip: int = Query(0, ge=0),
+    # bounds the chunks one request can load
+    limit: int = Query(100, gt=0, le=1000),
     current_user: models.User = Depends(deps.get_current_active_superuser),
 ) -> APIResponseType[list[schemas.User]]:
     """
@@ -158,55 +175,75 @@ async def read_users(
     return APIResponse(users)
 
 
-@router.post("/")
-@invalidate(namespace=namespace)
-async def create_user(
-    *,
+@router.get("/page/")
+async def read_users_page(
     db: AsyncSession = Depends(deps.get_db_async),
-    user_in: schemas.UserCreate,
+    cursor: str | None = None,
+    limit: int = Query(100, gt=0, le=1000),
+    order_by: list[str] = Query(["-id"]),
     current_user: models.User = Depends(deps.get_current_active_superuser),
-) -> APIResponseType[schemas.User]:
+) -> APIResponseType[PaginatedContent[list[schemas.User]]]:
     """
-    Create new user.
+    Retrieve users a page at a time, following the cursors of the pages.
     """
-    user = await crud.user.get_by_email(db, email=user_in.email)
-    if user:
+    if not {field.lstrip("-") for field in order_by} <= USER_SORT_FIELDS:
         raise exc.InternalServiceError(
             status_code=400,
-            detail="The user with this username already exists in the system.",
+            detail=f"Users can only be sorted by {', '.join(sorted(USER_SORT_FIELDS))}",
             msg_code=utils.MessageCodes.bad_request,
         )
-    user = await crud.user.create(db, obj_in=user_in)
-    return APIResponse(user)
+    try:
+        page = await crud.user.get_page(
+            db, cursor=cursor, limit=limit, order_by=order_by
+        )
+    except InvalidCursor as e:
+        raise exc.InternalServiceError(
+            status_code=400,
+            detail=str(e),
+            msg_code=utils.MessageCodes.bad_request,
+        )
+    return APIResponse(
+        PaginatedContent(
+            data=page.items,
+            limit=limit,
+            next_cursor=page.next_cursor,
+            prev_cursor=page.prev_cursor,
+        )
+    )
 
 
-@router.put("/update/me")
-@invalidate(namespace=namespace)
-async def update_user_me(
+@router.post("/")
+@invalidate(tags=["user:list"])
+async def create_user(
     *,
     db: AsyncSession = Depends(deps.get_db_async),
-    password: str | None = Body(),
-    full_name: str | None = Body(),
-    email: str | None = Body(),
-    current_user: models.User = Depends(deps.get_current_active_user),
+    user_in: schemas.UserCreate,
+    current_user: models.User = Depends(deps.get_current_active_superuser),
 ) -> APIResponseType[schemas.User]:
     """
-    Update own user.
+    Create new user.
     """
-    current_user_data = jsonable_encoder(current_user)
-    user_in = schemas.UserUpdate(**current_user_data)
-    if password is not None:
-        user_in.password = password
-    if full_name is not None:
-        user_in.full_name = full_name
-    if email is not None:
-        user_in.email = email
-    user = await crud.user.update(db, db_obj=current_user, obj_in=user_in)
+    try:
+        user = await crud.user.create(db, obj_in=user_in)
+    except AlreadyExists:
+        raise exc.InternalServiceError(
+            status_code=400,
+            detail="The user with this username already exists in the system.",
+            msg_code=utils.MessageCodes.bad_request,
+        )
     return APIResponse(user)
 
 
 @router.get("/{user_id}")
-@cache(namespace=namespace, expire=ONE_DAY_IN_SECONDS)
+@cache(
+    namespace=namespace,
+    expire=AdaptiveTTL(min_ttl=60, max_ttl=ONE_DAY_IN_SECONDS),
+    stale_while_revalidate=ONE_HOUR_IN_SECONDS,
+    early_refresh_beta=1.0,
+    tags=["user:{user_id}"],
+    vary_by=(),
+    auth_check=deps.can_read_user,
+)
 async def read_user_by_id(
     user_id: int,
     current_user: models.User = Depends(deps.get_current_active_user),
@@ -233,10 +270,48 @@ async def read_user_by_id(
     return APIResponse(user)
 
 
+@router.put("/update/me")
+@invalidate(
+    tags=["user:{current_user.id}"],
+    write_through=[
+        WriteThrough(read_user_by_id, arguments={"user_id": "{current_user.id}"})
+    ],
+)
+async def update_user_me(
+    *,
+    db: AsyncSession = Depends(deps.get_db_async_without_notify),
+    password: str | None = Body(),
+    full_name: str | None = Body(),
+    email: str | None = Body(),
+    current_user: models.User = Depends(deps.get_current_active_user),
+) -> APIResponseType[schemas.User]:
+    """
+    Update own user.
+    """
+    current_user_data = jsonable_encoder(current_user)
+    user_in = schemas.UserUpdate(**current_user_data)
+    if password is not None:
+        user_in.password = password
+    if full_name is not None:
+        user_in.full_name = full_name
+    if email is not None:
+        user_in.email = email
+    try:
+        user = await crud.user.update(db, db_obj=current_user, obj_in=user_in)
+    except AlreadyExists:
+        raise exc.InternalServiceError(
+            status_code=400,
+            detail="The user with this username already exists in the system.",
+            msg_code=utils.MessageCodes.bad_request,
+        )
+    return APIResponse(user)
+
+
 @router.put("/{user_id}")
+@invalidate(tags=["user:{user_id}"], write_through=[WriteThrough(read_user_by_id)])
 async def update_user(
     *,
-    db: AsyncSession = Depends(deps.get_db_async),
+    db: AsyncSession = Depends(deps.get_db_async_without_notify),
     user_id: int,
     user_in: schemas.UserUpdate,
     current_user: models.User = Depends(deps.get_current_active_superuser),
@@ -244,12 +319,18 @@ async def update_user(
     """
     Update a user.
     """
-    user = await crud.user.get(db, id=user_id)
+    try:
+        user = await crud.user.update_by_id(db, id=user_id, obj_in=user_in)
+    except AlreadyExists:
+        raise exc.InternalServiceError(
+            status_code=400,
+            detail="The user with this username already exists in the system.",
+            msg_code=utils.MessageCodes.bad_request,
+        )
     if not user:
         raise exc.InternalServiceError(
             status_code=404,
             detail="The user with this username does not exist in the system",
             msg_code=utils.MessageCodes.not_found,
         )
-    user = await crud.user.update(db, db_obj=user, obj_in=user_in)
     return APIResponse(user)
@@ -1,6 +1,6 @@
 from typing import Any
 from fastapi import APIRouter, Depends, WebSocket
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse
 from celery.result import AsyncResult
 
 from app import models, schemas
@@ -41,6 +41,37 @@ async def test_redis(
         return {"msg": f"ERROR: {str(e)}"}
 
 
+@router.get("/cache-metrics/", response_class=PlainTextResponse)
+async def cache_metrics(
+    current_user: models.User = Depends(deps.get_current_active_superuser),
+) -> Any:
+    """
+    Cache counters and Redis latencies of this worker, in the Prometheus text format.
+    """
+    return Cache().stats.render()
+
+
+@router.get("/cache-ttls/")
+async def cache_ttls(
+    current_user: models.User = Depends(deps.get_current_active_superuser),
+) -> Any:
+    """
+    TTLs chosen for the endpoints cached with an adaptive TTL, and the traffic
+    they are based on.
+    """
+    return Cache().ttl_advisor.snapshot()
+
+
+@router.get("/cache-usage/")
+async def cache_usage(
+    current_user: models.User = Depends(deps.get_current_active_superuser),
+) -> Any:
+    """
+    Entries and bytes cached per namespace with a quota, against its limits.
+    """
+    return await Cache().get_usage()
+
+
 @router.websocket("/echo-client/")
 async def echo_client(websocket: WebSocket):
     await websocket.accept()
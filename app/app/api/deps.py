@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import Generator, AsyncGenerator
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 # from fastapi.security import OAuth2PasswordBearer
 from fastapi.security import HTTPBearer
 from pydantic import ValidationError
@@ -11,8 +11,16 @@ import jwt
 
 from app import crud, models, schemas, utils
 from app.core.config import settings
+from app.db.lazy import set_transaction_setting
+from app.db.routing import set_scope, use_primary
 from app.db.session import SessionLocal, async_session
 from app import exceptions as exc
+from cache import Cache, cache
+from cache.db_listener import NOTIFY_SETTING
+from cache.util import ONE_HOUR_IN_SECONDS
+
+SUPERUSER_ROLE = "superuser"
+USER_ROLE = "user"
 
 
 def get_db() -> Generator:
@@ -23,11 +31,109 @@ def get_db() -> Generator:
         db.close()
 
 
-async def get_db_async() -> AsyncGenerator:
+async def get_db_async(request: Request) -> AsyncGenerator:
+    """
+    Session reading from the replicas, if any, except within the read-your-writes
+    window of the request's principal.
+    """
     async with async_session() as session:
+        set_scope(session, lambda: get_token_principal(request))
         yield session
 
 
+async def get_db_async_primary() -> AsyncGenerator:
+    """Session reading from the primary, for reads that must not lag behind."""
+    async with async_session() as session:
+        use_primary(session)
+        yield session
+
+
+async def get_db_async_without_notify(request: Request) -> AsyncGenerator:
+    """
+    Session whose transactions do not notify the cache listener.
+
+    For endpoints that update the cache themselves (`invalidate` with
+    `write_through`), whose fresh entries the listener would invalidate again.
+    """
+    async with async_session() as session:
+        set_scope(session, lambda: get_token_principal(request))
+        set_transaction_setting(session, NOTIFY_SETTING, "off")
+        yield session
+
+
+def get_token_principal(request: Request) -> str | None:
+    """
+    Verified subject of the request's bearer token, without a database lookup.
+
+    Used to scope route-level cache keys. Returns "" for anonymous requests and
+    None when a token is present but cannot be verified.
+    """
+    authorization = request.headers.get("authorization")
+    if not authorization:
+        return ""
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        payload = jwt.decode(
+            token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
+        )
+    except jwt.PyJWTError:
+        return None
+    if payload.get("token_type") != "access" or not payload.get("sub"):
+        return None
+    return str(payload["sub"])
+
+
+@cache(
+    namespace="user-role",
+    expire=ONE_HOUR_IN_SECONDS,
+    tags=["user:{user_id}"],
+    vary_by=(),
+)
+async def get_user_role(user_id: int) -> str | None:
+    """
+    Role of an active user, None for unknown and inactive users.
+
+    Cached until the user is updated, so resolving roles for cache hits does not
+    touch the database. Read from the primary, a lagging replica would cache the
+    role the user had before the update.
+    """
+    async with async_session() as db:
+        user = await crud.user.get(db, id=user_id, primary=True)
+    if not user or not crud.user.is_active(user):
+        return None
+    return SUPERUSER_ROLE if crud.user.is_superuser(user) else USER_ROLE
+
+
+async def get_token_role(request: Request) -> str | None:
+    """
+    Role of the request's verified principal, "" for anonymous requests and None
+    when it cannot be verified.
+    """
+    principal = await Cache().resolve_principal(request)
+    if not principal:
+        return principal
+    return await get_user_role(int(principal))
+
+
+async def is_superuser_request(request: Request) -> bool:
+    """Cache auth check for endpoints of `get_current_active_superuser`."""
+    return await Cache().resolve_role(request) == SUPERUSER_ROLE
+
+
+async def can_read_user(request: Request) -> bool:
+    """Cache auth check for reading a user: the user itself or a superuser."""
+    redis_cache = Cache()
+    role = await redis_cache.resolve_role(request)
+    if not role:
+        return False
+    if role == SUPERUSER_ROLE:
+        return True
+    principal = await redis_cache.resolve_principal(request)
+    return principal == str(request.path_params.get("user_id"))
+
+
 async def get_current_user(
     authorization: str = Depends(HTTPBearer()),
     db: Session | AsyncSession = Depends(get_db_async)
@@ -101,6 +101,22 @@ class Settings(BaseSettings):
             path=f"/{values.get('POSTGRES_DB') or ''}",
         )
 
+    # read replicas of the primary, e.g. ["postgresql+asyncpg://u:p@replica:5432/db"]
+    SQLALCHEMY_REPLICA_ASYNC_URIS: List[AsyncPostgresDsn] = []
+    # round_robin or least_connections
+    DB_REPLICA_SELECTION: str = "round_robin"
+    # seconds a caller that wrote reads from the primary
+    DB_READ_YOUR_WRITES_WINDOW: float = 5.0
+    DB_REPLICA_HEALTH_CHECK_INTERVAL: float = 10.0
+    # seconds of replication lag beyond which a replica is not read
+    DB_REPLICA_MAX_LAG: Optional[float] = None
+
+    @validator("SQLALCHEMY_REPLICA_ASYNC_URIS", pre=True)
+    def assemble_replica_uris(cls, v: Union[str, List[str]]) -> List[str]:
+        if isinstance(v, str) and not v.startswith("["):
+            return [i.strip() for i in v.split(",") if i.strip()]
+        return v
+
     class Config:
         env_file = ".env"
 
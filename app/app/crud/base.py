@@ -1,20 +1,38 @@
 from asyncio import iscoroutine
 from datetime import datetime
-from typing import Awaitable, Any, Generic, Type, TypeVar
+from typing import Awaitable, Any, Generic, Iterator, Mapping, Sequence, Type, TypeVar
 
-from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
+from sqlalchemy import delete, inspect, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from sqlalchemy.sql.dml import UpdateBase
 
+from app.crud.bulk import (
+    BULK_CHUNK_SIZE,
+    get_chunks,
+    get_insert_statement,
+    get_update_statement,
+    get_upsert_statement,
+)
+from app.crud.pagination import Keyset, Page, Position
 from app.db.base_class import Base
+from app.db.routing import USE_PRIMARY
 
 
 ModelType = TypeVar("ModelType", bound=Base)
 CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
 UpdateSchemaType = TypeVar("UpdateSchemaType", bound=BaseModel)
 
+# SQLSTATE of a unique constraint violation
+UNIQUE_VIOLATION = "23505"
+
+
+class AlreadyExists(ValueError):
+    """A row holding the same unique values as the written one exists."""
+
 
 class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
     def __init__(self, model: Type[ModelType]):
@@ -28,22 +46,6 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         """
         self.model = model
 
-    async def _commit_refresh_async(
-        self, db: AsyncSession, db_obj: ModelType
-    ) -> ModelType:
-        await db.commit()
-        await db.refresh(db_obj)
-        return db_obj
-
-    def _commit_refresh(
-        self, db: Session | AsyncSession, db_obj: ModelType
-    ) -> ModelType | Awaitable[ModelType]:
-        if isinstance(db, AsyncSession):
-            return self._commit_refresh_async(db, db_obj=db_obj)
-        db.commit()
-        db.refresh(db_obj)
-        return db_obj
-
     async def _first_async(self, scalars) -> ModelType | None:
         results = await scalars
         return results.first()
@@ -72,9 +74,12 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         return scalars.all()
 
     def get(
-        self, db: Session | AsyncSession, id: Any
+        self, db: Session | AsyncSession, id: Any, *, primary: bool = False
     ) -> ModelType | Awaitable[ModelType] | None:
+        """The row `id`, read from the primary even by replica sessions if `primary`."""
         query = select(self.model).filter(self.model.id == id)
+        if primary:
+            query = query.execution_options(**{USE_PRIMARY: True})
         return self._first(db.scalars(query))
 
     def get_multi(
@@ -94,13 +99,233 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
             return self._all(db.scalars(query))
         return self._all(db.scalars(query.limit(limit)))
 
+    async def _page_async(
+        self, scalars, keyset: Keyset, position: Position | None, limit: int
+    ) -> Page[ModelType]:
+        results = await scalars
+        return keyset.page(results.all(), position, limit)
+
+    def get_page(
+        self,
+        db: Session | AsyncSession,
+        *,
+        cursor: str | None = None,
+        limit: int = 100,
+        order_by: Sequence[str] = ("-id",)
+    ) -> Page[ModelType] | Awaitable[Page[ModelType]]:
+        """
+        Page of `limit` rows in the order of `order_by`, after the row `cursor`
+        points at, or before it for the `prev_cursor` of a page.
+
+        Unlike `get_multi`, deep pages cost as much as the first one. Raises
+        `InvalidCursor` for a cursor that was not issued for `order_by`.
+        """
+        keyset = Keyset(self.model, order_by)
+        position = keyset.decode(cursor) if cursor else None
+        query = keyset.apply(select(self.model), position, limit)
+        scalars = db.scalars(query)
+        if iscoroutine(scalars):
+            return self._page_async(scalars, keyset, position, limit)
+        return keyset.page(scalars.all(), position, limit)
+
+    def get_create_data(self, obj_in: CreateSchemaType | dict[str, Any]) -> dict:
+        """Column values of the row inserted for `obj_in`."""
+        if isinstance(obj_in, dict):
+            return dict(obj_in)
+        return obj_in.dict()
+
+    def get_update_data(self, obj_in: UpdateSchemaType | dict[str, Any]) -> dict:
+        """Column values changed by `obj_in`."""
+        if isinstance(obj_in, dict):
+            return dict(obj_in)
+        return obj_in.dict(exclude_unset=True)
+
+    def get_pending_data(self, db_obj: ModelType) -> dict:
+        """Column values changed on `db_obj` and not written yet."""
+        state = inspect(db_obj)
+        return {
+            attr.key: state.attrs[attr.key].value
+            for attr in state.mapper.column_attrs
+            if state.attrs[attr.key].history.has_changes()
+        }
+
+    def _detach(self, db: Session, db_objs: list[Any]) -> None:
+        if db.expire_on_commit:
+            for db_obj in db_objs:
+                if db_obj is not None:
+                    db.expunge(db_obj)
+
+    async def _write_many_async(
+        self,
+        db: AsyncSession,
+        statements: Iterator[tuple[list[int], UpdateBase]],
+        count: int,
+    ) -> list[ModelType]:
+        db_objs: list[Any] = [None] * count
+        try:
+            for positions, statement in statements:
+                results = await db.scalars(self._returning_objects(statement))
+                for position, db_obj in zip(positions, results.all()):
+                    db_objs[position] = db_obj
+            self._detach(db.sync_session, db_objs)
+            await db.commit()
+        except IntegrityError as e:
+            await db.rollback()
+            raise_for_integrity_error(e)
+        return db_objs
+
+    def _write_many(
+        self,
+        db: Session | AsyncSession,
+        statements: Iterator[tuple[list[int], UpdateBase]],
+        count: int,
+    ) -> list[ModelType] | Awaitable[list[ModelType]]:
+        """
+        Execute the `statements` in one transaction, and the `count` objects of
+        the rows they return, at the positions given with each statement.
+
+        The objects are loaded from RETURNING, and are detached from a session
+        that expires its objects on commit, which would load them again one by
+        one. Raises `AlreadyExists` if a row violates a unique constraint,
+        having rolled back the transaction.
+        """
+        if isinstance(db, AsyncSession):
+            return self._write_many_async(db, statements, count)
+        db_objs: list[Any] = [None] * count
+        try:
+            for positions, statement in statements:
+                results = db.scalars(self._returning_objects(statement))
+                for position, db_obj in zip(positions, results.all()):
+                    db_objs[position] = db_obj
+            self._detach(db, db_objs)
+            db.commit()
+        except IntegrityError as e:
+            db.rollback()
+            raise_for_integrity_error(e)
+        return db_objs
+
+    async def _write_one_async(self, db_objs) -> ModelType | None:
+        return (await db_objs)[0]
+
+    def _write_one(
+        self, db: Session | AsyncSession, statement: UpdateBase
+    ) -> ModelType | None | Awaitable[ModelType | None]:
+        """The object of the row returned by `statement`, executed and committed."""
+        db_objs = self._write_many(db, iter([([0], statement)]), 1)
+        if iscoroutine(db_objs):
+            return self._write_one_async(db_objs)
+        return db_objs[0]
+
+    def _returning_objects(self, statement: UpdateBase):
+        return (
+            select(self.model)
+            .from_statement(statement)
+            .execution_options(populate_existing=True)
+        )
+
+    def create_many(
+        self,
+        db: Session | AsyncSession,
+        *,
+        objs_in: Sequence[CreateSchemaType | dict[str, Any]],
+        chunk_size: int = BULK_CHUNK_SIZE
+    ) -> list[ModelType] | Awaitable[list[ModelType]]:
+        """
+        Insert a row for each of `objs_in`, with one multi-row INSERT for every
+        `chunk_size` of them, and return the rows in the order of `objs_in`.
+        """
+        rows = [self.get_create_data(obj_in) for obj_in in objs_in]
+        table = self.model.__table__
+        statements = (
+            (positions, get_insert_statement(table, chunk))
+            for positions, chunk in get_chunks(rows, chunk_size)
+        )
+        return self._write_many(db, statements, len(rows))
+
+    def upsert_many(
+        self,
+        db: Session | AsyncSession,
+        *,
+        objs_in: Sequence[CreateSchemaType | dict[str, Any]],
+        conflict_keys: Sequence[Any] = ("id",),
+        update_fields: Sequence[str] | None = None,
+        chunk_size: int = BULK_CHUNK_SIZE
+    ) -> list[ModelType] | Awaitable[list[ModelType]]:
+        """
+        Insert a row for each of `objs_in`, or update the row already holding
+        its `conflict_keys` (column names or attributes such as `User.email`,
+        which must be covered by a unique index), with one
+        INSERT ... ON CONFLICT DO UPDATE for every `chunk_size` of them.
+
+        `update_fields` are the columns updated on a conflict, by default the
+        other columns given. Of several `objs_in` with the same conflict keys,
+        the last one is written. Returns one row for each distinct conflict key,
+        in the order of `objs_in`.
+        """
+        keys = [getattr(key, "key", key) for key in conflict_keys]
+        rows_by_key: dict[tuple, dict] = {}
+        for obj_in in objs_in:
+            row = self.get_create_data(obj_in)
+            key = tuple(row[name] for name in keys)
+            # a statement can not update the same row twice.
+            rows_by_key.pop(key, None)
+            rows_by_key[key] = row
+        rows = list(rows_by_key.values())
+        table = self.model.__table__
+        statements = (
+            (positions, get_upsert_statement(table, chunk, keys, update_fields))
+            for positions, chunk in get_chunks(rows, chunk_size)
+        )
+        return self._write_many(db, statements, len(rows))
+
+    def update_many(
+        self,
+        db: Session | AsyncSession,
+        *,
+        objs_in: Mapping[Any, UpdateSchemaType | dict[str, Any]],
+        chunk_size: int = BULK_CHUNK_SIZE
+    ) -> list[ModelType] | Awaitable[list[ModelType]]:
+        """
+        Update the row of each id of `objs_in` with its values, with one UPDATE
+        for every `chunk_size` of them, and return the rows in the order of
+        `objs_in`. Rows that do not exist are left out.
+        """
+        rows = [
+            {**self.get_update_data(obj_in), "id": id} for id, obj_in in objs_in.items()
+        ]
+        table = self.model.__table__
+        # the rows of an UPDATE ... FROM are returned in no particular order.
+        statements = (
+            (positions, get_update_statement(table, chunk))
+            for positions, chunk in get_chunks(rows, chunk_size)
+        )
+        db_objs = self._write_many(db, statements, len(rows))
+        if iscoroutine(db_objs):
+            return self._order_by_ids_async(db_objs, list(objs_in))
+        return self._order_by_ids(db_objs, list(objs_in))
+
+    async def _order_by_ids_async(self, db_objs, ids: list[Any]) -> list[ModelType]:
+        return self._order_by_ids(await db_objs, ids)
+
+    def _order_by_ids(self, db_objs: list[Any], ids: list[Any]) -> list[ModelType]:
+        by_id = {db_obj.id: db_obj for db_obj in db_objs if db_obj is not None}
+        return [by_id[id] for id in ids if id in by_id]
+
     def create(
-        self, db: Session | AsyncSession, *, obj_in: CreateSchemaType
+        self,
+        db: Session | AsyncSession,
+        *,
+        obj_in: CreateSchemaType | dict[str, Any]
     ) -> ModelType | Awaitable[ModelType]:
-        obj_in_data = jsonable_encoder(obj_in)
-        db_obj = self.model(**obj_in_data)  # type: ignore
-        db.add(db_obj)
-        return self._commit_refresh(db=db, db_obj=db_obj)
+        """
+        Insert a row for `obj_in` and return it, loaded by the same statement.
+
+        Raises `AlreadyExists` if the row violates a unique constraint.
+        """
+        statement = get_insert_statement(
+            self.model.__table__, [self.get_create_data(obj_in)]
+        )
+        return self._write_one(db, statement)
 
     def update(
         self,
@@ -109,39 +334,68 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         db_obj: ModelType,
         obj_in: UpdateSchemaType | dict[str, Any] | None = None
     ) -> ModelType | Awaitable[ModelType]:
+        """Update the row of `db_obj` with the values of `obj_in` and return it.
+
+        Changes made to `db_obj` and not written yet are written as well.
+        """
+        values = self.get_pending_data(db_obj)
         if obj_in is not None:
-            obj_data = jsonable_encoder(db_obj)
-            if isinstance(obj_in, dict):
-                update_data = obj_in
-            else:
-                update_data = obj_in.dict(exclude_unset=True)
-            for field in obj_data:
-                if field in update_data:
-                    setattr(db_obj, field, update_data[field])
-        if hasattr(self.model, "modified"):
-            setattr(db_obj, "modified", datetime.now())
-        db.add(db_obj)
-        return self._commit_refresh(db=db, db_obj=db_obj)
+            values.update(self.get_update_data(obj_in))
+        return self.update_by_id(db, id=db_obj.id, obj_in=values)
 
-    async def _remove_async(self, db: AsyncSession, *, id: int) -> ModelType:
-        db_obj = await self.get(db=db, id=id)
-        db_obj.is_deleted = True
+    def update_by_id(
+        self,
+        db: Session | AsyncSession,
+        *,
+        id: Any,
+        obj_in: UpdateSchemaType | dict[str, Any] | None = None
+    ) -> ModelType | None | Awaitable[ModelType | None]:
+        """
+        Update the row `id` with the values of `obj_in` and return it, loaded
+        by the same statement, or None if there is no such row.
 
+        Raises `AlreadyExists` if the row violates a unique constraint.
+        """
+        table = self.model.__table__
+        values = self.get_update_data(obj_in) if obj_in is not None else {}
+        values = {name: value for name, value in values.items() if name in table.c}
         if hasattr(self.model, "modified"):
-            setattr(db_obj, "modified", datetime.now())
+            values["modified"] = datetime.now()
+        statement = (
+            update(table)
+            .where(table.c.id == id)
+            .values(values)
+            .returning(*table.columns)
+        )
+        return self._write_one(db, statement)
 
-        return await self._commit_refresh_async(db, db_obj=db_obj)
+    def get_remove_statement(self, id: Any) -> UpdateBase:
+        """
+        Statement removing the row `id` and returning it: a soft delete setting
+        `is_deleted` for models that have the column, a DELETE otherwise.
+        """
+        table = self.model.__table__
+        if "is_deleted" not in table.c:
+            return delete(table).where(table.c.id == id).returning(*table.columns)
+        values: dict[str, Any] = {"is_deleted": True}
+        if hasattr(self.model, "modified"):
+            values["modified"] = datetime.now()
+        return (
+            update(table)
+            .where(table.c.id == id)
+            .values(values)
+            .returning(*table.columns)
+        )
 
     def remove(
         self, db: Session | AsyncSession, *, id: int
-    ) -> ModelType | Awaitable[ModelType]:
-        if isinstance(db, AsyncSession):
-            return self._remove_async(db=db, id=id)
+    ) -> ModelType | None | Awaitable[ModelType | None]:
+        """Remove the row `id` and return it, or None if there is no such row."""
+        return self._write_one(db, self.get_remove_statement(id))
 
-        db_obj = db.query(self.model).get(id)
-        db_obj.is_deleted = True
-
-        if hasattr(self.model, "modified"):
-            setattr(db_obj, "modified", datetime.now())
 
-        return self._commit_refresh(db, db_obj=db_obj)
+def raise_for_integrity_error(e: IntegrityError) -> None:
+    """Raise `AlreadyExists` for a unique violation, and `e` otherwise."""
+    if getattr(e.orig, "pgcode", None) == UNIQUE_VIOLATION:
+        raise AlreadyExists(str(e.orig)) from e
+    raise e
@@ -0,0 +1,101 @@
+from typing import Any, Iterator, Sequence
+
+from sqlalchemy import Table, cast, literal, union_all, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.future import select
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.dml import Insert, Update
+
+# rows written by one statement, unless their columns exceed the bind limit
+BULK_CHUNK_SIZE = 1000
+# bind parameters of one statement allowed by the Postgres protocol
+MAX_BIND_PARAMETERS = 32767
+
+Row = dict[str, Any]
+
+
+def get_chunks(
+    rows: Sequence[Row], chunk_size: int
+) -> Iterator[tuple[list[int], list[Row]]]:
+    """
+    Chunks of at most `chunk_size` of the `rows` that set the same columns, and
+    the positions of their rows in `rows`.
+
+    Rows setting other columns go to other statements, as the rows of a
+    multi-row statement must set the same columns. A chunk also holds no more
+    rows than the bind parameters of one statement allow.
+    """
+    groups: dict[tuple[str, ...], list[int]] = {}
+    for position, row in enumerate(rows):
+        groups.setdefault(tuple(row), []).append(position)
+    for columns, positions in groups.items():
+        size = max(1, min(chunk_size, MAX_BIND_PARAMETERS // max(len(columns), 1)))
+        for start in range(0, len(positions), size):
+            chunk = positions[start : start + size]
+            yield chunk, [rows[position] for position in chunk]
+
+
+def get_insert_statement(table: Table, rows: list[Row]) -> Insert:
+    """One INSERT of every row in `rows`, returning the inserted rows."""
+    return insert(table).values(rows).returning(*table.columns)
+
+
+def get_upsert_statement(
+    table: Table,
+    rows: list[Row],
+    conflict_keys: Sequence[str],
+    update_fields: Sequence[str] | None = None,
+) -> Insert:
+    """
+    One INSERT of every row in `rows` that updates the row already holding its
+    `conflict_keys` instead, returning the inserted or updated rows.
+
+    `update_fields` are the columns updated on a conflict, by default every
+    column of the rows besides the conflict keys, `id` and `created`.
+    """
+    statement = insert(table).values(rows)
+    if update_fields is None:
+        excluded = {*conflict_keys, "id", "created"}
+        update_fields = [name for name in rows[0] if name not in excluded]
+    values = {name: statement.excluded[name] for name in update_fields}
+    modified = table.columns.get("modified")
+    if modified is not None and "modified" not in values and values:
+        # `onupdate` defaults are not applied to the update of a conflict.
+        values["modified"] = modified.onupdate.arg(None)
+    if not values:
+        # a no-op update, so that the existing rows are returned as well.
+        values = {conflict_keys[0]: statement.excluded[conflict_keys[0]]}
+    return statement.on_conflict_do_update(
+        index_elements=list(conflict_keys), set_=values
+    ).returning(*table.columns)
+
+
+def get_update_statement(table: Table, rows: list[Row]) -> Update:
+    """
+    One UPDATE of the rows of `table` whose `id` is the `id` of one of `rows`,
+    to the values of its columns, returning the updated rows.
+
+    The new values are joined from a derived table, with each value cast to the
+    type of its column.
+    """
+    selects: list[Select] = [
+        select(
+            *[
+                cast(literal(value, table.c[name].type), table.c[name].type).label(name)
+                for name, value in row.items()
+            ]
+        )
+        for row in rows
+    ]
+    source = (union_all(*selects) if len(selects) > 1 else selects[0]).subquery(
+        "source"
+    )
+    values = {name: source.c[name] for name in rows[0] if name != "id"}
+    if not values and "modified" not in table.columns:
+        values = {"id": source.c.id}
+    return (
+        update(table)
+        .where(table.c.id == source.c.id)
+        .values(values)
+        .returning(*table.columns)
+    )
@@ -0,0 +1,160 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from dataclasses import dataclass, field
+from typing import Any, Generic, Sequence, Type, TypeVar
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import ValidationError, parse_obj_as
+from sqlalchemy import and_, or_, tuple_
+from sqlalchemy.sql import Select
+
+from app.db.base_class import Base
+
+ModelType = TypeVar("ModelType", bound=Base)
+
+NEXT = "next"
+PREV = "prev"
+
+
+class InvalidCursor(ValueError):
+    """The cursor was not issued for this order, or was tampered with."""
+
+
+@dataclass
+class Page(Generic[ModelType]):
+    """Rows of one page and the cursors of the pages next to it, if any."""
+
+    items: list[ModelType] = field(default_factory=list)
+    next_cursor: str | None = None
+    prev_cursor: str | None = None
+
+
+@dataclass
+class Position:
+    """Sort key of the row a cursor points at, and the side it pages to."""
+
+    values: list[Any]
+    direction: str
+
+
+class Keyset:
+    """
+    Keyset pagination of a model in the order of `order_by`.
+
+    `order_by` names the sort columns, `-` marking descending ones, e.g.
+    `("-created", "email")`. The primary key `id` is added as the last column
+    when missing, so every row has a distinct sort key. NULLs sort after every
+    value, in the order of a Postgres index on the column.
+
+    A page is selected with a range predicate on the sort key of the row the
+    cursor points at, which an index on the sort columns serves, instead of an
+    OFFSET that walks and discards every row before the page.
+    """
+
+    def __init__(self, model: Type[ModelType], order_by: Sequence[str]):
+        names = [name.lstrip("-") for name in order_by]
+        descending = [name.startswith("-") for name in order_by]
+        if "id" not in names:
+            names.append("id")
+            descending.append(descending[-1] if descending else True)
+        unknown = [name for name in names if name not in model.__table__.columns]
+        if unknown:
+            raise ValueError(f"Cannot sort {model.__name__} by {', '.join(unknown)}")
+        self.order = [f"-{n}" if d else n for n, d in zip(names, descending)]
+        self.names = names
+        self.columns = [getattr(model, name) for name in names]
+        self.nullable = [model.__table__.columns[name].nullable for name in names]
+        self.descending = descending
+
+    def encode(self, row: ModelType, direction: str) -> str:
+        """Opaque cursor of the page next to `row` on the side of `direction`."""
+        values = [getattr(row, name) for name in self.names]
+        payload = {"o": self.order, "k": jsonable_encoder(values), "d": direction}
+        data = json.dumps(payload, separators=(",", ":")).encode()
+        return urlsafe_b64encode(data).rstrip(b"=").decode()
+
+    def decode(self, cursor: str) -> Position:
+        try:
+            data = urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            payload = json.loads(data)
+            if payload["o"] != self.order or payload["d"] not in (NEXT, PREV):
+                raise InvalidCursor("Cursor does not match the order of the list")
+            values = [
+                None
+                if value is None and nullable
+                else parse_obj_as(column.type.python_type, value)
+                for column, nullable, value in zip(
+                    self.columns, self.nullable, payload["k"], strict=True
+                )
+            ]
+        except InvalidCursor:
+            raise
+        except (ValueError, KeyError, TypeError, ValidationError) as e:
+            raise InvalidCursor("Invalid cursor") from e
+        return Position(values, payload["d"])
+
+    def apply(self, query: Select, position: Position | None, limit: int) -> Select:
+        """`query` limited to the `limit` rows after `position` and one more.
+
+        Pages before `position` are selected in reverse order.
+        """
+        forward = position is None or position.direction == NEXT
+        if position is not None:
+            query = query.where(self.after(position.values, forward))
+        order = []
+        for column, nullable, descending in zip(
+            self.columns, self.nullable, self.descending
+        ):
+            if descending == forward:
+                order.append(column.desc().nulls_first() if nullable else column.desc())
+            else:
+                order.append(column.asc().nulls_last() if nullable else column.asc())
+        return query.order_by(*order).limit(limit + 1)
+
+    def after(self, values: list[Any], forward: bool) -> Any:
+        """Predicate of the rows past `values` in the order, before if not `forward`."""
+        greater = [descending != forward for descending in self.descending]
+        if not any(self.nullable) and (all(greater) or not any(greater)):
+            # a row value comparison, served by a composite index.
+            left, right = tuple_(*self.columns), tuple_(*values)
+            return left > right if greater[0] else left < right
+        clauses = []
+        for index, (column, value) in enumerate(zip(self.columns, values)):
+            equal = [
+                c.is_(None) if v is None else c == v
+                for c, v in zip(self.columns[:index], values[:index])
+            ]
+            if value is None:
+                if greater[index]:
+                    # nothing sorts after NULL.
+                    continue
+                bound = column.is_not(None)
+            elif greater[index]:
+                bound = column > value
+                if self.nullable[index]:
+                    bound = or_(bound, column.is_(None))
+            else:
+                bound = column < value
+            clauses.append(and_(*equal, bound))
+        return or_(*clauses)
+
+    def page(
+        self, rows: list[ModelType], position: Position | None, limit: int
+    ) -> Page[ModelType]:
+        """The page of the `rows` selected by `apply`, with its cursors."""
+        has_more = len(rows) > limit
+        items = list(rows[:limit])
+        if position is None or position.direction == NEXT:
+            return Page(
+                items,
+                next_cursor=self.encode(items[-1], NEXT) if has_more else None,
+                prev_cursor=(
+                    self.encode(items[0], PREV) if position and items else None
+                ),
+            )
+        items.reverse()
+        return Page(
+            items,
+            next_cursor=self.encode(items[-1], NEXT) if items else None,
+            prev_cursor=self.encode(items[0], PREV) if has_more else None,
+        )
@@ -0,0 +1,20 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+# set while a value is computed shortly after an invalidation, its database reads
+# must not be served by a lagging replica
+fresh_reads: ContextVar[bool] = ContextVar("fresh_reads", default=False)
+
+
+@contextmanager
+def read_fresh(enabled: bool = True) -> Iterator[None]:
+    """Set `fresh_reads` within the block, if `enabled`."""
+    if not enabled:
+        yield
+        return
+    token = fresh_reads.set(True)
+    try:
+        yield
+    finally:
+        fresh_reads.reset(token)
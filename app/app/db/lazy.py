@@ -0,0 +1,101 @@
+from typing import Any
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, SessionTransaction
+from sqlalchemy.util import greenlet_spawn
+
+from app.db.routing import WROTE, RoutingSession
+
+# session info keys: a transaction begun with `begin()` is in progress, and the
+# settings applied to every transaction
+EXPLICIT = "explicit"
+SETTINGS = "settings"
+
+
+class LazySession(RoutingSession):
+    """
+    Session giving its connections back to the pool between read-only
+    transactions, see `release`.
+
+    Like any session, it only checks out a connection when it first runs a
+    statement, so requests that never query (cache hits, validation and
+    permission errors) never take one.
+    """
+
+    def begin(self, *args, **kwargs):
+        if self._transaction is None:
+            self.info[EXPLICIT] = True
+        return super().begin(*args, **kwargs)
+
+    def can_release(self) -> bool:
+        """Whether the transaction in progress only read, and may be ended now.
+
+        Transactions that wrote, hold pending changes or were begun with
+        `begin()` are left to the caller to end.
+        """
+        return (
+            self.in_transaction()
+            and not self.info.get(WROTE)
+            and not self.info.get(EXPLICIT)
+            and not (self.new or self.dirty or self.deleted)
+        )
+
+    def release(self) -> None:
+        """End a read-only transaction, returning its connections to the pool.
+
+        The loaded objects stay as they are, the sessions of the app do not
+        expire them on commit. The next statement begins a new transaction.
+        """
+        if self.can_release():
+            self.commit()
+
+
+@event.listens_for(LazySession, "after_transaction_end")
+def end_explicit(session: LazySession, transaction: SessionTransaction) -> None:
+    if transaction.parent is None:
+        session.info.pop(EXPLICIT, None)
+
+
+@event.listens_for(LazySession, "after_begin")
+def apply_settings(
+    session: LazySession, transaction: SessionTransaction, connection: Connection
+) -> None:
+    for name, value in session.info.get(SETTINGS, {}).items():
+        connection.execute(
+            text("SELECT set_config(:name, :value, true)"),
+            {"name": name, "value": value},
+        )
+
+
+class LazyAsyncSession(AsyncSession):
+    """
+    Async session of a `LazySession`, which returns its connection to the pool
+    as soon as a read-only transaction has run its statement, instead of
+    holding it until the session is closed after the response is sent.
+
+    Results are buffered before the connection is returned. Results of
+    `stream` are not, and keep their connection.
+    """
+
+    async def execute(self, *args, **kwargs) -> Any:
+        result = await super().execute(*args, **kwargs)
+        if not self.sync_session.can_release():
+            return result
+        frozen = result.freeze()
+        await greenlet_spawn(self.sync_session.release)
+        return frozen()
+
+    async def get(self, *args, **kwargs) -> Any:
+        instance = await super().get(*args, **kwargs)
+        await greenlet_spawn(self.sync_session.release)
+        return instance
+
+
+def set_transaction_setting(db: Session | AsyncSession, name: str, value: str) -> None:
+    """Set the Postgres setting `name` to `value` in every transaction of `db`.
+
+    Applied when a transaction begins, so no connection is taken for it now.
+    """
+    db.info.setdefault(SETTINGS, {})[name] = value
@@ -0,0 +1,237 @@
+import asyncio
+import logging
+from itertools import count
+from time import monotonic
+from typing import Any, Callable, Sequence
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+
+from app.db.context import fresh_reads
+
+logger = logging.getLogger(__name__)
+
+ROUND_ROBIN = "round_robin"
+LEAST_CONNECTIONS = "least_connections"
+REPLICA_SELECTIONS = (ROUND_ROBIN, LEAST_CONNECTIONS)
+# execution option of a query, and session info key, sending reads to the primary
+USE_PRIMARY = "use_primary"
+# session info keys: who the session reads for, and whether it wrote
+SCOPE = "scope"
+WROTE = "wrote"
+# scopes whose last write is remembered, beyond which expired ones are dropped
+MAX_WRITE_SCOPES = 10_000
+
+REPLICATION_LAG_SQL = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+"""
+
+
+class Replica:
+    """A read replica and the state of its last health check."""
+
+    def __init__(self, engine: AsyncEngine | Engine):
+        self.engine = engine
+        # what sessions bind to, the sync engine behind an async one.
+        self.bind: Engine = getattr(engine, "sync_engine", engine)
+        self.healthy = True
+        self.lag: float | None = None
+
+    @property
+    def connections(self) -> int:
+        """Connections of the replica's pool in use."""
+        return self.bind.pool.checkedout()
+
+
+class ReplicaPool:
+    """
+    Read replicas of the primary, chosen for each read of a `RoutingSession`.
+
+    Replicas are picked in turn (`round_robin`) or by the fewest connections in
+    use (`least_connections`), skipping those whose last health check failed or
+    found them lagging more than `max_lag` seconds behind. Without a healthy
+    replica, reads go to the primary.
+
+    A scope (the caller a session reads for) that wrote reads from the primary
+    for `read_your_writes_window` seconds, long enough for the replicas to
+    catch up. Writes are remembered by each process on its own.
+
+    Health checks run on the replicas given as async engines.
+    """
+
+    def __init__(
+        self,
+        engines: Sequence[AsyncEngine | Engine],
+        selection: str = ROUND_ROBIN,
+        read_your_writes_window: float = 5.0,
+        health_check_interval: float = 10.0,
+        health_check_timeout: float = 2.0,
+        max_lag: float | None = None,
+    ):
+        if selection not in REPLICA_SELECTIONS:
+            raise ValueError(f"Unknown replica selection {selection}")
+        self.replicas = [Replica(engine) for engine in engines]
+        self.selection = selection
+        self.read_your_writes_window = read_your_writes_window
+        self.health_check_interval = health_check_interval
+        self.health_check_timeout = health_check_timeout
+        self.max_lag = max_lag
+        self._turn = count()
+        self._writes: dict[str, float] = {}
+        self._task: asyncio.Task | None = None
+
+    def choose(self) -> Replica | None:
+        """The replica to send a read to, or None to send it to the primary."""
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        if self.selection == LEAST_CONNECTIONS:
+            return min(healthy, key=lambda replica: replica.connections)
+        return healthy[next(self._turn) % len(healthy)]
+
+    def mark_written(self, scope: str | None) -> None:
+        if not scope or not self.read_your_writes_window:
+            return
+        now = monotonic()
+        if len(self._writes) >= MAX_WRITE_SCOPES:
+            self._writes = {
+                key: until for key, until in self._writes.items() if until > now
+            }
+        self._writes[scope] = now + self.read_your_writes_window
+
+    def wrote_recently(self, scope: str | None) -> bool:
+        """Whether `scope` wrote within the read-your-writes window."""
+        return bool(scope) and self._writes.get(scope, 0) > monotonic()
+
+    def start(self) -> None:
+        if self.replicas and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._check_periodically())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _check_periodically(self) -> None:
+        while True:
+            await self.check()
+            await asyncio.sleep(self.health_check_interval)
+
+    async def check(self) -> None:
+        """Check every replica, in parallel."""
+        await asyncio.gather(
+            *(
+                self.check_replica(replica)
+                for replica in self.replicas
+                if isinstance(replica.engine, AsyncEngine)
+            )
+        )
+
+    async def check_replica(self, replica: Replica) -> None:
+        try:
+            replica.lag = await asyncio.wait_for(
+                self.get_lag(replica), self.health_check_timeout
+            )
+        except (OSError, asyncio.TimeoutError, DBAPIError) as e:
+            if replica.healthy:
+                logger.warning(f"Read replica {replica.engine.url!r} is down: {e}")
+            replica.healthy, replica.lag = False, None
+            return
+        healthy = self.max_lag is None or replica.lag <= self.max_lag
+        if healthy != replica.healthy:
+            state = "is back" if healthy else f"lags by {replica.lag:.1f}s"
+            logger.warning(f"Read replica {replica.engine.url!r} {state}")
+        replica.healthy = healthy
+
+    async def get_lag(self, replica: Replica) -> float:
+        """Seconds of changes the replica has received but not replayed yet."""
+        async with replica.engine.connect() as connection:
+            result = await connection.execute(text(REPLICATION_LAG_SQL))
+            return float(result.scalar())
+
+
+class RoutingSession(Session):
+    """
+    Session sending its reads to a replica of `replicas`, chosen at its first
+    read, and everything else to its bind, the primary.
+
+    Writes, flushes, `SELECT ... FOR UPDATE` and statements other than SELECTs
+    go to the primary, and so does every statement after them, so that the
+    session reads what it wrote. Reads go to the primary as well once the
+    session is pinned with `use_primary`, for queries with the `use_primary`
+    execution option, while the scope of the session is in its read-your-writes
+    window, and for values the cache computes shortly after an invalidation
+    (`app.db.context.fresh_reads`).
+    """
+
+    def __init__(self, *args, replicas: ReplicaPool | None = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.replicas = replicas
+        self.replica: Replica | None = None
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        bind = super().get_bind(mapper, clause=clause, **kwargs)
+        if self._flushing or not is_read(clause):
+            self.info[USE_PRIMARY] = self.info[WROTE] = True
+            return bind
+        if not self.replicas or not self.replicas.replicas:
+            return bind
+        if (
+            self.info.get(USE_PRIMARY)
+            or clause.get_execution_options().get(USE_PRIMARY)
+            or fresh_reads.get()
+            or self.replicas.wrote_recently(self.get_scope())
+        ):
+            return bind
+        if self.replica is None:
+            # one replica, and one connection, for every read of the session.
+            self.replica = self.replicas.choose()
+        return bind if self.replica is None else self.replica.bind
+
+    def get_scope(self) -> str | None:
+        scope = self.info.get(SCOPE)
+        if callable(scope):
+            scope = self.info[SCOPE] = scope()
+        return scope
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def remember_write(session: RoutingSession) -> None:
+    if session.info.pop(WROTE, False) and session.replicas:
+        session.replicas.mark_written(session.get_scope())
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def forget_write(session: RoutingSession) -> None:
+    session.info.pop(WROTE, None)
+
+
+def is_read(clause: Any) -> bool:
+    """Whether `clause` only reads, and may be sent to a replica."""
+    # the SELECT of an ORM `from_statement` wraps the statement it runs.
+    clause = getattr(clause, "element", clause)
+    return isinstance(clause, Select) and clause._for_update_arg is None
+
+
+def use_primary(db: Session | AsyncSession) -> None:
+    """Send the remaining reads of `db` to the primary."""
+    db.info[USE_PRIMARY] = True
+
+
+def set_scope(
+    db: Session | AsyncSession, scope: str | None | Callable[[], str | None]
+) -> None:
+    """Make `db` read for `scope`, whose writes it must see.
+
+    A callable scope is resolved when the session first needs it.
+    """
+    db.info[SCOPE] = scope
@@ -1,8 +1,10 @@
 from sqlalchemy import create_engine
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 from app.core.config import settings
+from app.db.lazy import LazyAsyncSession, LazySession
+from app.db.routing import ReplicaPool
 
 
 engine = create_engine(settings.SQLALCHEMY_DATABASE_URI, pool_pre_ping=True)
@@ -10,9 +12,21 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 engine_async = create_async_engine(
     settings.SQLALCHEMY_DATABASE_ASYNC_URI, pool_pre_ping=True
 )
+replicas = ReplicaPool(
+    [
+        create_async_engine(uri, pool_pre_ping=True)
+        for uri in settings.SQLALCHEMY_REPLICA_ASYNC_URIS
+    ],
+    selection=settings.DB_REPLICA_SELECTION,
+    read_your_writes_window=settings.DB_READ_YOUR_WRITES_WINDOW,
+    health_check_interval=settings.DB_REPLICA_HEALTH_CHECK_INTERVAL,
+    max_lag=settings.DB_REPLICA_MAX_LAG,
+)
 async_session = sessionmaker(
     bind=engine_async,
-    class_=AsyncSession,
+    class_=LazyAsyncSession,
+    sync_session_class=LazySession,
+    replicas=replicas,
     autocommit=False,
     autoflush=False,
     expire_on_commit=False,
@@ -5,8 +5,10 @@ from starlette.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.api import deps
 from app.api.api_v1.api import api_router
 from app.core.config import settings
+from app.db.session import replicas
 from app.models import User
 from app.exceptions import (
     http_exceptions,
@@ -15,6 +17,8 @@ from app.exceptions import (
     validation_exceptions,
 )
 from cache import Cache
+from cache.db_listener import DatabaseListener
+from cache.types import EVICT_LFU, NamespaceQuota, TableInvalidation
 
 
 app = FastAPI(
@@ -39,6 +43,17 @@ app.add_exception_handler(*internal_service_exceptions)
 app.add_exception_handler(*validation_exceptions)
 app.add_exception_handler(*http_exceptions)
 
+# writes made outside the endpoints (scripts, celery tasks, migrations) reach
+# the cache through the notifications of the database triggers.
+db_listener = DatabaseListener(
+    str(settings.SQLALCHEMY_DATABASE_URI),
+    tables={
+        "user": TableInvalidation(
+            row_tags=("user:{pk}",), list_tags=("user:list",), namespace="user"
+        )
+    },
+)
+
 
 @app.on_event("startup")
 async def startup():
@@ -49,4 +64,28 @@ async def startup():
         prefix="api-cache",
         response_header="X-API-Cache",
         ignore_arg_types=[Request, Response, Session, AsyncSession, User],
+        principal_resolver=deps.get_token_principal,
+        role_resolver=deps.get_token_role,
+        # list pages with one-off skip/limit values must not push out the users
+        # that are read again and again.
+        quotas={
+            "user": NamespaceQuota(
+                max_entries=10_000, max_bytes=64 * 1024 * 1024, policy=EVICT_LFU
+            )
+        },
+        # values recomputed after an invalidation must not be read from a replica
+        # that has not replayed the change yet.
+        fresh_reads_window=max(
+            settings.DB_READ_YOUR_WRITES_WINDOW, settings.DB_REPLICA_MAX_LAG or 0
+        )
+        if settings.SQLALCHEMY_REPLICA_ASYNC_URIS
+        else 0,
     )
+    db_listener.start()
+    replicas.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await db_listener.stop()
+    await replicas.stop()
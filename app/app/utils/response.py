@@ -24,12 +24,19 @@ class ApiResponseHeader(GenericModel, Generic[T], ABC):
 
 
 class PaginatedContent(GenericModel, Generic[T]):
-    """Content data type for lists with pagination"""
+    """
+    Content data type for lists with pagination
+
+    Lists paged by cursor return the cursors of the pages next to this one
+    instead of `total_count` and `offset`.
+    """
 
     data: T
     total_count: int = 0
     limit: int = 100
     offset: int = 0
+    next_cursor: str | None = None
+    prev_cursor: str | None = None
 
 
 class APIResponseType(GenericModel, Generic[T]):
@@ -0,0 +1,170 @@
+"""adaptive.py"""
+import math
+from collections import Counter
+from time import monotonic, time
+from typing import Dict, Iterable, List, Mapping, NamedTuple, Optional, Tuple
+
+from cache.types import AdaptiveTTL
+
+# seconds covered by one window of read/write counters in Redis
+TTL_STATS_WINDOW = 600
+# seconds between flushes of the counters of a worker to Redis
+TTL_STATS_FLUSH_INTERVAL = 10.0
+
+
+class FamilyStats(NamedTuple):
+    """Counters of a key family summed over the current and the previous window."""
+
+    reads: int = 0
+    sets: int = 0
+    bytes: int = 0
+    invalidations: int = 0
+    elapsed: float = TTL_STATS_WINDOW
+
+    @property
+    def read_interval(self) -> float:
+        """Estimated seconds between two reads of the same key."""
+        if not self.reads:
+            return math.inf
+        return self.elapsed * max(self.sets, 1) / self.reads
+
+    @property
+    def invalidation_interval(self) -> float:
+        """Estimated seconds an entry stays valid before it is invalidated."""
+        if not self.invalidations:
+            return math.inf
+        return self.elapsed / self.invalidations
+
+    @property
+    def mean_bytes(self) -> Optional[float]:
+        return self.bytes / self.sets if self.sets else None
+
+
+def choose_ttl(stats: FamilyStats, options: AdaptiveTTL) -> int:
+    """TTL of a key family that keeps entries as long as they earn their memory.
+
+    An entry of `mean_bytes` read every `read_interval` seconds serves one hit per
+    `read_interval * mean_bytes` byte-seconds, however long it is kept. Families
+    within `options.byte_seconds_per_hit` get `max_ttl`, and less efficient ones
+    proportionally less, so memory goes to the entries with the most hits per
+    byte. No entry is kept past the interval at which the family is invalidated,
+    and families whose keys are not read again before that get `min_ttl`.
+    """
+    read_interval = stats.read_interval
+    invalidation_interval = stats.invalidation_interval
+    if read_interval >= min(invalidation_interval, options.max_ttl):
+        return options.min_ttl
+    efficiency = 1.0
+    if stats.mean_bytes:
+        efficiency = min(
+            options.byte_seconds_per_hit / (read_interval * stats.mean_bytes), 1.0
+        )
+    ttl = min(options.max_ttl * efficiency, invalidation_interval)
+    return int(min(max(ttl, options.min_ttl), options.max_ttl))
+
+
+class TTLAdvisor:
+    """Chooses the TTL of every key family (endpoint) cached with `AdaptiveTTL`.
+
+    Reads, writes, stored bytes and outdated entries of the families are counted
+    in memory and periodically added to per-window hashes in Redis, so the TTLs
+    are computed from the traffic of every worker. Until the first flush, and for
+    families without traffic, `AdaptiveTTL.initial_ttl` (or `min_ttl`) is used.
+    """
+
+    def __init__(self, flush_interval: float = TTL_STATS_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self.families: Dict[str, Tuple[Optional[str], AdaptiveTTL]] = {}
+        self._pending: Dict[str, Counter] = {}
+        self._ttls: Dict[str, int] = {}
+        self._stats: Dict[str, FamilyStats] = {}
+        self._last_flush = monotonic()
+
+    def ttl(self, family: str, namespace: Optional[str], options: AdaptiveTTL) -> int:
+        """TTL for a new entry of `family`, which is tracked from now on."""
+        if family not in self.families:
+            self.families[family] = (namespace, options)
+            self._pending[family] = Counter()
+        return self.get_ttl(family)
+
+    def get_ttl(self, family: str) -> int:
+        _, options = self.families[family]
+        return self._ttls.get(family, options.initial_ttl or options.min_ttl)
+
+    def tracks(self, family: Optional[str]) -> bool:
+        return family in self.families
+
+    def record(self, family: str, field: str, amount: int = 1) -> None:
+        self._pending[family][field] += amount
+
+    def flush_due(self) -> bool:
+        return monotonic() - self._last_flush >= self.flush_interval
+
+    def take_pending(self) -> Dict[str, Counter]:
+        """Counters recorded since the last flush, which are reset."""
+        self._last_flush = monotonic()
+        pending = {family: counts for family, counts in self._pending.items() if counts}
+        for family in pending:
+            self._pending[family] = Counter()
+        return pending
+
+    def update(
+        self,
+        family: str,
+        windows: Iterable[Mapping[bytes, bytes]],
+        invalidations: int,
+        now: Optional[float] = None,
+    ) -> int:
+        """Recompute the TTL of `family` from its counters read from Redis."""
+        now = time() if now is None else now
+        totals: Counter = Counter()
+        for window in windows:
+            for field, value in window.items():
+                if isinstance(field, bytes):
+                    field = field.decode()
+                totals[field] += int(value)
+        stats = FamilyStats(
+            reads=totals["reads"],
+            sets=totals["sets"],
+            bytes=totals["bytes"],
+            invalidations=invalidations + totals["outdated"],
+            elapsed=TTL_STATS_WINDOW + now % TTL_STATS_WINDOW,
+        )
+        _, options = self.families[family]
+        self._stats[family] = stats
+        if stats.reads or stats.sets:
+            self._ttls[family] = choose_ttl(stats, options)
+        return self.get_ttl(family)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Chosen TTL and the counters it is based on, per family."""
+        snapshot = {}
+        for family, (namespace, options) in self.families.items():
+            stats = self._stats.get(family, FamilyStats())
+            snapshot[family] = {
+                "namespace": namespace,
+                "ttl": self.get_ttl(family),
+                "min_ttl": options.min_ttl,
+                "max_ttl": options.max_ttl,
+                "reads": stats.reads,
+                "sets": stats.sets,
+                "mean_bytes": stats.mean_bytes,
+                "invalidations": stats.invalidations,
+                "read_interval": _finite(stats.read_interval),
+                "invalidation_interval": _finite(stats.invalidation_interval),
+            }
+        return snapshot
+
+
+def get_window(now: Optional[float] = None) -> int:
+    return int((time() if now is None else now) // TTL_STATS_WINDOW)
+
+
+def get_windows(now: Optional[float] = None) -> List[int]:
+    """The current and the previous window."""
+    window = get_window(now)
+    return [window, window - 1]
+
+
+def _finite(value: float) -> Optional[float]:
+    return None if math.isinf(value) else round(value, 3)
@@ -0,0 +1,119 @@
+"""batching.py"""
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_BATCH_WINDOW = 0.0
+DEFAULT_MAX_BATCH_SIZE = 512
+
+Command = Tuple[str, Tuple, Dict]
+
+
+class AutoPipeline:
+    """Sends the commands of concurrent callers to Redis as one pipeline.
+
+    Commands queued by coroutines of the same event loop within `window` seconds
+    (0 means the current loop iteration) are flushed together, and every caller
+    gets back the results of its own commands. A batch is flushed early once it
+    holds `max_batch_size` commands.
+    """
+
+    def __init__(
+        self,
+        redis,
+        window: float = DEFAULT_BATCH_WINDOW,
+        max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+    ):
+        self.redis = redis
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._queue: List[Tuple[List[Command], asyncio.Future]] = []
+        self._queued_commands = 0
+        self._flush_handle: Optional[asyncio.Handle] = None
+        self._flush_tasks: set[asyncio.Task] = set()
+        self.batches = 0
+        self.commands = 0
+
+    def pipeline(self) -> "BatchedPipeline":
+        return BatchedPipeline(self)
+
+    def submit(self, commands: List[Command]) -> asyncio.Future:
+        """Queue `commands` for the next flush, the future gets their results."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.append((commands, future))
+        self._queued_commands += len(commands)
+        if self._queued_commands >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            if self.window:
+                self._flush_handle = loop.call_later(self.window, self._flush)
+            else:
+                self._flush_handle = loop.call_soon(self._flush)
+        return future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._queue = self._queue, []
+        self._queued_commands = 0
+        if batch:
+            task = asyncio.create_task(self._send(batch))
+            self._flush_tasks.add(task)
+            task.add_done_callback(self._flush_tasks.discard)
+
+    async def _send(self, batch: List[Tuple[List[Command], asyncio.Future]]) -> None:
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for commands, _ in batch:
+                    for command, args, kwargs in commands:
+                        getattr(pipe, command)(*args, **kwargs)
+                results = await pipe.execute()
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.batches += 1
+        self.commands += len(results)
+        position = 0
+        for commands, future in batch:
+            end = position + len(commands)
+            # callers that timed out have cancelled their future.
+            if not future.done():
+                future.set_result(results[position:end])
+            position = end
+
+
+class BatchedPipeline:
+    """Pipeline whose commands `AutoPipeline` sends with those of other callers."""
+
+    def __init__(self, batcher: AutoPipeline):
+        self.batcher = batcher
+        self._commands: List[Command] = []
+
+    async def __aenter__(self) -> "BatchedPipeline":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self._commands = []
+
+    def _add(self, command: str, *args, **kwargs) -> "BatchedPipeline":
+        self._commands.append((command, args, kwargs))
+        return self
+
+    def get(self, name: str) -> "BatchedPipeline":
+        return self._add("get", name)
+
+    def set(self, name: str, *args, **kwargs) -> "BatchedPipeline":
+        return self._add("set", name, *args, **kwargs)
+
+    def ttl(self, name: str) -> "BatchedPipeline":
+        return self._add("ttl", name)
+
+    def zadd(self, name: str, mapping: Dict, **kwargs) -> "BatchedPipeline":
+        return self._add("zadd", name, mapping, **kwargs)
+
+    async def execute(self) -> List[Any]:
+        commands, self._commands = self._commands, []
+        return await self.batcher.submit(commands)
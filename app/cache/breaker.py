@@ -0,0 +1,64 @@
+"""breaker.py"""
+from time import monotonic
+
+from cache.enums import CircuitState
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 10.0
+
+
+class CircuitBreaker:
+    """Stops sending operations to Redis for a while after consecutive failures.
+
+    After `failure_threshold` failures in a row the circuit opens and the cache is
+    bypassed. Once `reset_timeout` seconds have passed, one request is let through
+    to probe Redis (half-open): a success closes the circuit, a failure opens it
+    again. While a probe is pending, another one is allowed every `reset_timeout`
+    seconds, so a probe that never reports back cannot keep the circuit open.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        reset_timeout: float = DEFAULT_RESET_TIMEOUT,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CircuitState.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+
+    @property
+    def is_open(self) -> bool:
+        """True while operations must not be attempted at all."""
+        return self.state == CircuitState.OPEN and not self._reset_timeout_passed()
+
+    def allow_request(self) -> bool:
+        """Whether a request may use the cache, starting a probe when one is due."""
+        if self.state == CircuitState.CLOSED:
+            return True
+        if not self._reset_timeout_passed():
+            return False
+        self.state = CircuitState.HALF_OPEN
+        self._opened_at = monotonic()
+        return True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.state = CircuitState.CLOSED
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if (
+            self.state == CircuitState.HALF_OPEN
+            or self.failures >= self.failure_threshold
+        ):
+            self.state = CircuitState.OPEN
+            self._opened_at = monotonic()
+
+    def _reset_timeout_passed(self) -> bool:
+        return monotonic() - self._opened_at >= self.reset_timeout
+
+
+class CacheUnavailable(Exception):
+    """A Redis operation failed, timed out or was skipped by the open circuit."""
@@ -1,130 +1,343 @@
 """cache.py"""
-from ast import pattern
 import asyncio
+import inspect
+from contextvars import ContextVar
 from datetime import timedelta
 from functools import partial, update_wrapper, wraps
-from http import HTTPStatus
-from typing import Union
+from time import perf_counter
+from typing import Callable, List, Optional, Sequence, Union
 
-from fastapi import Response
+from fastapi import Request, Response
 
+from cache.breaker import CacheUnavailable
 from cache.client import Cache
+from cache.enums import RedisEvent
+from cache.entry import CacheEntry
+from cache.key_gen import get_key_builder
+from cache.listing import ListFetcher
+from cache.tags import format_tags, get_call_arguments
+from cache.types import (
+    VARY_PRINCIPAL,
+    AdaptiveTTL,
+    AuthCheck,
+    CacheOptions,
+    ListCacheOptions,
+    WriteThrough,
+)
 from cache.util import (
-    deserialize_json,
+    get_exit_stack,
+    get_response_field,
     ONE_DAY_IN_SECONDS,
     ONE_HOUR_IN_SECONDS,
     ONE_MONTH_IN_SECONDS,
     ONE_WEEK_IN_SECONDS,
     ONE_YEAR_IN_SECONDS,
-    serialize_json,
+    render_response_body,
+)
+from cache.write_through import EntryWriter
+
+# endpoint whose request `CacheRoute` is handling, the route caches its response itself
+route_cached_endpoint: ContextVar[Optional[Callable]] = ContextVar(
+    "route_cached_endpoint", default=None
 )
 
 
 def cache(
-    *, namespace: str | None = None, expire: int | timedelta = ONE_YEAR_IN_SECONDS
+    *,
+    namespace: str | None = None,
+    expire: int | timedelta | AdaptiveTTL = ONE_YEAR_IN_SECONDS,
+    stale_while_revalidate: int | timedelta = 0,
+    early_refresh_beta: float = 0,
+    tags: Sequence[str] = (),
+    vary_by: Sequence[str] = (VARY_PRINCIPAL,),
+    auth_check: Optional[AuthCheck] = None,
+    list_cache: Optional[ListCacheOptions] = None,
 ):
     """Enable caching behavior for the decorated function.
 
     Args:
-        expire (Union[int, timedelta], optional): The number of seconds
+        expire (Union[int, timedelta, AdaptiveTTL], optional): The number of seconds
             from now when the cached response should expire. Defaults to 31,536,000
-            seconds (i.e., the number of seconds in one year).
+            seconds (i.e., the number of seconds in one year). With `AdaptiveTTL`
+            the cache chooses the TTL within its bounds from the observed reads,
+            writes and invalidations of the function.
         namespace (str|None, optional): cache namespace for expiration usage
+        stale_while_revalidate (Union[int, timedelta], optional): Grace window after
+            `expire` during which the expired response is still served while a
+            single caller refreshes it. Defaults to 0 (no grace window).
+        early_refresh_beta (float, optional): Refresh a response before it expires
+            with a probability that rises as the expiry nears and with the time
+            the function took to compute it (XFetch). 1.0 is a good start, values
+            above 1 favour earlier refreshes. Defaults to 0 (disabled).
+        tags (Sequence[str], optional): Tags the response depends on, formatted
+            with the function arguments, e.g. `"user:{user_id}"`. `invalidate`
+            with any of the tags invalidates the response. Defaults to no tags.
+        vary_by (Sequence[str], optional): What else the response depends on:
+            "principal" (the caller), "role" (e.g. superuser or not), or request
+            headers as "header:<name>". Responses that are the same for every
+            caller allowed to see them can pass `()` and share one entry.
+            Defaults to ("principal",).
+        auth_check (Callable[[Request], bool], optional): Runs before the cache is
+            read and decides whether the caller may be served a cached response;
+            when it returns False the function runs as if it were not cached, so
+            its own dependencies reject the caller. With `CacheRoute` hits skip
+            the dependencies, so endpoints shared across callers need one.
+            Defaults to None.
+        list_cache (ListCacheOptions, optional): Cache a paginated list in chunks
+            aligned on a fixed size plus one entry per item, so that every window
+            of `skip` and `limit` is assembled from the same entries. `tags`
+            then apply to the chunks and `list_cache.item_tag` to the items.
+            Defaults to None.
+
+    Outside of a request there is no caller: `vary_by` values are left out of the
+    key and `auth_check` does not run.
     """
+    stale_ttl = calculate_ttl(stale_while_revalidate)
+    tags = tuple(tags)
+    vary_by = tuple(vary_by)
 
     def outer_wrapper(func):
+        signature = inspect.signature(func)
+        injected = [
+            name for name in ("request", "response") if name not in signature.parameters
+        ]
+        response_field = get_response_field(func)
+        # compile the cache key plan once, when the decorator is applied.
+        key_builder = get_key_builder(func)
+        list_fetcher = (
+            ListFetcher(
+                func,
+                partial(get_api_response_async, func),
+                namespace,
+                list_cache,
+                tags,
+                response_field,
+                signature,
+                partial(resolve_ttl, expire, key_builder.name, namespace),
+                stale_ttl,
+                early_refresh_beta,
+            )
+            if list_cache
+            else None
+        )
+
         @wraps(func)
         async def inner_wrapper(*args, **kwargs):
             """Return cached value if one exists, otherwise evaluate the wrapped function and cache the result."""
 
-            func_kwargs = kwargs.copy()
-            request = func_kwargs.pop("request", None)
-            response = func_kwargs.pop("response", None)
-            create_response_directly = not response
-            if create_response_directly:
-                response = Response()
+            request = kwargs.get("request")
+            response = kwargs.get("response")
+            for name in injected:
+                kwargs.pop(name, None)
             redis_cache = Cache()
-            if redis_cache.not_connected or redis_cache.request_is_not_cacheable(
+            if route_cached_endpoint.get() is inner_wrapper:
+                # the route layer handles caching of this request.
+                return await get_api_response_async(func, *args, **kwargs)
+            if redis_cache.request_is_not_cacheable(
                 request
-            ):
+            ) or not redis_cache.available:
                 # if the redis client is not connected or request is not cacheable, no caching behavior is performed.
                 return await get_api_response_async(func, *args, **kwargs)
-            key = redis_cache.get_cache_key(func, namespace, *args, **kwargs)
-            ttl, in_cache = await redis_cache.check_cache(key)
-            if in_cache:
-                return deserialize_json(in_cache)
-                redis_cache.set_response_headers(
-                    response, True, deserialize_json(in_cache), ttl
+            vary = ""
+            if request is not None:
+                vary = await redis_cache.resolve_vary(request, vary_by)
+                if vary is None or not await redis_cache.check_auth(
+                    auth_check, request
+                ):
+                    # the caller could not be verified or may not get a cached response.
+                    return await get_api_response_async(func, *args, **kwargs)
+            if list_fetcher is not None:
+                return await list_fetcher.fetch(
+                    redis_cache, args, kwargs, vary, request, response
                 )
-                if redis_cache.requested_resource_not_modified(request, in_cache):
-                    response.status_code = int(HTTPStatus.NOT_MODIFIED)
-                    return (
-                        Response(
-                            content=None,
-                            status_code=response.status_code,
-                            media_type="application/json",
-                            headers=response.headers,
-                        )
-                        if create_response_directly
-                        else response
-                    )
-                return (
-                    Response(
-                        content=in_cache,
-                        media_type="application/json",
-                        headers=response.headers,
-                    )
-                    if create_response_directly
-                    else deserialize_json(in_cache)
+            key = redis_cache.get_cache_key(func, namespace, args, kwargs, vary)
+            entry_tags = (
+                format_tags(
+                    tags, get_call_arguments(key_builder.signature, args, kwargs)
                 )
-            response_data = await get_api_response_async(func, *args, **kwargs)
-            ttl = calculate_ttl(expire)
-            
-            cached = await redis_cache.add_to_cache(key, response_data, ttl)
-            return response_data
-            if cached:
-                redis_cache.set_response_headers(
-                    response, cache_hit=False, response_data=response_data, ttl=ttl
+                if tags
+                else ()
+            )
+
+            def load(entry: CacheEntry, ttl: int):
+                if request is None:
+                    # called outside of a request, return the data itself.
+                    return redis_cache.decode(entry)
+                return redis_cache.respond_from_cache(
+                    request, entry, ttl, cache_hit=True, response=response
                 )
-                return (
-                    Response(
-                        content=serialize_json(response_data),
-                        media_type="application/json",
-                        headers=response.headers,
-                    )
-                    if create_response_directly
-                    else response_data
+
+            async def store(generation: int):
+                start = perf_counter()
+                response_data = await get_api_response_async(func, *args, **kwargs)
+                delta = perf_counter() - start
+                ttl = resolve_ttl(expire, key_builder.name, namespace)
+
+                body = (
+                    response_data
+                    if isinstance(response_data, Response)
+                    else await render_response_body(response_field, response_data)
+                )
+                entry = await redis_cache.add_to_cache(
+                    key,
+                    body,
+                    ttl + stale_ttl,
+                    generation,
+                    delta,
+                    namespace,
+                    key_builder.name,
+                )
+                return response_data, entry, ttl
+
+            async def compute(generation: int):
+                response_data, entry, ttl = await store(generation)
+                if entry is None or request is None:
+                    return response_data
+                return redis_cache.respond_from_cache(
+                    request, entry, ttl, cache_hit=False, response=response
                 )
-            return response_data
 
+            async def refresh(generation: int) -> None:
+                # the stale entry has been served already, only the cache is
+                # updated; the dependencies of the request stay open until then.
+                await store(generation)
+
+            return await redis_cache.fetch(
+                key,
+                namespace,
+                compute,
+                load,
+                stale_while_revalidate=stale_ttl,
+                early_refresh_beta=early_refresh_beta,
+                refresh=refresh,
+                tags=entry_tags,
+                endpoint=key_builder.name,
+                exit_stack=get_exit_stack(request),
+            )
+
+        # FastAPI passes the request and the response to the wrapper even when the
+        # decorated function does not declare them, so that hits can be answered
+        # with the stored bytes and conditional requests with 304.
+        inner_wrapper.__signature__ = add_keyword_parameters(
+            signature,
+            [
+                inspect.Parameter(
+                    name,
+                    inspect.Parameter.KEYWORD_ONLY,
+                    annotation=Request if name == "request" else Response,
+                )
+                for name in injected
+            ],
+        )
+        inner_wrapper.__cache__ = CacheOptions(
+            namespace=namespace,
+            expire=expire,
+            stale_while_revalidate=stale_while_revalidate,
+            early_refresh_beta=early_refresh_beta,
+            tags=tags,
+            vary_by=vary_by,
+            auth_check=auth_check,
+            list_cache=list_cache,
+        )
         return inner_wrapper
 
     return outer_wrapper
 
 
-def invalidate(*, namespace: str | None = None):
+def invalidate(
+    *,
+    namespace: str | None = None,
+    tags: Sequence[str] = (),
+    write_through: Sequence[WriteThrough] = (),
+):
     """Enable cache invalidating behavior for the decorated function.
 
+    The cache is invalidated once the function has returned, so that responses
+    computed while it runs are not cached with the data it replaces.
+
     Args:
-        namespace (str|None, optional): cache namespace for expiration usage
+        namespace (str|None, optional): cache namespace for expiration usage. When
+            only `tags` are given, the rest of the namespace stays cached.
+        tags (Sequence[str], optional): Tags to invalidate, formatted with the
+            function arguments, e.g. `"user:{user_id}"` or
+            `"user:{current_user.id}"`. Defaults to no tags.
+        write_through (Sequence[WriteThrough], optional): Cached endpoints whose
+            entry for the written entity is replaced by the value the function
+            returns, in the transaction that invalidates `tags`, so the next read
+            is a hit. The endpoints must be defined before the function.
     """
+    tags = tuple(tags)
+    write_through = tuple(write_through)
 
     def outer_wrapper(func):
+        signature = inspect.signature(func)
+        writers = [get_entry_writer(target) for target in write_through]
+        # the request tells which entries `CacheRoute` stores under route keys.
+        injected = (
+            ["request"] if writers and "request" not in signature.parameters else []
+        )
+
         @wraps(func)
         async def inner_wrapper(*args, **kwargs):
-            """delete cached namespace."""
+            """invalidate cached namespace and tags."""
+            request = kwargs.get("request")
+            for name in injected:
+                kwargs.pop(name, None)
+            response = await get_api_response_async(func, *args, **kwargs)
             redis_cache = Cache()
             if redis_cache.connected:
                 # if the redis client is not connected no caching behavior is performed.
-                pattern = redis_cache.get_cache_key_pattern(namespace)
-                await redis_cache.invalidate(pattern)
-            return await get_api_response_async(func, *args, **kwargs)
+                try:
+                    if namespace is not None or not (tags or writers):
+                        await redis_cache.invalidate(namespace)
+                    arguments = get_call_arguments(signature, args, kwargs)
+                    pending_tags = format_tags(tags, arguments)
+                    for writer in writers:
+                        # the first entry written bumps the tags with it.
+                        entry = await writer.write(
+                            redis_cache, arguments, response, request, pending_tags
+                        )
+                        if entry is not None:
+                            pending_tags = ()
+                    if pending_tags:
+                        await redis_cache.invalidate_tags(pending_tags)
+                except CacheUnavailable as e:
+                    # the write succeeded, cached responses expire with their TTL.
+                    redis_cache.log(RedisEvent.FAILED_TO_INVALIDATE, msg=str(e))
+            return response
 
+        if injected:
+            inner_wrapper.__signature__ = add_keyword_parameters(
+                signature,
+                [
+                    inspect.Parameter(
+                        "request", inspect.Parameter.KEYWORD_ONLY, annotation=Request
+                    )
+                ],
+            )
         return inner_wrapper
 
     return outer_wrapper
 
 
+def get_entry_writer(target: WriteThrough) -> EntryWriter:
+    """Writer of the entries of `target`, an endpoint decorated with `cache`."""
+    options = getattr(target.endpoint, "__cache__", None)
+    if options is None:
+        raise ValueError(f"{target.endpoint} is not decorated with cache")
+    return EntryWriter(
+        target,
+        options,
+        partial(
+            resolve_ttl,
+            options.expire,
+            get_key_builder(target.endpoint).name,
+            options.namespace,
+        ),
+        calculate_ttl(options.stale_while_revalidate),
+    )
+
+
 async def get_api_response_async(func, *args, **kwargs):
     """Helper function that allows decorator to work with both async and non-async functions."""
     return (
@@ -134,6 +347,16 @@ async def get_api_response_async(func, *args, **kwargs):
     )
 
 
+def add_keyword_parameters(
+    signature: inspect.Signature, parameters: List[inspect.Parameter]
+) -> inspect.Signature:
+    """Return `signature` with keyword-only `parameters` added before any `**kwargs`."""
+    params = list(signature.parameters.values())
+    if params and params[-1].kind == inspect.Parameter.VAR_KEYWORD:
+        return signature.replace(parameters=[*params[:-1], *parameters, params[-1]])
+    return signature.replace(parameters=[*params, *parameters])
+
+
 def calculate_ttl(expire: Union[int, timedelta]) -> int:
     """ "Converts expire time to total seconds and ensures that ttl is capped at one year."""
     if isinstance(expire, timedelta):
@@ -141,6 +364,15 @@ def calculate_ttl(expire: Union[int, timedelta]) -> int:
     return min(expire, ONE_YEAR_IN_SECONDS)
 
 
+def resolve_ttl(
+    expire: Union[int, timedelta, AdaptiveTTL], endpoint: str, namespace: Optional[str]
+) -> int:
+    """TTL of a new entry of `endpoint`, chosen by the cache when it is adaptive."""
+    if isinstance(expire, AdaptiveTTL):
+        return Cache().get_ttl(expire, endpoint, namespace)
+    return calculate_ttl(expire)
+
+
 cache_one_minute = partial(cache, expire=60)
 cache_one_hour = partial(cache, expire=ONE_HOUR_IN_SECONDS)
 cache_one_day = partial(cache, expire=ONE_DAY_IN_SECONDS)
@@ -1,20 +1,123 @@
+import asyncio
 import json
 import logging
+import math
+import random
+from contextlib import AsyncExitStack
 from datetime import datetime, timedelta
-from typing import Callable, Dict, List, Optional, Tuple, Type, Union
+from hashlib import blake2b
+from http import HTTPStatus
+from inspect import isawaitable
+from time import perf_counter, time
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+)
+from urllib.parse import quote
+from uuid import uuid4
 
 from fastapi import Request, Response
 from redis.asyncio import client
+from redis.asyncio.cluster import RedisCluster
+from redis.exceptions import RedisError, WatchError
 
-from cache.enums import RedisEvent, RedisStatus
-from cache.key_gen import get_cache_key, get_cache_key_pattern
-from cache.redis import redis_connect
+from app.db.context import read_fresh
+from cache.adaptive import TTL_STATS_WINDOW, TTLAdvisor, get_window, get_windows
+from cache.batching import DEFAULT_BATCH_WINDOW, AutoPipeline
+from cache.breaker import (
+    DEFAULT_FAILURE_THRESHOLD,
+    DEFAULT_RESET_TIMEOUT,
+    CacheUnavailable,
+    CircuitBreaker,
+)
+from cache.codec import Codec, get_codec, get_default_codec
+from cache.compression import (
+    DEFAULT_COMPRESS_THRESHOLD,
+    NO_COMPRESSION,
+    Compressor,
+    ZlibCompressor,
+    get_compressor,
+)
+from cache.entry import (
+    HEADER,
+    JSON_CODEC_ID,
+    CacheEntry,
+    get_generation,
+    get_namespace_generation,
+)
+from cache.enums import CircuitState, RedisEvent, RedisStatus
+from cache.key_gen import (
+    format_cache_key,
+    get_cache_key_pattern,
+    get_event_claim_key,
+    get_func_name,
+    get_generation_key,
+    get_ignore_arg_types,
+    get_invalidation_channel,
+    get_invalidation_count_key,
+    get_item_cache_key,
+    get_tag_epoch_key,
+    get_tag_invalidation_channel,
+    get_tag_key,
+    get_ttl_stats_key,
+    join_vary,
+    get_key_builder,
+    get_lock_key,
+    get_path_cache_key,
+    get_quota_keys,
+    get_recent_invalidation_key,
+    get_route_cache_key,
+)
+from cache.local import LocalCache
+from cache.redis import RedisClient, get_pubsub_client, redis_connect
+from cache.sharding import ShardedRedis
+from cache.stats import CacheStats
+from cache.types import (
+    VARY_HEADER_PREFIX,
+    VARY_PRINCIPAL,
+    VARY_ROLE,
+    EVICT_LFU,
+    AdaptiveTTL,
+    AuthCheck,
+    LocalCacheOptions,
+    NamespaceQuota,
+)
 from cache.util import serialize_json
 
 DEFAULT_RESPONSE_HEADER = "X-FastAPI-Cache"
 ALLOWED_HTTP_TYPES = ["GET"]
+JSON_MEDIA_TYPE = "application/json"
 LOG_TIMESTAMP = "%m/%d/%Y %I:%M:%S %p"
 HTTP_TIME = "%a, %d %b %Y %H:%M:%S GMT"
+PURGE_SCAN_COUNT = 500
+# most entries evicted from a namespace per round trip
+EVICTION_BATCH_SIZE = 100
+DEFAULT_LOCK_TIMEOUT = 5.0
+DEFAULT_LOCK_POLL_INTERVAL = 0.05
+INVALIDATION_LISTENER_RETRY_DELAY = 1.0
+DEFAULT_OPERATION_TIMEOUT = 0.5
+RECONNECT_MIN_DELAY = 1.0
+RECONNECT_MAX_DELAY = 30.0
+# errors of a Redis operation after which the cache is bypassed
+REDIS_FAILURES = (RedisError, OSError, asyncio.TimeoutError)
+# returned by `Cache._claim_refresh` when the current entry should be served
+NOT_REFRESHED = object()
+# marks a principal or role that was not resolved for the request yet
+NOT_RESOLVED = object()
+# namespace under which tag invalidations are counted, tags have no namespace
+TAGS_NAMESPACE = "#tags"
+# events logged once per key, only at DEBUG level or when sampled
+PER_KEY_EVENTS = frozenset(
+    (RedisEvent.KEY_FOUND_IN_CACHE, RedisEvent.KEY_ADDED_TO_CACHE)
+)
 
 logging.basicConfig()
 logger = logging.getLogger(__name__)
@@ -35,31 +138,84 @@ class MetaSingleton(type):
 class Cache(metaclass=MetaSingleton):
     """Communicates with Redis server to cache API response data."""
 
-    host_url: str
+    host_url: Union[str, Sequence[str]]
     prefix: str = None
     response_header: str = None
     status: RedisStatus = RedisStatus.NONE
-    redis: client.Redis = None
+    redis: RedisClient = None
+    pubsub_redis: client.Redis = None
+    batcher: Optional[AutoPipeline] = None
+    log_sample_rate: float = 0.0
+    ttl_advisor: TTLAdvisor = TTLAdvisor()
+    quotas: Dict[str, NamespaceQuota] = {}
+    _ttl_flush_task: Optional[asyncio.Task] = None
+    principal_resolver: Callable[[Request], Union[str, None, Awaitable]] = None
+    role_resolver: Callable[[Request], Union[str, None, Awaitable]] = None
+    purge_on_invalidate: bool = True
+    fresh_reads_window: float = 0
+    hash_keys: bool = False
+    codec: Codec = None
+    compressor: Optional[Compressor] = None
+    compress_threshold: int = DEFAULT_COMPRESS_THRESHOLD
+    local: Optional[LocalCache] = None
+    _invalidation_listener: Optional[asyncio.Task] = None
+    lock_timeout: float = DEFAULT_LOCK_TIMEOUT
+    lock_poll_interval: float = DEFAULT_LOCK_POLL_INTERVAL
+    operation_timeout: Optional[float] = DEFAULT_OPERATION_TIMEOUT
+    breaker: CircuitBreaker = CircuitBreaker()
+    _reconnect_task: Optional[asyncio.Task] = None
 
     @property
     def connected(self):
         return self.status == RedisStatus.CONNECTED
 
+    @property
+    def available(self):
+        """Whether requests should use the cache: Redis is connected and healthy."""
+        return self.connected and self.breaker.allow_request()
+
     @property
     def not_connected(self):
         return not self.connected
 
     async def init(
         self,
-        host_url: str,
+        host_url: Union[str, Sequence[str]],
         prefix: Optional[str] = None,
         response_header: Optional[str] = None,
         ignore_arg_types: Optional[List[Type[object]]] = None,
+        principal_resolver: Optional[
+            Callable[[Request], Union[str, None, Awaitable]]
+        ] = None,
+        role_resolver: Optional[
+            Callable[[Request], Union[str, None, Awaitable]]
+        ] = None,
+        purge_on_invalidate: bool = True,
+        lock_timeout: float = DEFAULT_LOCK_TIMEOUT,
+        lock_poll_interval: float = DEFAULT_LOCK_POLL_INTERVAL,
+        hash_keys: bool = False,
+        codec: Optional[Codec] = None,
+        compressor: Optional[Compressor] = ZlibCompressor(),
+        compress_threshold: int = DEFAULT_COMPRESS_THRESHOLD,
+        local_cache: Optional[LocalCacheOptions] = None,
+        local_cache_namespaces: Optional[Dict[str, LocalCacheOptions]] = None,
+        operation_timeout: Optional[float] = DEFAULT_OPERATION_TIMEOUT,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        reset_timeout: float = DEFAULT_RESET_TIMEOUT,
+        max_connections: Optional[int] = None,
+        auto_pipeline: bool = False,
+        auto_pipeline_window: float = DEFAULT_BATCH_WINDOW,
+        log_sample_rate: float = 0.0,
+        quotas: Optional[Dict[str, NamespaceQuota]] = None,
+        fresh_reads_window: float = 0,
     ) -> None:
         """Connect to a Redis database using `host_url` and configure cache settings.
 
         Args:
-            host_url (str): URL for a Redis database.
+            host_url (str | Sequence[str]): URL for a Redis database. Use a
+                `redis+sentinel://` URL for a Sentinel-managed master, a
+                `redis+cluster://` URL for a Redis Cluster, or a list of URLs to
+                shard keys over standalone nodes by consistent hashing.
             prefix (str, optional): Prefix to add to every cache key stored in the
                 Redis database. Defaults to None.
             response_header (str, optional): Name of the custom header field used to
@@ -69,22 +225,132 @@ class Cache(metaclass=MetaSingleton):
                 are any arguments that have no effect on the response (such as a
                 `Request` or `Response` object), including their type in this list
                 will ignore those arguments when the key is created. Defaults to None.
+            principal_resolver (Callable[[Request], str | None], optional): Returns
+                the verified identity of the caller without touching the database,
+                or None when it cannot be verified. Keys of endpoints that vary by
+                principal are scoped to this value, and caching is skipped when it
+                is None. Without a resolver every request is treated as anonymous.
+                Defaults to None.
+            role_resolver (Callable[[Request], str | None], optional): Like
+                `principal_resolver`, for the role of the caller, e.g. "superuser".
+                Used by endpoints that vary by role. Defaults to None, which gives
+                every caller the same role.
+            purge_on_invalidate (bool, optional): After a namespace is invalidated,
+                unlink its stale keys in a background task instead of leaving them
+                to expire. Defaults to True.
+            lock_timeout (float, optional): Seconds a worker holds the lock that
+                stops other workers from computing the same missing key, and the
+                longest they wait for it to be populated. Defaults to 5.
+            lock_poll_interval (float, optional): Seconds between checks of a key
+                that another worker is computing. Defaults to 0.05.
+            hash_keys (bool, optional): Replace the arguments part of every key by
+                a fixed-length digest, which bounds the memory Redis spends per
+                key at the cost of readable keys. Defaults to False.
+            codec (Codec, optional): Encodes the Python objects passed to
+                `add_to_cache`. Responses are always stored as JSON. Defaults to
+                `ORJSONCodec` when orjson is installed, else `JSONCodec`.
+            compressor (Compressor, optional): Compresses stored bodies of at least
+                `compress_threshold` bytes, None stores every body as is. Defaults
+                to `ZlibCompressor`.
+            compress_threshold (int, optional): Size in bytes from which bodies are
+                compressed. Defaults to 1024.
+            local_cache (LocalCacheOptions, optional): Keep the hottest entries of
+                every namespace in the memory of each worker as well, within these
+                limits. Invalidations reach every worker over Redis pub/sub.
+                Defaults to None, which keeps entries in Redis only.
+            local_cache_namespaces (Dict[str, LocalCacheOptions], optional): Limits
+                of the in-memory tier for specific namespaces, overriding
+                `local_cache`. Defaults to None.
+            operation_timeout (float, optional): Seconds a cache lookup, write or
+                invalidation may take before the cache is bypassed for the
+                request. Also used as the connect timeout. None waits as long as
+                Redis takes. Defaults to 0.5.
+            failure_threshold (int, optional): Consecutive failed or timed out
+                operations after which the cache is bypassed without trying Redis
+                (the circuit opens). Defaults to 5.
+            reset_timeout (float, optional): Seconds after which an open circuit
+                lets one request probe Redis again. Defaults to 10.
+            max_connections (int, optional): Size of the connection pool of each
+                Redis node. Defaults to None, the redis-py default.
+            auto_pipeline (bool, optional): Send the lookups and writes that
+                concurrent requests issue within `auto_pipeline_window` as one
+                pipeline, one round trip for all of them. Defaults to False.
+            auto_pipeline_window (float, optional): Seconds commands are collected
+                before they are sent. Defaults to 0, which sends the commands
+                queued during one iteration of the event loop.
+            log_sample_rate (float, optional): Share of the per-key events (keys
+                found and added) logged at INFO level. They are all logged when the
+                logger is set to DEBUG. Defaults to 0. Counters and latencies of
+                every event are kept in `stats` regardless.
+            quotas (Dict[str, NamespaceQuota], optional): Budgets of entries and
+                bytes per namespace. Writes that exceed the budget of their
+                namespace evict its least recently or least frequently read
+                entries. Defaults to None, which leaves eviction to Redis.
+            fresh_reads_window (float, optional): Seconds after any invalidation
+                during which values computed on a miss run with
+                `app.db.context.fresh_reads`
+                set, so that databases with read replicas read them from the
+                primary. Set it to the longest replication lag tolerated.
+                Defaults to 0, which never sets it.
         """
         self.host_url = host_url
         self.prefix = prefix
         self.response_header = response_header or DEFAULT_RESPONSE_HEADER
-        self.ignore_arg_types = ignore_arg_types
+        self.ignore_arg_types = get_ignore_arg_types(ignore_arg_types)
+        self.principal_resolver = principal_resolver
+        self.role_resolver = role_resolver
+        self.purge_on_invalidate = purge_on_invalidate
+        self._purge_tasks: Dict[str, asyncio.Task] = {}
+        self._purge_pending: set[str] = set()
+        self.lock_timeout = lock_timeout
+        self.lock_poll_interval = lock_poll_interval
+        self.hash_keys = hash_keys
+        self.codec = codec or get_default_codec()
+        self.compressor = compressor
+        self.compress_threshold = compress_threshold
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._refresh_tasks: set[asyncio.Task] = set()
+        self.stats = CacheStats()
+        self.ttl_advisor = TTLAdvisor()
+        self.operation_timeout = operation_timeout
+        self.max_connections = max_connections
+        self.auto_pipeline = auto_pipeline
+        self.auto_pipeline_window = auto_pipeline_window
+        self.log_sample_rate = log_sample_rate
+        self.quotas = quotas or {}
+        self.fresh_reads_window = fresh_reads_window
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.local = (
+            LocalCache(local_cache, local_cache_namespaces)
+            if local_cache or local_cache_namespaces
+            else None
+        )
+        task = self._reconnect_task
+        if task is not None and not task.done():
+            task.cancel()
         await self._connect()
+        if self.status == RedisStatus.CONN_ERROR:  # pragma: no cover
+            self._reconnect_task = asyncio.create_task(self._reconnect())
 
     async def _connect(self):
         self.log(
             RedisEvent.CONNECT_BEGIN, msg="Attempting to connect to Redis server..."
         )
-        self.status, self.redis = await redis_connect(self.host_url)
+        self.status, self.redis = await redis_connect(
+            self.host_url, self.operation_timeout, self.max_connections
+        )
         if self.status == RedisStatus.CONNECTED:
+            self.pubsub_redis = get_pubsub_client(self.redis)
+            self.batcher = (
+                AutoPipeline(self.redis, self.auto_pipeline_window)
+                if self.auto_pipeline
+                else None
+            )
             self.log(
                 RedisEvent.CONNECT_SUCCESS, msg="Redis client is connected to server."
             )
+            if self.local:
+                self._start_invalidation_listener()
         if self.status == RedisStatus.AUTH_ERROR:  # pragma: no cover
             self.log(
                 RedisEvent.CONNECT_FAIL,
@@ -96,6 +362,39 @@ class Cache(metaclass=MetaSingleton):
                 msg="Redis server did not respond to PING message.",
             )
 
+    async def _reconnect(self) -> None:  # pragma: no cover
+        """Retry connecting with exponential backoff until Redis is reachable."""
+        delay = RECONNECT_MIN_DELAY
+        while self.status == RedisStatus.CONN_ERROR:
+            await asyncio.sleep(delay * (0.5 + random.random() / 2))
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+            await self._connect()
+        self.breaker.record_success()
+
+    async def _run(self, operation: Awaitable, force: bool = False) -> Any:
+        """Await a Redis `operation` within the operation timeout.
+
+        Failures are counted by the circuit breaker and raised as
+        `CacheUnavailable`. While the circuit is open nothing is sent to Redis,
+        unless `force` is set for operations that must always be attempted.
+        """
+        if self.breaker.is_open and not force:
+            if asyncio.iscoroutine(operation):
+                operation.close()
+            raise CacheUnavailable("the circuit breaker is open")
+        try:
+            result = await asyncio.wait_for(operation, self.operation_timeout)
+        except REDIS_FAILURES as e:
+            was_open = self.breaker.state == CircuitState.OPEN
+            self.breaker.record_failure()
+            if not was_open and self.breaker.state == CircuitState.OPEN:
+                self.log(RedisEvent.CIRCUIT_OPENED, msg=repr(e))
+            raise CacheUnavailable(repr(e)) from e
+        if self.breaker.state != CircuitState.CLOSED:
+            self.log(RedisEvent.CIRCUIT_CLOSED)
+        self.breaker.record_success()
+        return result
+
     def request_is_not_cacheable(self, request: Request) -> bool:
         return request and (
             request.method not in ALLOWED_HTTP_TYPES
@@ -106,25 +405,479 @@ class Cache(metaclass=MetaSingleton):
         )
 
     def get_cache_key(
-        self, func: Callable, namespace: str, *args: List, **kwargs: Dict
+        self, func: Callable, namespace: str, args: Tuple, kwargs: Dict, vary: str = ""
     ) -> str:
-        return get_cache_key(
-            f"{self.prefix}|{namespace}", self.ignore_arg_types, func, *args, **kwargs
+        builder = get_key_builder(func)
+        args_str = builder.get_args_str(self.ignore_arg_types, args, kwargs)
+        args_str = join_vary(args_str, vary)
+        return format_cache_key(
+            f"{self.prefix}|{namespace}", builder.name, args_str, self.hash_keys
         )
 
+    def get_route_cache_key(
+        self, func: Callable, namespace: str, request: Request, vary: str = ""
+    ) -> str:
+        return get_route_cache_key(
+            f"{self.prefix}|{namespace}", func, request, vary, self.hash_keys
+        )
+
+    def get_path_cache_key(self, func: Callable, namespace: str, path: str) -> str:
+        """Key `get_route_cache_key` builds for a request of `path`, without query."""
+        return get_path_cache_key(
+            f"{self.prefix}|{namespace}", func, path, hash_args=self.hash_keys
+        )
+
+    async def resolve_principal(self, request: Request) -> Optional[str]:
+        """Verified identity of the caller, resolved once per request."""
+        return await self._resolve(request, "cache_principal", self.principal_resolver)
+
+    async def resolve_role(self, request: Request) -> Optional[str]:
+        """Verified role of the caller, resolved once per request."""
+        return await self._resolve(request, "cache_role", self.role_resolver)
+
+    async def _resolve(
+        self,
+        request: Request,
+        name: str,
+        resolver: Optional[Callable[[Request], Union[str, None, Awaitable]]],
+    ) -> Optional[str]:
+        if not resolver:
+            return ""
+        # kept in the request state, shared by the route, decorator and auth checks.
+        value = getattr(request.state, name, NOT_RESOLVED)
+        if value is NOT_RESOLVED:
+            value = resolver(request)
+            if isawaitable(value):
+                value = await value
+            setattr(request.state, name, value)
+        return value
+
+    async def resolve_vary(
+        self, request: Request, vary_by: Sequence[str]
+    ) -> Optional[str]:
+        """Return the values of `request` the response varies by, as part of a key.
+
+        Returns None if the principal or role cannot be verified, in which case the
+        request must not be cached.
+        """
+        values = []
+        for vary in vary_by:
+            if vary == VARY_PRINCIPAL:
+                value = await self.resolve_principal(request)
+            elif vary == VARY_ROLE:
+                value = await self.resolve_role(request)
+            elif vary.startswith(VARY_HEADER_PREFIX):
+                value = request.headers.get(vary[len(VARY_HEADER_PREFIX) :], "")
+            else:
+                raise ValueError(f"Unknown vary_by value: {vary!r}")
+            if value is None:
+                return None
+            values.append(f"{vary.lower()}={quote(value)}")
+        return ",".join(values)
+
+    @staticmethod
+    async def check_auth(auth_check: Optional[AuthCheck], request: Request) -> bool:
+        """Run the `auth_check` hook of an endpoint, True if there is none."""
+        if auth_check is None:
+            return True
+        allowed = auth_check(request)
+        if isawaitable(allowed):
+            allowed = await allowed
+        return bool(allowed)
+
     def get_cache_key_pattern(self, namespace: str) -> str:
         return get_cache_key_pattern(f"{self.prefix}|{namespace}")
 
-    async def check_cache(self, key: str) -> Tuple[int, str]:
-        async with self.redis.pipeline() as pipe:
-            ttl, in_cache = await pipe.ttl(key).get(key).execute()
-            if in_cache:
-                self.log(RedisEvent.KEY_FOUND_IN_CACHE, key=key)
-            return (ttl, in_cache)
+    def get_generation_key(self, namespace: str) -> str:
+        return get_generation_key(f"{self.prefix}|{namespace}")
+
+    def get_invalidation_channel(self) -> str:
+        return get_invalidation_channel(f"{self.prefix}")
+
+    def get_tag_invalidation_channel(self) -> str:
+        return get_tag_invalidation_channel(f"{self.prefix}")
+
+    def get_tag_key(self, tag: str) -> str:
+        return get_tag_key(f"{self.prefix}", tag)
+
+    def get_item_cache_key(
+        self, func: Callable, namespace: str, item_id: Any, vary: str = ""
+    ) -> str:
+        return get_item_cache_key(
+            f"{self.prefix}|{namespace}",
+            get_func_name(func),
+            item_id,
+            vary,
+            self.hash_keys,
+        )
+
+    def get_tag_epoch_key(self) -> str:
+        return get_tag_epoch_key(f"{self.prefix}")
+
+    def get_recent_invalidation_key(self) -> str:
+        return get_recent_invalidation_key(f"{self.prefix}")
+
+    def get_event_claim_key(self, event: str) -> str:
+        return get_event_claim_key(f"{self.prefix}", event)
+
+    def get_quota_keys(self, namespace: str) -> Tuple[str, str, str, str]:
+        return get_quota_keys(f"{self.prefix}", namespace)
+
+    def get_ttl_stats_key(self, family: str, window: int) -> str:
+        return get_ttl_stats_key(f"{self.prefix}", family, window)
+
+    def get_invalidation_count_key(self, namespace: str, window: int) -> str:
+        return get_invalidation_count_key(f"{self.prefix}", namespace, window)
+
+    async def check_cache(
+        self,
+        key: str,
+        namespace: str = None,
+        tags: Sequence[str] = (),
+        endpoint: Optional[str] = None,
+    ) -> Tuple[int, Optional[CacheEntry], int]:
+        """Fetch the TTL and entry of `key` with the current generation of `namespace`.
+
+        Entries written under an older generation were invalidated and are reported
+        as missing. The generation is returned so that the caller can stamp the
+        value it computes on a miss with it. It is the namespace generation plus the
+        versions of `tags`; all of them only grow, so invalidating the namespace or
+        any of the tags changes it.
+
+        Namespaces with an in-memory tier are looked up there first, and entries
+        read from Redis are kept there. Entries found outdated are counted for
+        `endpoint`.
+        """
+        local_options = self.local.options(namespace) if self.local else None
+        if local_options:
+            cached = self.local.get(namespace, key)
+            if cached:
+                self.stats.incr(namespace, "local_hit")
+                ttl, entry = cached
+                return (ttl, entry, entry.generation)
+            self.stats.incr(namespace, "local_miss")
+            epoch = self.local.epoch(namespace)
+        start = perf_counter()
+        async with self._pipeline() as pipe:
+            pipe.get(self.get_generation_key(namespace))
+            # one GET per tag, the tag keys may live on different nodes or slots.
+            for tag in tags:
+                pipe.get(self.get_tag_key(tag))
+            pipe.ttl(key).get(key)
+            quota = self.quotas.get(namespace)
+            if quota:
+                self._touch(pipe, namespace, key, quota)
+            results = await self._run(pipe.execute())
+        if quota:
+            results.pop()
+        generation, *tag_versions, ttl, in_cache = results
+        self.stats.observe(namespace, "lookup", perf_counter() - start)
+        generation = get_generation(
+            int(generation or 0), (int(version or 0) for version in tag_versions)
+        )
+        if not in_cache:
+            return (ttl, None, generation)
+        self.stats.incr(namespace, "bytes_read", len(in_cache))
+        entry = CacheEntry.unpack(in_cache)
+        if entry is None or entry.generation != generation:
+            self.stats.incr(namespace, "outdated", endpoint=endpoint)
+            self._record_ttl_event(endpoint, "outdated")
+            return (ttl, None, generation)
+        self.log(RedisEvent.KEY_FOUND_IN_CACHE, key=key)
+        entry = self.decompress(entry, namespace)
+        if local_options:
+            self.local.set(namespace, key, entry, ttl, epoch, tuple(tags))
+        return (ttl, entry, generation)
+
+    def _touch(self, pipe, namespace: str, key: str, quota: NamespaceQuota) -> None:
+        """Rank `key` as read for the eviction policy, if it is indexed."""
+        index, *_ = self.get_quota_keys(namespace)
+        if quota.policy == EVICT_LFU:
+            pipe.zadd(index, {key: 1}, xx=True, incr=True)
+        else:
+            pipe.zadd(index, {key: time()}, xx=True)
+
+    def _pipeline(self):
+        """Pipeline for a lookup, sent with other requests' if auto-pipelining."""
+        if self.batcher is None:
+            return self.redis.pipeline()
+        return self.batcher.pipeline()
+
+    async def _set(self, key: str, value: bytes, expire: int) -> bool:
+        if self.batcher is None:
+            return await self.redis.set(name=key, value=value, ex=expire)
+        (cached,) = await self.batcher.pipeline().set(key, value, ex=expire).execute()
+        return cached
+
+    async def fetch(
+        self,
+        key: str,
+        namespace: str,
+        compute: Callable[[int], Awaitable[Any]],
+        load: Callable[[CacheEntry, int], Any],
+        stale_while_revalidate: int = 0,
+        early_refresh_beta: float = 0,
+        refresh: Optional[Callable[[int], Awaitable[Any]]] = None,
+        tags: Sequence[str] = (),
+        endpoint: Optional[str] = None,
+        exit_stack: Optional[AsyncExitStack] = None,
+    ) -> Any:
+        """Return the cached value of `key`, computing it at most once on a miss.
+
+        Args:
+            key (str): Cache key.
+            namespace (str): Namespace of the key.
+            compute (Callable[[int], Awaitable]): Evaluates the value and adds it to
+                the cache stamped with the generation it receives.
+            load (Callable[[CacheEntry, int], Any]): Builds the result from a cached
+                entry and the number of seconds it stays fresh.
+            stale_while_revalidate (int, optional): Seconds at the end of the stored
+                TTL during which the entry is stale: it is still served while one
+                caller refreshes it. Defaults to 0.
+            early_refresh_beta (float, optional): Enables probabilistic early
+                refresh (XFetch) of fresh entries; higher values refresh earlier.
+                Defaults to 0, which disables it.
+            refresh (Callable[[int], Awaitable], optional): Like `compute`, but safe
+                to run in a background task after the request has finished. When
+                omitted, the request that claims the refresh runs `compute` itself
+                and every other caller is served the current entry.
+            tags (Sequence[str], optional): Tags the value depends on; invalidating
+                any of them invalidates the entry. Defaults to no tags.
+            endpoint (str, optional): Name under which hits, misses and stale
+                serves are counted in `stats`, besides the namespace. Defaults to
+                None.
+            exit_stack (AsyncExitStack, optional): Closes the resources `refresh`
+                uses, such as the dependencies of the request; its exit waits for a
+                background refresh to finish. Defaults to None.
+
+        Concurrent misses for the same key are coalesced: within the process only
+        one coroutine runs `compute` while the others wait for it, and across
+        processes a short Redis lock makes other workers wait for the populated
+        value. Waiters read the value back from the cache, so results are never
+        shared between requests, and compute it themselves if it never appears.
 
-    def requested_resource_not_modified(
-        self, request: Request, cached_data: str
+        When Redis fails or is too slow, the value is computed without the cache.
+        """
+        try:
+            return await self._fetch(
+                key,
+                namespace,
+                compute,
+                load,
+                stale_while_revalidate,
+                early_refresh_beta,
+                refresh,
+                tags,
+                endpoint,
+                exit_stack,
+            )
+        except CacheUnavailable as e:
+            self.log(RedisEvent.CACHE_UNAVAILABLE, msg=str(e), key=key)
+            self.stats.incr(namespace, "bypassed", endpoint=endpoint)
+            return await compute(0)
+
+    async def _fetch(
+        self,
+        key: str,
+        namespace: str,
+        compute: Callable[[int], Awaitable[Any]],
+        load: Callable[[CacheEntry, int], Any],
+        stale_while_revalidate: int,
+        early_refresh_beta: float,
+        refresh: Optional[Callable[[int], Awaitable[Any]]],
+        tags: Sequence[str],
+        endpoint: Optional[str],
+        exit_stack: Optional[AsyncExitStack],
+    ) -> Any:
+        ttl, entry, generation = await self.check_cache(
+            key, namespace, tags, endpoint
+        )
+        self._record_ttl_event(endpoint, "reads")
+        if entry:
+            fresh_ttl = max(ttl - stale_while_revalidate, 0)
+            event = "hit" if fresh_ttl > 0 else "stale"
+            self.stats.incr(namespace, event, endpoint=endpoint)
+            if self._should_refresh(namespace, entry, fresh_ttl, early_refresh_beta):
+                refreshed = await self._claim_refresh(
+                    key, namespace, generation, compute, refresh, exit_stack
+                )
+                if refreshed is not NOT_REFRESHED:
+                    return refreshed
+            return load(entry, fresh_ttl)
+
+        self.stats.incr(namespace, "miss", endpoint=endpoint)
+        flight = self._in_flight.get(key)
+        if flight is not None:
+            await asyncio.shield(flight)
+            ttl, entry, generation = await self.check_cache(key, namespace, tags)
+            if entry:
+                self.stats.incr(namespace, "coalesced")
+                return load(entry, max(ttl - stale_while_revalidate, 0))
+            self.stats.incr(namespace, "computed")
+            with read_fresh(await self.recently_invalidated()):
+                return await compute(generation)
+
+        flight = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = flight
+        try:
+            with read_fresh(await self.recently_invalidated()):
+                return await self._compute_locked(
+                    key,
+                    namespace,
+                    generation,
+                    compute,
+                    load,
+                    stale_while_revalidate,
+                    tags,
+                )
+        finally:
+            del self._in_flight[key]
+            flight.set_result(None)
+
+    async def recently_invalidated(self) -> bool:
+        """Whether a namespace or tag was invalidated within `fresh_reads_window`.
+
+        True as well when Redis cannot tell, the value is then read fresh.
+        """
+        if not self.fresh_reads_window:
+            return False
+        try:
+            key = self.get_recent_invalidation_key()
+            return bool(await self._run(self.redis.exists(key)))
+        except CacheUnavailable:
+            return True
+
+    def _should_refresh(
+        self, namespace: str, entry: CacheEntry, fresh_ttl: int, beta: float
     ) -> bool:
+        if fresh_ttl <= 0:
+            return True
+        # XFetch: refresh early with a probability that grows as the expiry nears
+        # and with the time the value takes to compute.
+        if beta and entry.delta:
+            delta = entry.delta / 1000
+            if delta * beta * -math.log(1.0 - random.random()) >= fresh_ttl:
+                self.stats.incr(namespace, "early_refresh")
+                return True
+        return False
+
+    async def _claim_refresh(
+        self,
+        key: str,
+        namespace: str,
+        generation: int,
+        compute: Callable[[int], Awaitable[Any]],
+        refresh: Optional[Callable[[int], Awaitable[Any]]],
+        exit_stack: Optional[AsyncExitStack],
+    ) -> Any:
+        """Refresh `key` if no other caller is doing it already.
+
+        Returns the computed value when the refresh ran inline, otherwise
+        `NOT_REFRESHED` and the current entry should be served.
+        """
+        if key in self._in_flight:
+            return NOT_REFRESHED
+        lock_key = get_lock_key(key)
+        token = uuid4().hex
+        try:
+            locked = await self._run(
+                self.redis.set(
+                    lock_key, token, nx=True, px=int(self.lock_timeout * 1000)
+                )
+            )
+        except CacheUnavailable:
+            return NOT_REFRESHED
+        if not locked:
+            return NOT_REFRESHED
+        self.stats.incr(namespace, "refreshed")
+        if refresh is None:
+            try:
+                return await compute(generation)
+            finally:
+                await self._release_lock(lock_key, token)
+
+        async def run_refresh():
+            try:
+                await refresh(generation)
+            except Exception as e:
+                self.log(RedisEvent.FAILED_TO_REFRESH, msg=str(e), key=key)
+            finally:
+                await self._release_lock(lock_key, token)
+
+        task = asyncio.create_task(run_refresh())
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+        if exit_stack is not None:
+            exit_stack.push_async_callback(asyncio.wait, [task])
+        return NOT_REFRESHED
+
+    async def _compute_locked(
+        self,
+        key: str,
+        namespace: str,
+        generation: int,
+        compute: Callable[[int], Awaitable[Any]],
+        load: Callable[[CacheEntry, int], Any],
+        stale_while_revalidate: int = 0,
+        tags: Sequence[str] = (),
+    ) -> Any:
+        lock_key = get_lock_key(key)
+        token = uuid4().hex
+        if await self._run(
+            self.redis.set(lock_key, token, nx=True, px=int(self.lock_timeout * 1000))
+        ):
+            try:
+                self.stats.incr(namespace, "computed")
+                return await compute(generation)
+            finally:
+                await self._release_lock(lock_key, token)
+
+        # another worker is computing the value, wait for it to be populated.
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.lock_timeout
+        while loop.time() < deadline:
+            await asyncio.sleep(self.lock_poll_interval)
+            ttl, entry, generation = await self.check_cache(key, namespace, tags)
+            if entry:
+                self.stats.incr(namespace, "lock_waited")
+                return load(entry, max(ttl - stale_while_revalidate, 0))
+            if not await self._run(self.redis.exists(lock_key)):
+                break
+        self.stats.incr(namespace, "computed")
+        return await compute(generation)
+
+    async def _release_lock(self, lock_key: str, token: str) -> None:
+        """Delete `lock_key` only if it still holds `token`.
+
+        Failures are ignored, the lock then expires by itself.
+        """
+        try:
+            await self._run(self._delete_lock(lock_key, token))
+        except CacheUnavailable:  # pragma: no cover
+            pass
+
+    async def _delete_lock(self, lock_key: str, token: str) -> None:
+        if isinstance(self.redis, RedisCluster):  # pragma: no cover
+            # the cluster client has no WATCH, a lock taken over between the GET
+            # and the DEL is released early, which only costs a duplicate compute.
+            if (await self.redis.get(lock_key) or b"").decode() == token:
+                await self.redis.delete(lock_key)
+            return
+        node = self.redis
+        if isinstance(node, ShardedRedis):
+            node = node.node(lock_key)
+        async with node.pipeline() as pipe:
+            try:
+                await pipe.watch(lock_key)
+                if (await pipe.get(lock_key) or b"").decode() == token:
+                    pipe.multi()
+                    pipe.delete(lock_key)
+                    await pipe.execute()
+            except WatchError:  # pragma: no cover
+                # the lock expired and was taken by another worker meanwhile.
+                pass
+
+    def requested_resource_not_modified(self, request: Request, etag: str) -> bool:
         if not request or "If-None-Match" not in request.headers:
             return False
         check_etags = [
@@ -132,46 +885,659 @@ class Cache(metaclass=MetaSingleton):
         ]
         if len(check_etags) == 1 and check_etags[0] == "*":
             return True
-        return self.get_etag(cached_data) in check_etags
+        return etag in check_etags or f"W/{etag}" in check_etags
+
+    async def add_to_cache(
+        self,
+        key: str,
+        value: Dict,
+        expire: int,
+        generation: int = 0,
+        delta: float = 0,
+        namespace: Optional[str] = None,
+        endpoint: Optional[str] = None,
+    ) -> Optional[CacheEntry]:
+        """Store `value` under `key` and return the stored entry, or None on failure.
 
-    async def add_to_cache(self, key: str, value: Dict, expire: int) -> bool:
+        `value` may be a `Response`, whose body is stored as is, the rendered
+        JSON bytes of a response, or any object the cache's codec can encode. The
+        ETag of the body is computed here once and stored with it. Large bodies
+        are stored compressed, the returned entry always holds the plain body.
+        Writes are counted for the adaptive TTL of `endpoint`.
+        """
+        codec_id = JSON_CODEC_ID
         try:
             if isinstance(value, Response):
                 response_data = value.body
+            elif isinstance(value, bytes):
+                response_data = value
             else:
-                response_data = serialize_json(value)
+                response_data = self.codec.encode(value)
+                codec_id = self.codec.codec_id
 
         except TypeError:
-            message = f"Object of type {type(value)} is not JSON-serializable"
+            message = (
+                f"Object of type {type(value)} is not serializable with "
+                f"the {self.codec.name} codec"
+            )
             self.log(RedisEvent.FAILED_TO_CACHE_KEY, msg=message, key=key)
-            return False
-        cached = await self.redis.set(name=key, value=response_data, ex=expire)
-        if cached:
-            self.log(RedisEvent.KEY_ADDED_TO_CACHE, key=key)
-        else:  # pragma: no cover
+            return None
+        entry = CacheEntry(
+            body=response_data,
+            generation=generation,
+            delta=int(delta * 1000),
+            etag=self.get_etag(response_data),
+            codec_id=codec_id,
+        )
+        packed = self.compress(entry, namespace).pack()
+        start = perf_counter()
+        try:
+            cached = await self._run(self._set(key, packed, expire))
+        except CacheUnavailable as e:
+            self.log(RedisEvent.FAILED_TO_CACHE_KEY, msg=str(e), key=key)
+            return None
+        if not cached:  # pragma: no cover
             self.log(RedisEvent.FAILED_TO_CACHE_KEY, key=key, value=value)
-        return cached
+            return None
+        if self.local:
+            # the value may predate an invalidation, let `check_cache` reload it.
+            self.local.discard(namespace, key)
+        self.stats.observe(namespace, "set", perf_counter() - start)
+        await self._record_set(key, len(packed), expire, namespace, endpoint)
+        return entry
 
-    async def invalidate(self, pattern: str) -> bool:
-        keys_to_delete = await self.redis.keys(pattern=pattern)
-        if keys_to_delete:
-            await self.redis.delete(*keys_to_delete)
-        self.log(RedisEvent.PATTERN_INVALIDATED, pattern=pattern)
+    async def _record_set(
+        self,
+        key: str,
+        size: int,
+        expire: int,
+        namespace: Optional[str],
+        endpoint: Optional[str],
+    ) -> None:
+        """Count an entry of `size` bytes written under `key` and charge its quota."""
+        self.stats.incr(namespace, "set")
+        self.stats.incr(namespace, "bytes_written", size)
+        self._record_ttl_event(endpoint, "sets")
+        self._record_ttl_event(endpoint, "bytes", size)
+        quota = self.quotas.get(namespace)
+        if quota:
+            try:
+                await self._charge_quota(namespace, key, size, expire, quota)
+            except CacheUnavailable as e:  # pragma: no cover
+                self.log(RedisEvent.FAILED_TO_EVICT, msg=str(e), key=key)
+        self.log(RedisEvent.KEY_ADDED_TO_CACHE, key=key)
+
+    async def get_tag_epoch(self) -> int:
+        """Counter bumped by every tag invalidation, passed to `add_many_to_cache`."""
+        return int(await self._run(self.redis.get(self.get_tag_epoch_key())) or 0)
+
+    async def check_cache_many(
+        self, namespace: str, items: Sequence[Tuple[str, Sequence[str]]]
+    ) -> List[Optional[CacheEntry]]:
+        """Look up the entries of several (key, tags) pairs in one round trip.
+
+        Like `check_cache`, an entry is only returned if it was written under the
+        current generation of `namespace` and of its own tags.
+        """
+        if not items:
+            return []
+        async with self._pipeline() as pipe:
+            pipe.get(self.get_generation_key(namespace))
+            for key, tags in items:
+                for tag in tags:
+                    pipe.get(self.get_tag_key(tag))
+                pipe.get(key)
+            results = await self._run(pipe.execute())
+        namespace_generation = int(results[0] or 0)
+        position = 1
+        entries = []
+        for _, tags in items:
+            versions = results[position : position + len(tags)]
+            in_cache = results[position + len(tags)]
+            position += len(tags) + 1
+            generation = get_generation(
+                namespace_generation, (int(v or 0) for v in versions)
+            )
+            entry = CacheEntry.unpack(in_cache) if in_cache else None
+            if entry is None or entry.generation != generation:
+                entries.append(None)
+                continue
+            entries.append(self.decompress(entry, namespace))
+        found = sum(entry is not None for entry in entries)
+        self.stats.incr(namespace, "item_hit", found)
+        self.stats.incr(namespace, "item_miss", len(entries) - found)
+        return entries
+
+    async def add_many_to_cache(
+        self,
+        namespace: str,
+        items: Sequence[Tuple[str, Sequence[str], bytes]],
+        expire: int,
+        epoch: int,
+    ) -> bool:
+        """Store the JSON bodies of several (key, tags, body) items in one round trip.
+
+        Each item is stamped with the generation of `namespace` and of its own tags.
+        Nothing is stored if any tag was invalidated since `epoch` was read with
+        `get_tag_epoch`, since the bodies may predate that invalidation.
+        """
+        if not items:
+            return True
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.get(self.get_tag_epoch_key()).get(self.get_generation_key(namespace))
+            for _, tags, _ in items:
+                for tag in tags:
+                    pipe.get(self.get_tag_key(tag))
+            current_epoch, namespace_generation, *versions = await self._run(
+                pipe.execute()
+            )
+        if int(current_epoch or 0) != epoch:
+            return False
+        namespace_generation = int(namespace_generation or 0)
+        position = 0
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key, tags, body in items:
+                item_versions = versions[position : position + len(tags)]
+                position += len(tags)
+                entry = CacheEntry(
+                    body=body,
+                    generation=get_generation(
+                        namespace_generation,
+                        (int(version or 0) for version in item_versions),
+                    ),
+                )
+                pipe.set(key, self.compress(entry, namespace).pack(), ex=expire)
+            await self._run(pipe.execute())
+        self.stats.incr(namespace, "item_set", len(items))
+        return True
+
+    async def _charge_quota(
+        self, namespace: str, key: str, size: int, expire: int, quota: NamespaceQuota
+    ) -> None:
+        """Index `key` for eviction and evict if `namespace` is over its quota.
+
+        Entries that expired since are dropped from the bookkeeping first, so
+        they neither count towards the quota nor as evictions.
+        """
+        index, sizes, usage, expiry = self.get_quota_keys(namespace)
+        now = time()
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hget(sizes, key).hset(sizes, key, size).incrby(usage, size)
+            if quota.policy == EVICT_LFU:
+                # a rewritten key keeps its read count.
+                pipe.zadd(index, {key: 1}, nx=True)
+            else:
+                pipe.zadd(index, {key: now})
+            pipe.zadd(expiry, {key: now + expire}).zcard(index)
+            pipe.zrangebyscore(expiry, "-inf", now, start=0, num=EVICTION_BATCH_SIZE)
+            previous, _, used_bytes, _, _, entries, expired = await self._run(
+                pipe.execute()
+            )
+        if previous:
+            used_bytes = await self._run(self.redis.incrby(usage, -int(previous)))
+        if expired:
+            entries, used_bytes = await self._forget(namespace, expired)
+        await self._evict(namespace, quota, entries, used_bytes)
+
+    async def _forget(self, namespace: str, keys: List[bytes]) -> Tuple[int, int]:
+        """Drop `keys` from the bookkeeping of `namespace`.
+
+        Returns the entries and bytes of the namespace left.
+        """
+        index, sizes, usage, expiry = self.get_quota_keys(namespace)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hmget(sizes, keys).hdel(sizes, *keys)
+            key_sizes, *_ = await self._run(
+                pipe.zrem(index, *keys).zrem(expiry, *keys).execute()
+            )
+        freed = sum(int(size or 0) for size in key_sizes)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            used_bytes, entries = await self._run(
+                pipe.incrby(usage, -freed).zcard(index).execute()
+            )
+        return entries, used_bytes
+
+    async def _evict(
+        self, namespace: str, quota: NamespaceQuota, entries: int, used_bytes: int
+    ) -> int:
+        """Evict the lowest ranked entries of `namespace` until it fits its quota.
+
+        Popped entries that are gone already, e.g. purged or evicted by Redis,
+        are only dropped from the bookkeeping.
+        """
+        index, sizes, usage, expiry = self.get_quota_keys(namespace)
+        evicted = 0
+        while True:
+            excess = 0
+            if quota.max_entries is not None:
+                excess = entries - quota.max_entries
+            if quota.max_bytes is not None and used_bytes > quota.max_bytes:
+                # as many entries of the mean size as the excess bytes take.
+                mean_size = used_bytes / max(entries, 1)
+                excess_bytes = used_bytes - quota.max_bytes
+                excess = max(excess, math.ceil(excess_bytes / max(mean_size, 1)))
+            if excess <= 0:
+                break
+            popped = await self._run(
+                self.redis.zpopmin(index, min(excess, EVICTION_BATCH_SIZE))
+            )
+            if not popped:
+                break
+            victims = [member for member, _ in popped]
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.hmget(sizes, victims).hdel(sizes, *victims).zrem(expiry, *victims)
+                for victim in victims:
+                    pipe.exists(victim)
+                victim_sizes, _, _, *exists = await self._run(pipe.execute())
+            freed = sum(int(size or 0) for size in victim_sizes)
+            victims = [victim for victim, found in zip(victims, exists) if found]
+            async with self.redis.pipeline(transaction=False) as pipe:
+                operations = [
+                    self._run(pipe.incrby(usage, -freed).zcard(index).execute())
+                ]
+                if victims:
+                    operations.append(self._run(self._unlink(victims)))
+                (used_bytes, entries), *_ = await asyncio.gather(*operations)
+            if self.local:
+                for victim in victims:
+                    self.local.discard(namespace, victim.decode())
+            evicted += len(victims)
+        if evicted:
+            self.stats.incr(namespace, "evicted", evicted)
+        return evicted
+
+    async def get_usage(self) -> Dict[str, Dict[str, Any]]:
+        """Entries and bytes stored by every namespace with a quota, and its limits."""
+        namespaces = list(self.quotas.items())
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for namespace, _ in namespaces:
+                index, _, usage, _ = self.get_quota_keys(namespace)
+                pipe.zcard(index).get(usage)
+            results = await self._run(pipe.execute(), force=True)
+        usage = {}
+        for position, (namespace, quota) in enumerate(namespaces):
+            entries, used_bytes = results[2 * position : 2 * position + 2]
+            usage[namespace] = {
+                "entries": entries,
+                "bytes": int(used_bytes or 0),
+                "max_entries": quota.max_entries,
+                "max_bytes": quota.max_bytes,
+                "policy": quota.policy,
+                "evicted": self.stats.get(namespace, "evicted"),
+            }
+        return usage
+
+    def compress(self, entry: CacheEntry, namespace: Optional[str]) -> CacheEntry:
+        """Compress the body of `entry` if it is large enough and it pays off."""
+        size = len(entry.body)
+        if self.compressor is None or size < self.compress_threshold:
+            return entry
+        start = perf_counter()
+        body = self.compressor.compress(entry.body)
+        elapsed = perf_counter() - start
+        self.stats.incr(namespace, "compress_us", int(elapsed * 1e6))
+        if len(body) >= size:
+            return entry
+        self.stats.incr(namespace, "compressed")
+        self.stats.incr(namespace, "uncompressed_bytes", size)
+        self.stats.incr(namespace, "compressed_bytes", len(body))
+        return entry._replace(body=body, compression=self.compressor.compressor_id)
+
+    def decompress(self, entry: CacheEntry, namespace: Optional[str]) -> CacheEntry:
+        """Return `entry` with its plain body."""
+        if entry.compression == NO_COMPRESSION:
+            return entry
+        start = perf_counter()
+        body = get_compressor(entry.compression).decompress(entry.body)
+        elapsed = perf_counter() - start
+        self.stats.incr(namespace, "decompress_us", int(elapsed * 1e6))
+        return entry._replace(body=body, compression=NO_COMPRESSION)
+
+    @staticmethod
+    def decode(entry: CacheEntry) -> Any:
+        """Decode the body of `entry` with the codec that wrote it."""
+        return get_codec(entry.codec_id).decode(entry.body)
+
+    async def invalidate(self, namespace: str) -> int:
+        """Invalidate every cached entry of `namespace` in O(1).
+
+        Bumping the namespace generation makes `check_cache` treat all entries
+        written before it as missing. Their keys are unlinked later by a background
+        purge, so the request never waits on a scan of the keyspace. Every worker
+        is told over pub/sub to drop the namespace from its in-memory tier.
+
+        It is attempted even while the circuit breaker is open, since a missed
+        invalidation leaves outdated responses cached. Raises `CacheUnavailable`
+        if Redis could not be reached.
+        """
+        if self.local:
+            self.local.drop(namespace)
+        channel = self.get_invalidation_channel()
+        count_key = self.get_invalidation_count_key(namespace, get_window())
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.incr(self.get_generation_key(namespace))
+            # counted for the adaptive TTLs of the namespace
+            pipe.incr(count_key).expire(count_key, 2 * TTL_STATS_WINDOW)
+            self._mark_invalidated(pipe)
+            if namespace in self.quotas:
+                # every entry of the namespace is invalid, so is their bookkeeping.
+                for quota_key in self.get_quota_keys(namespace):
+                    pipe.delete(quota_key)
+            if self.pubsub_redis is self.redis:
+                pipe.publish(channel, namespace)
+            start = perf_counter()
+            generation, *_ = await self._run(pipe.execute(), force=True)
+            self.stats.observe(namespace, "invalidate", perf_counter() - start)
+        if self.pubsub_redis is not self.redis:  # pragma: no cover
+            await self._run(self.pubsub_redis.publish(channel, namespace), force=True)
+        self.stats.incr(namespace, "invalidated")
+        self.log(
+            RedisEvent.NAMESPACE_INVALIDATED,
+            msg=f"namespace={namespace}, generation={generation}",
+        )
+        if self.purge_on_invalidate:
+            self.schedule_purge(namespace)
+        return generation
+
+    async def invalidate_tags(self, tags: Sequence[str]) -> None:
+        """Invalidate every cached entry that depends on one of `tags`.
+
+        Bumping the version of a tag changes the generation `check_cache` expects
+        from the entries that have it, so entries of other tags in the same
+        namespace stay valid. Invalidated entries are not unlinked, they expire
+        with their TTL.
+
+        Raises `CacheUnavailable` if Redis could not be reached.
+        """
+        if not tags:
+            return
+        if self.local:
+            self.local.drop_tags(tags)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            self._bump_tags(pipe, tags)
+            await self._run(pipe.execute(), force=True)
+        await self._announce_tags(tags)
+
+    async def write_through(
+        self,
+        key: str,
+        namespace: str,
+        body: bytes,
+        expire: int,
+        tags: Sequence[str] = (),
+        invalidated_tags: Sequence[str] = (),
+        endpoint: Optional[str] = None,
+    ) -> CacheEntry:
+        """Invalidate `invalidated_tags` and store the JSON `body` under `key` at once.
+
+        The entry is stamped with the generation `check_cache` expects once the
+        tags are bumped, and the bump and the write are sent as one transaction,
+        so readers of `key` go from the old entry straight to the new one instead
+        of missing. If `namespace` or one of the `tags` of the entry is invalidated
+        by someone else meanwhile, the entry is outdated and ignored like any late
+        write. On Redis Cluster and sharded nodes the tag counters and the entry
+        live on different nodes, and the commands are only pipelined.
+
+        Raises `CacheUnavailable` if Redis could not be reached.
+        """
+        invalidated_tags = tuple(invalidated_tags)
+        if self.local:
+            self.local.drop_tags(invalidated_tags)
+            self.local.discard(namespace, key)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.get(self.get_generation_key(namespace))
+            for tag in tags:
+                pipe.get(self.get_tag_key(tag))
+            namespace_generation, *versions = await self._run(
+                pipe.execute(), force=True
+            )
+        generation = get_generation(
+            int(namespace_generation or 0),
+            (
+                int(version or 0) + (tag in invalidated_tags)
+                for tag, version in zip(tags, versions)
+            ),
+        )
+        entry = CacheEntry(body=body, generation=generation, etag=self.get_etag(body))
+        packed = self.compress(entry, namespace).pack()
+        transaction = not isinstance(self.redis, (RedisCluster, ShardedRedis))
+        async with self.redis.pipeline(transaction=transaction) as pipe:
+            if invalidated_tags:
+                self._bump_tags(pipe, invalidated_tags)
+            pipe.set(key, packed, ex=expire)
+            start = perf_counter()
+            await self._run(pipe.execute(), force=True)
+            self.stats.observe(namespace, "set", perf_counter() - start)
+        if invalidated_tags:
+            await self._announce_tags(invalidated_tags)
+        await self._record_set(key, len(packed), expire, namespace, endpoint)
+        return entry
+
+    def _bump_tags(self, pipe, tags: Sequence[str]) -> None:
+        """Queue the commands that invalidate `tags` on `pipe`."""
+        for tag in tags:
+            pipe.incr(self.get_tag_key(tag))
+            if self.pubsub_redis is self.redis:
+                pipe.publish(self.get_tag_invalidation_channel(), tag)
+        pipe.incr(self.get_tag_epoch_key())
+        self._mark_invalidated(pipe)
+
+    def _mark_invalidated(self, pipe) -> None:
+        """Queue the write `recently_invalidated` checks on `pipe`."""
+        if self.fresh_reads_window:
+            window = int(self.fresh_reads_window * 1000)
+            pipe.set(self.get_recent_invalidation_key(), 1, px=window)
+
+    async def _announce_tags(self, tags: Sequence[str]) -> None:
+        """Publish `tags` if pub/sub has its own client, then count and log them."""
+        if self.pubsub_redis is not self.redis:  # pragma: no cover
+            channel = self.get_tag_invalidation_channel()
+            async with self.pubsub_redis.pipeline(transaction=False) as pipe:
+                for tag in tags:
+                    pipe.publish(channel, tag)
+                await self._run(pipe.execute(), force=True)
+        self.stats.incr(TAGS_NAMESPACE, "invalidated", len(tags))
+        self.log(RedisEvent.TAGS_INVALIDATED, msg=f"tags={', '.join(tags)}")
+
+    async def claim_events(self, events: Sequence[str], ttl: int) -> List[bool]:
+        """Claim `events` for this worker, False for those another worker claimed.
+
+        Lets the workers that are all told of the same event handle it once.
+        Raises `CacheUnavailable` if Redis could not be reached.
+        """
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for event in events:
+                pipe.set(self.get_event_claim_key(event), 1, nx=True, ex=ttl)
+            claimed = await self._run(pipe.execute(), force=True)
+        return [bool(result) for result in claimed]
+
+    def get_ttl(
+        self, expire: AdaptiveTTL, endpoint: str, namespace: Optional[str]
+    ) -> int:
+        """TTL chosen for new entries of `endpoint` cached with `AdaptiveTTL`."""
+        return self.ttl_advisor.ttl(endpoint, namespace, expire)
+
+    def _record_ttl_event(
+        self, endpoint: Optional[str], field: str, amount: int = 1
+    ) -> None:
+        if not self.ttl_advisor.tracks(endpoint):
+            return
+        self.ttl_advisor.record(endpoint, field, amount)
+        task = self._ttl_flush_task
+        if self.ttl_advisor.flush_due() and (task is None or task.done()):
+            self._ttl_flush_task = asyncio.create_task(self.flush_ttl_stats())
+
+    async def flush_ttl_stats(self) -> None:
+        """Add the counters of this worker to Redis and recompute the adaptive TTLs.
+
+        Counters are kept in one hash per family and window; TTLs are computed
+        from the current and the previous window of every worker.
+        """
+        pending = self.ttl_advisor.take_pending()
+        families = list(self.ttl_advisor.families.items())
+        now = time()
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for family, counts in pending.items():
+                    key = self.get_ttl_stats_key(family, get_window(now))
+                    for field, amount in counts.items():
+                        pipe.hincrby(key, field, amount)
+                    pipe.expire(key, 2 * TTL_STATS_WINDOW)
+                for family, (namespace, _) in families:
+                    for window in get_windows(now):
+                        pipe.hgetall(self.get_ttl_stats_key(family, window))
+                        pipe.get(self.get_invalidation_count_key(namespace, window))
+                results = await self._run(pipe.execute())
+        except CacheUnavailable as e:
+            self.log(RedisEvent.FAILED_TO_UPDATE_TTLS, msg=str(e))
+            return
+        reads = results[len(results) - 4 * len(families) :]
+        for index, (family, _) in enumerate(families):
+            current, current_count, previous, previous_count = reads[
+                4 * index : 4 * index + 4
+            ]
+            invalidations = int(current_count or 0) + int(previous_count or 0)
+            self.ttl_advisor.update(family, (current, previous), invalidations, now)
+
+    def _start_invalidation_listener(self) -> None:
+        task = self._invalidation_listener
+        if task is not None and not task.done():
+            task.cancel()
+        self._invalidation_listener = asyncio.create_task(
+            self._listen_for_invalidations()
+        )
+
+    async def _listen_for_invalidations(self) -> None:
+        """Drop in-memory entries of namespaces and tags invalidated by any worker."""
+        channel = self.get_invalidation_channel()
+        tag_channel = self.get_tag_invalidation_channel().encode()
+        while True:
+            pubsub = self.pubsub_redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(channel, tag_channel)
+                # invalidations published while not subscribed were missed.
+                self.local.clear()
+                async for message in pubsub.listen():
+                    if message["channel"] == tag_channel:
+                        self.local.drop_tags([message["data"].decode()])
+                    else:
+                        self.local.drop(message["data"].decode())
+            except RedisError as e:  # pragma: no cover
+                self.log(RedisEvent.INVALIDATION_LISTENER_FAILED, msg=str(e))
+            finally:
+                await pubsub.close()
+            await asyncio.sleep(INVALIDATION_LISTENER_RETRY_DELAY)  # pragma: no cover
+
+    def schedule_purge(self, namespace: str) -> None:
+        """Start a background purge of `namespace`, or queue one if it is running."""
+        task = self._purge_tasks.get(namespace)
+        if task and not task.done():
+            self._purge_pending.add(namespace)
+            return
+        task = asyncio.create_task(self._purge(namespace))
+        self._purge_tasks[namespace] = task
+
+    async def _purge(self, namespace: str) -> None:
+        pattern = self.get_cache_key_pattern(namespace)
+        while True:
+            self._purge_pending.discard(namespace)
+            try:
+                generation = await self.redis.get(self.get_generation_key(namespace))
+                await self.purge(pattern, int(generation or 0))
+            except Exception as e:  # pragma: no cover
+                self.log(RedisEvent.FAILED_TO_PURGE, msg=str(e), pattern=pattern)
+                return
+            if namespace not in self._purge_pending:
+                return
+
+    async def purge(self, pattern: str, generation: Optional[int] = None) -> int:
+        """Incrementally unlink every key matching `pattern` with SCAN and UNLINK.
+
+        With the namespace `generation`, only the entries written under an older
+        one are unlinked, entries computed since the namespace was invalidated
+        are kept.
+
+        Every node of a sharded or clustered deployment is scanned.
+        """
+        unlinked = 0
+        keys: List[bytes] = []
+        async for key in self.redis.scan_iter(match=pattern, count=PURGE_SCAN_COUNT):
+            keys.append(key)
+            if len(keys) >= PURGE_SCAN_COUNT:
+                unlinked += await self._unlink_outdated(keys, generation)
+                keys = []
+        if keys:
+            unlinked += await self._unlink_outdated(keys, generation)
+        self.log(RedisEvent.PATTERN_PURGED, msg=f"unlinked={unlinked}", pattern=pattern)
+        return unlinked
+
+    async def _unlink_outdated(
+        self, keys: List[bytes], generation: Optional[int]
+    ) -> int:
+        """Unlink `keys` older than the namespace `generation`, all if it is None."""
+        if generation is None:
+            return await self._unlink(keys)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            # only the header, which holds the generation.
+            for key in keys:
+                pipe.getrange(key, 0, HEADER.size - 1)
+            headers = await pipe.execute()
+        outdated = []
+        for key, header in zip(keys, headers):
+            if not header:
+                continue  # expired meanwhile
+            written = CacheEntry.peek_generation(header)
+            if written is None or get_namespace_generation(written) < generation:
+                outdated.append(key)
+        return await self._unlink(outdated) if outdated else 0
+
+    async def _unlink(self, keys: List[bytes]) -> int:
+        if isinstance(self.redis, RedisCluster):  # pragma: no cover
+            # a multi-key UNLINK must not span hash slots.
+            unlinked = await asyncio.gather(*(self.redis.unlink(key) for key in keys))
+            return sum(unlinked)
+        return await self.redis.unlink(*keys)
 
     def set_response_headers(
         self,
         response: Response,
         cache_hit: bool,
-        response_data: Dict = None,
+        etag: str = None,
         ttl: int = None,
     ) -> None:
         response.headers[self.response_header] = "Hit" if cache_hit else "Miss"
         expires_at = datetime.utcnow() + timedelta(seconds=ttl)
         response.headers["Expires"] = expires_at.strftime(HTTP_TIME)
         response.headers["Cache-Control"] = f"max-age={ttl}"
-        response.headers["ETag"] = self.get_etag(response_data)
-        # if "last_modified" in response_data:  # pragma: no cover
-        #     response.headers["Last-Modified"] = response_data["last_modified"]
+        if etag:
+            response.headers["ETag"] = etag
+
+    def respond_from_cache(
+        self,
+        request: Request,
+        entry: CacheEntry,
+        ttl: int,
+        cache_hit: bool = True,
+        response: Optional[Response] = None,
+    ) -> Response:
+        """Answer with the stored bytes of `entry` without parsing or re-encoding them.
+
+        Requests whose `If-None-Match` already holds the entry's ETag get a 304
+        without a body. Headers set on `response` (the response FastAPI passes to
+        endpoints) are carried over.
+        """
+        if self.requested_resource_not_modified(request, entry.etag):
+            cached_response = Response(status_code=HTTPStatus.NOT_MODIFIED)
+        else:
+            cached_response = Response(content=entry.body, media_type=JSON_MEDIA_TYPE)
+        if response is not None:
+            cached_response.raw_headers.extend(
+                header
+                for header in response.raw_headers
+                if header[0] != b"content-length"
+            )
+        self.set_response_headers(cached_response, cache_hit, entry.etag, ttl)
+        return cached_response
 
     def log(
         self,
@@ -181,7 +1547,17 @@ class Cache(metaclass=MetaSingleton):
         key: Optional[str] = None,
         value: Optional[str] = None,
     ):
-        """Log `RedisEvent` using the configured `Logger` object"""
+        """Log `RedisEvent` using the configured `Logger` object
+
+        Per-key events are frequent, they are logged at DEBUG level, or at INFO
+        level for a `log_sample_rate` share of them.
+        """
+        level = logging.INFO
+        if event in PER_KEY_EVENTS:
+            if logger.isEnabledFor(logging.DEBUG):
+                level = logging.DEBUG
+            elif not self.log_sample_rate or random.random() >= self.log_sample_rate:
+                return
         message = f" {self.get_log_time()} | {event.name}"
         if msg:
             message += f": {msg}"
@@ -191,15 +1567,16 @@ class Cache(metaclass=MetaSingleton):
             message += f": pattern={pattern}"
         if value:  # pragma: no cover
             message += f", value={value}"
-        logger.info(message)
+        logger.log(level, message)
 
     @staticmethod
     def get_etag(cached_data: Union[str, bytes, Dict]) -> str:
-        if isinstance(cached_data, bytes):
-            cached_data = cached_data.decode()
-        if not isinstance(cached_data, str):
-            cached_data = serialize_json(cached_data)
-        return f"W/{hash(cached_data)}"
+        """Strong ETag from a content hash, identical in every worker and process."""
+        if isinstance(cached_data, str):
+            cached_data = cached_data.encode()
+        elif not isinstance(cached_data, bytes):
+            cached_data = serialize_json(cached_data).encode()
+        return f'"{blake2b(cached_data, digest_size=16).hexdigest()}"'
 
     @staticmethod
     def get_log_time():
@@ -0,0 +1,172 @@
+"""codec.py"""
+import dataclasses
+from abc import ABC, abstractmethod
+from base64 import b64encode
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+from pathlib import PurePath
+from types import GeneratorType
+from typing import Any, Dict, Type
+
+from pydantic import BaseModel
+
+from cache.util import deserialize_json, object_hook, serialize_json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+SPEC_TYPE_MARKER = b'"_spec_type"'
+
+
+class Codec(ABC):
+    """Encodes the values stored in the cache to bytes and decodes them back.
+
+    Every codec has a `codec_id` that is stored with each entry, so entries are
+    always decoded with the codec that wrote them. This allows switching codecs,
+    or running workers with different codecs, without flushing the cache.
+    """
+
+    codec_id: int
+    name: str
+
+    @abstractmethod
+    def encode(self, value: Any) -> bytes:
+        ...
+
+    @abstractmethod
+    def decode(self, data: bytes) -> Any:
+        ...
+
+
+class JSONCodec(Codec):
+    """The standard library `json` module, through the cache's `jsonable_encoder`."""
+
+    codec_id = 1
+    name = "json"
+
+    def encode(self, value: Any) -> bytes:
+        return serialize_json(value).encode()
+
+    def decode(self, data: bytes) -> Any:
+        return deserialize_json(data)
+
+
+class ORJSONCodec(Codec):
+    """JSON codec based on orjson, which encodes in a single pass in C."""
+
+    codec_id = 2
+    name = "orjson"
+
+    def __init__(self):
+        if orjson is None:  # pragma: no cover
+            raise ImportError("ORJSONCodec requires the orjson package")
+
+    def encode(self, value: Any) -> bytes:
+        return orjson.dumps(
+            value,
+            default=encode_special,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+        )
+
+    def decode(self, data: bytes) -> Any:
+        value = orjson.loads(data)
+        if SPEC_TYPE_MARKER in data:
+            return revive_special(value)
+        return value
+
+
+class MsgPackCodec(Codec):
+    """Binary codec based on msgpack, smaller than JSON and with native bytes."""
+
+    codec_id = 3
+    name = "msgpack"
+
+    def __init__(self):
+        if msgpack is None:  # pragma: no cover
+            raise ImportError("MsgPackCodec requires the msgpack package")
+
+    def encode(self, value: Any) -> bytes:
+        return msgpack.packb(value, default=encode_special)
+
+    def decode(self, data: bytes) -> Any:
+        return msgpack.unpackb(
+            data, object_hook=object_hook, raw=False, strict_map_key=False
+        )
+
+
+CODEC_CLASSES: Dict[int, Type[Codec]] = {
+    codec.codec_id: codec for codec in (JSONCodec, ORJSONCodec, MsgPackCodec)
+}
+_codecs: Dict[int, Codec] = {}
+
+
+def get_codec(codec_id: int) -> Codec:
+    """Return the codec that wrote entries stamped with `codec_id`."""
+    if codec_id not in _codecs:
+        try:
+            _codecs[codec_id] = CODEC_CLASSES[codec_id]()
+        except ImportError:  # pragma: no cover
+            if codec_id != ORJSONCodec.codec_id:
+                raise
+            # orjson output is plain JSON, any JSON codec can read it.
+            _codecs[codec_id] = JSONCodec()
+    return _codecs[codec_id]
+
+
+def get_default_codec() -> Codec:
+    """orjson when it is installed, otherwise the standard library JSON codec."""
+    if orjson is not None:
+        return get_codec(ORJSONCodec.codec_id)
+    return get_codec(JSONCodec.codec_id)  # pragma: no cover
+
+
+def encode_special(obj: Any) -> Any:
+    """Encode the values orjson and msgpack can not encode natively.
+
+    datetime, date, Decimal and bytes are wrapped in a `_spec_type` object, like
+    `serialize_json` does, so that they are decoded to the same type.
+    """
+    if isinstance(obj, datetime):
+        return {"_spec_type": str(datetime), "val": obj.isoformat()}
+    if isinstance(obj, date):
+        return {"_spec_type": str(date), "val": obj.isoformat()}
+    if isinstance(obj, Decimal):
+        return {"_spec_type": str(Decimal), "val": str(obj)}
+    if isinstance(obj, bytes):
+        return {"_spec_type": str(bytes), "val": b64encode(obj).decode()}
+    if isinstance(obj, BaseModel):
+        return obj.dict()
+    if isinstance(obj, Enum):
+        return obj.value
+    if isinstance(obj, PurePath):
+        return str(obj)
+    if isinstance(obj, (set, frozenset, tuple, GeneratorType)):
+        return list(obj)
+    if dataclasses.is_dataclass(obj):
+        return dataclasses.asdict(obj)
+    try:
+        # SQLAlchemy models and other plain objects, without the instance state.
+        return {
+            key: value for key, value in vars(obj).items() if not key.startswith("_sa")
+        }
+    except TypeError:
+        raise TypeError(f"Object of type {type(obj)} is not JSON-serializable")
+
+
+def revive_special(value: Any) -> Any:
+    """Decode the `_spec_type` objects nested anywhere in `value`."""
+    if isinstance(value, dict):
+        if "_spec_type" in value:
+            return object_hook(value)
+        return {key: revive_special(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [revive_special(item) for item in value]
+    return value
@@ -0,0 +1,56 @@
+"""compression.py"""
+import zlib
+from abc import ABC, abstractmethod
+from typing import Dict, Type
+
+NO_COMPRESSION = 0
+DEFAULT_COMPRESS_THRESHOLD = 1024
+DEFAULT_ZLIB_LEVEL = 1
+
+
+class Compressor(ABC):
+    """Compresses the bodies of cache entries larger than the cache's threshold.
+
+    The `compressor_id` is stored in the header of each entry, so entries are
+    always decompressed with the compressor that wrote them.
+    """
+
+    compressor_id: int
+    name: str
+
+    @abstractmethod
+    def compress(self, data: bytes) -> bytes:
+        ...
+
+    @abstractmethod
+    def decompress(self, data: bytes) -> bytes:
+        ...
+
+
+class ZlibCompressor(Compressor):
+    """zlib from the standard library. The fastest level already shrinks JSON well."""
+
+    compressor_id = 1
+    name = "zlib"
+
+    def __init__(self, level: int = DEFAULT_ZLIB_LEVEL):
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data: bytes) -> bytes:
+        return zlib.decompress(data)
+
+
+COMPRESSOR_CLASSES: Dict[int, Type[Compressor]] = {
+    compressor.compressor_id: compressor for compressor in (ZlibCompressor,)
+}
+_compressors: Dict[int, Compressor] = {}
+
+
+def get_compressor(compressor_id: int) -> Compressor:
+    """Return the compressor that wrote entries stamped with `compressor_id`."""
+    if compressor_id not in _compressors:
+        _compressors[compressor_id] = COMPRESSOR_CLASSES[compressor_id]()
+    return _compressors[compressor_id]
@@ -0,0 +1,202 @@
+"""db_listener.py"""
+import asyncio
+import json
+from typing import Dict, List, Mapping, Optional, Set, Tuple
+
+import asyncpg
+
+from cache.breaker import CacheUnavailable
+from cache.client import Cache
+from cache.enums import RedisEvent
+from cache.tags import format_tags
+from cache.types import TableInvalidation
+
+# channel notified by the triggers of `get_notify_trigger_sql`
+NOTIFY_CHANNEL = "cache_invalidation"
+NOTIFY_FUNCTION = "cache_notify"
+# setting a transaction turns off when it invalidates the cache itself
+NOTIFY_SETTING = "cache.notify"
+# seconds between checks that the listening connection is still alive
+LISTENER_KEEPALIVE_INTERVAL = 30.0
+LISTENER_RETRY_DELAY = 5.0
+# seconds the claim of a worker on an event is kept
+EVENT_CLAIM_TTL = 300
+
+
+def get_notify_function_sql() -> str:
+    """SQL creating the trigger function that notifies the listeners of a change.
+
+    The payload holds the table, the operation, the primary key of the row (the
+    column named by the first trigger argument) and the transaction id. Nothing
+    is sent by transactions that set `cache.notify` to `off`.
+    """
+    return f"""
+CREATE OR REPLACE FUNCTION {NOTIFY_FUNCTION}() RETURNS trigger AS $$
+DECLARE
+    pk text;
+BEGIN
+    IF current_setting('{NOTIFY_SETTING}', true) = 'off' THEN
+        RETURN NULL;
+    END IF;
+    IF TG_LEVEL = 'ROW' THEN
+        IF TG_OP = 'DELETE' THEN
+            pk := to_jsonb(OLD) ->> TG_ARGV[0];
+        ELSE
+            pk := to_jsonb(NEW) ->> TG_ARGV[0];
+        END IF;
+    END IF;
+    PERFORM pg_notify(
+        '{NOTIFY_CHANNEL}',
+        json_build_object(
+            'table', TG_TABLE_NAME, 'op', TG_OP, 'pk', pk, 'txid', txid_current()
+        )::text
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+def get_notify_trigger_sql(table: str, pk: str = "id") -> List[str]:
+    """SQL statements making `table` notify the listeners of its changes."""
+    return [
+        f"CREATE TRIGGER {table}_cache_notify "
+        f'AFTER INSERT OR UPDATE OR DELETE ON "{table}" '
+        f"FOR EACH ROW EXECUTE FUNCTION {NOTIFY_FUNCTION}('{pk}')",
+        f"CREATE TRIGGER {table}_cache_notify_truncate "
+        f'AFTER TRUNCATE ON "{table}" '
+        f"FOR EACH STATEMENT EXECUTE FUNCTION {NOTIFY_FUNCTION}()",
+    ]
+
+
+def get_drop_notify_trigger_sql(table: str) -> List[str]:
+    return [
+        f'DROP TRIGGER IF EXISTS {table}_cache_notify ON "{table}"',
+        f'DROP TRIGGER IF EXISTS {table}_cache_notify_truncate ON "{table}"',
+    ]
+
+
+class DatabaseListener:
+    """Translates the change notifications of Postgres into cache invalidations.
+
+    Tables opted in with `get_notify_trigger_sql` notify every change, whichever
+    process made it, and the listener invalidates the tags given for the table
+    in `tables`. Every worker listens, the first one to claim an event in Redis
+    handles it. Notifications received together are handled in one round trip.
+    Changes notified while the listener was disconnected are lost, so after a
+    reconnection every table is invalidated as if it had been truncated.
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        tables: Mapping[str, TableInvalidation],
+        channel: str = NOTIFY_CHANNEL,
+    ):
+        self.dsn = dsn
+        self.tables = dict(tables)
+        self.channel = channel
+        self._task: Optional[asyncio.Task] = None
+        self._pending: List[Dict] = []
+        self._flush_handle: Optional[asyncio.Handle] = None
+        self._handle_tasks: Set[asyncio.Task] = set()
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _listen(self) -> None:
+        connected_before = False
+        while True:
+            try:
+                connection = await asyncpg.connect(self.dsn)
+                try:
+                    await connection.add_listener(self.channel, self._on_notification)
+                    if connected_before:
+                        await self.invalidate_tables()
+                    connected_before = True
+                    while True:
+                        await asyncio.sleep(LISTENER_KEEPALIVE_INTERVAL)
+                        await connection.execute(
+                            "SELECT 1", timeout=LISTENER_RETRY_DELAY
+                        )
+                finally:
+                    await connection.close(timeout=LISTENER_RETRY_DELAY)
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError) as e:
+                Cache().log(RedisEvent.DB_LISTENER_FAILED, msg=str(e))
+            await asyncio.sleep(LISTENER_RETRY_DELAY)
+
+    def _on_notification(
+        self, connection: asyncpg.Connection, pid: int, channel: str, payload: str
+    ) -> None:
+        self._pending.append(json.loads(payload))
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_soon(self._flush)
+
+    def _flush(self) -> None:
+        self._flush_handle = None
+        events, self._pending = self._pending, []
+        task = asyncio.create_task(self.handle(events))
+        self._handle_tasks.add(task)
+        task.add_done_callback(self._handle_tasks.discard)
+
+    async def handle(self, events: List[Dict]) -> None:
+        """Invalidate the cache entries that depend on the rows of `events`."""
+        events = [event for event in events if event["table"] in self.tables]
+        redis_cache = Cache()
+        if not events or not redis_cache.connected:
+            return
+        try:
+            claimed = await redis_cache.claim_events(
+                [get_event_id(event) for event in events], EVENT_CLAIM_TTL
+            )
+            await self.invalidate(
+                redis_cache, [event for event, mine in zip(events, claimed) if mine]
+            )
+        except CacheUnavailable as e:
+            # entries of the changed rows expire with their TTL.
+            redis_cache.log(RedisEvent.FAILED_TO_INVALIDATE, msg=str(e))
+
+    async def invalidate_tables(self) -> None:
+        """Invalidate the entries of every table, whose changes may have been missed."""
+        redis_cache = Cache()
+        if not redis_cache.connected:
+            return
+        try:
+            events = [{"table": table, "op": "TRUNCATE"} for table in self.tables]
+            await self.invalidate(redis_cache, events)
+        except CacheUnavailable as e:
+            redis_cache.log(RedisEvent.FAILED_TO_INVALIDATE, msg=str(e))
+
+    async def invalidate(self, redis_cache: Cache, events: List[Dict]) -> None:
+        tags: Dict[str, None] = {}
+        namespaces: Dict[str, None] = {}
+        for event in events:
+            event_tags, namespace = self.get_invalidations(event)
+            tags.update(dict.fromkeys(event_tags))
+            if namespace is not None:
+                namespaces[namespace] = None
+        for namespace in namespaces:
+            await redis_cache.invalidate(namespace)
+        await redis_cache.invalidate_tags(list(tags))
+
+    def get_invalidations(self, event: Dict) -> Tuple[Tuple[str, ...], Optional[str]]:
+        """Tags, and the namespace if any, to invalidate for one change `event`."""
+        invalidation = self.tables[event["table"]]
+        if event["op"] == "TRUNCATE":
+            return invalidation.list_tags, invalidation.namespace
+        tags = format_tags(invalidation.row_tags, {"pk": event["pk"]})
+        if event["op"] != "UPDATE":
+            tags += invalidation.list_tags
+        return tags, None
+
+
+def get_event_id(event: Dict) -> str:
+    """Identifier of a change, the same in the notifications of every worker."""
+    return f"{event['txid']}:{event['table']}:{event['op']}:{event['pk']}"
@@ -0,0 +1,84 @@
+"""entry.py"""
+import struct
+from typing import Iterable, NamedTuple, Optional, Union
+
+FORMAT_VERSION = 5
+# format version, id of the codec of the body, id of the compressor of the body
+# (0 if it is not compressed), generation the entry was written under, milliseconds
+# it took to compute the value, length of the ETag that follows
+HEADER = struct.Struct("!BBBQIB")
+JSON_CODEC_ID = 1
+# low bits of a generation, holding the sum of the tag versions of the entry. The
+# namespace generation is held by the bits above them.
+TAG_VERSION_BITS = 32
+TAG_VERSION_MASK = (1 << TAG_VERSION_BITS) - 1
+
+
+def get_generation(namespace_generation: int, tag_versions: Iterable[int] = ()) -> int:
+    """Generation of an entry of a namespace and tags at the given versions.
+
+    Invalidating the namespace or any of the tags changes it, and the namespace
+    generation can be read back with `get_namespace_generation`.
+    """
+    namespace_part = (namespace_generation & TAG_VERSION_MASK) << TAG_VERSION_BITS
+    return namespace_part | (sum(tag_versions) & TAG_VERSION_MASK)
+
+
+def get_namespace_generation(generation: int) -> int:
+    """Namespace generation of an entry written under `generation`."""
+    return generation >> TAG_VERSION_BITS
+
+
+class CacheEntry(NamedTuple):
+    """Value stored in Redis for a cached response: a header, the ETag and the body."""
+
+    body: bytes
+    generation: int = 0
+    delta: int = 0
+    etag: str = ""
+    codec_id: int = JSON_CODEC_ID
+    compression: int = 0
+
+    def pack(self) -> bytes:
+        etag = self.etag.encode()
+        header = HEADER.pack(
+            FORMAT_VERSION,
+            self.codec_id,
+            self.compression,
+            self.generation,
+            self.delta,
+            len(etag),
+        )
+        return header + etag + self.body
+
+    @staticmethod
+    def peek_generation(data: bytes) -> Optional[int]:
+        """Return the generation in the header at the start of `data`, if any."""
+        if len(data) < HEADER.size or data[0] != FORMAT_VERSION:
+            return None
+        return HEADER.unpack_from(data)[3]
+
+    @classmethod
+    def unpack(cls, data: Union[bytes, str]) -> Optional["CacheEntry"]:
+        """Return the entry stored in `data`, None if written in another format."""
+        if isinstance(data, str):
+            data = data.encode()
+        if len(data) < HEADER.size or data[0] != FORMAT_VERSION:
+            return None
+        (
+            _,
+            codec_id,
+            compression,
+            generation,
+            delta,
+            etag_length,
+        ) = HEADER.unpack_from(data)
+        body_start = HEADER.size + etag_length
+        return cls(
+            body=data[body_start:],
+            generation=generation,
+            delta=delta,
+            etag=data[HEADER.size : body_start].decode(),
+            codec_id=codec_id,
+            compression=compression,
+        )
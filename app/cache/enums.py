@@ -19,4 +19,24 @@ class RedisEvent(IntEnum):
     KEY_ADDED_TO_CACHE = 4
     KEY_FOUND_IN_CACHE = 5
     FAILED_TO_CACHE_KEY = 6
-    PATTERN_INVALIDATED = 7
+    NAMESPACE_INVALIDATED = 7
+    PATTERN_PURGED = 8
+    FAILED_TO_PURGE = 9
+    FAILED_TO_REFRESH = 10
+    INVALIDATION_LISTENER_FAILED = 11
+    TAGS_INVALIDATED = 12
+    CACHE_UNAVAILABLE = 13
+    FAILED_TO_INVALIDATE = 14
+    CIRCUIT_OPENED = 15
+    CIRCUIT_CLOSED = 16
+    FAILED_TO_UPDATE_TTLS = 17
+    FAILED_TO_EVICT = 18
+    DB_LISTENER_FAILED = 19
+
+
+class CircuitState(IntEnum):
+    """State of the circuit breaker in front of Redis."""
+
+    CLOSED = 0
+    OPEN = 1
+    HALF_OPEN = 2
@@ -1,11 +1,13 @@
-"""cache.py"""
+"""key_gen.py"""
 from collections import OrderedDict
-from inspect import signature, Signature
-from typing import Any, Callable, Dict, List
+from hashlib import blake2b
+from inspect import Parameter, signature, Signature
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlencode
 
 from fastapi import Request, Response
 
-from cache.types import ArgType, SigParameters
+from cache.types import ArgType
 
 ALWAYS_IGNORE_ARG_TYPES = [Response, Request]
 
@@ -26,6 +28,162 @@ def get_cache_key_pattern(
     return f"{prefix}*.*(*)"
 
 
+def get_generation_key(prefix: str) -> str:
+    """Generate the key of the counter that versions every cache key under `prefix`.
+
+    The key deliberately does not match `get_cache_key_pattern`, so purging the
+    cached entries of a namespace never removes its generation.
+    """
+    return f"{prefix}#generation"
+
+
+def get_invalidation_channel(prefix: str) -> str:
+    """Generate the pub/sub channel on which invalidated namespaces are announced."""
+    return f"{prefix}#invalidations"
+
+
+def get_tag_invalidation_channel(prefix: str) -> str:
+    """Generate the pub/sub channel on which invalidated tags are announced."""
+    return f"{prefix}#invalidations:tags"
+
+
+def get_tag_key(prefix: str, tag: str) -> str:
+    """Generate the key of the counter that versions the entries tagged with `tag`."""
+    return f"{prefix}#tag:{tag}"
+
+
+def get_quota_keys(prefix: str, namespace: str) -> Tuple[str, str, str, str]:
+    """Generate the keys of the quota bookkeeping of `namespace`.
+
+    A sorted set ranks its keys for eviction, a hash holds their sizes, a
+    counter their total size and another sorted set the time they expire at.
+    """
+    base = f"{prefix}#quota:{namespace}"
+    return (f"{base}:index", f"{base}:sizes", f"{base}:bytes", f"{base}:expiry")
+
+
+def get_ttl_stats_key(prefix: str, family: str, window: int) -> str:
+    """Generate the key of the read/write counters of `family` in `window`."""
+    return f"{prefix}#ttl:{family}:{window}"
+
+
+def get_invalidation_count_key(prefix: str, namespace: str, window: int) -> str:
+    """Generate the key counting the invalidations of `namespace` in `window`."""
+    return f"{prefix}#ttl:ns:{namespace}:{window}"
+
+
+def get_func_name(func: Callable) -> str:
+    """Qualified name of `func` used in its cache keys and metrics."""
+    return f"{func.__module__}.{func.__name__}"
+
+
+def get_tag_epoch_key(prefix: str) -> str:
+    """Generate the key of the counter bumped by every tag invalidation."""
+    return f"{prefix}#tag-epoch"
+
+
+def get_recent_invalidation_key(prefix: str) -> str:
+    """Generate the key set for a while by every namespace or tag invalidation."""
+    return f"{prefix}#invalidated"
+
+
+def get_item_cache_key(
+    prefix: str, name: str, item_id: Any, vary: str = "", hash_args: bool = False
+) -> str:
+    """Generate the key of one item of a list cached by `name` in list mode."""
+    args_str = join_vary(f"id={item_id}", vary)
+    return format_cache_key(prefix, f"{name}#item", args_str, hash_args)
+
+
+def get_event_claim_key(prefix: str, event: str) -> str:
+    """Generate the key a worker sets to handle a database change `event` alone."""
+    return f"{prefix}#db-event:{event}"
+
+
+def get_lock_key(key: str) -> str:
+    """Generate the key of the lock held while the value of `key` is computed."""
+    return f"{key}#lock"
+
+
+class CacheKeyBuilder:
+    """Plan for building the cache keys of one function, compiled once per function.
+
+    The signature is inspected when the builder is created, and the arguments that
+    make up the key are selected once per set of ignored argument types instead of
+    on every call. Path operation functions are called by FastAPI with keyword
+    arguments only, which lets keys be built without binding the signature.
+    """
+
+    def __init__(self, func: Callable):
+        self.name = get_func_name(func)
+        self.signature = signature(func)
+        params = self.signature.parameters.values()
+        self.keywords_only = all(
+            param.kind in (Parameter.POSITIONAL_OR_KEYWORD, Parameter.KEYWORD_ONLY)
+            for param in params
+        )
+        self.required = frozenset(
+            param.name for param in params if param.default is Parameter.empty
+        )
+        self._ignore_arg_types: Tuple[ArgType, ...] = None
+        self._included: Tuple[Tuple[str, Any], ...] = ()
+
+    def included_args(
+        self, ignore_arg_types: Tuple[ArgType, ...]
+    ) -> Tuple[Tuple[str, Any], ...]:
+        """Return the name and default of every argument that is part of the key."""
+        if ignore_arg_types is not self._ignore_arg_types:
+            self._included = tuple(
+                (param.name, param.default)
+                for param in self.signature.parameters.values()
+                if param.annotation not in ignore_arg_types
+            )
+            self._ignore_arg_types = ignore_arg_types
+        return self._included
+
+    def get_args_str(
+        self, ignore_arg_types: Tuple[ArgType, ...], args: Tuple, kwargs: Dict
+    ) -> str:
+        """Return a string with the name and value of the args part of the key."""
+        included = self.included_args(ignore_arg_types)
+        if not args and self.keywords_only and self.required.issubset(kwargs):
+            return ",".join(
+                f"{arg}={kwargs.get(arg, default)}" for arg, default in included
+            )
+        func_args = get_func_args(self.signature, *args, **kwargs)
+        return ",".join(f"{arg}={func_args[arg]}" for arg, _ in included)
+
+
+def get_key_builder(func: Callable) -> CacheKeyBuilder:
+    """Return the `CacheKeyBuilder` of `func`, compiling it on first use."""
+    builder = getattr(func, "__cache_key_builder__", None)
+    if builder is None:
+        builder = CacheKeyBuilder(func)
+        func.__cache_key_builder__ = builder
+    return builder
+
+
+def get_ignore_arg_types(
+    ignore_arg_types: Optional[Iterable[ArgType]] = None,
+) -> Tuple[ArgType, ...]:
+    """Return `ignore_arg_types` and the types always ignored, without duplicates."""
+    return tuple(dict.fromkeys([*(ignore_arg_types or []), *ALWAYS_IGNORE_ARG_TYPES]))
+
+
+def format_cache_key(
+    prefix: str, name: str, args_str: str, hash_args: bool = False
+) -> str:
+    """Join the parts of a cache key, optionally replacing the arguments by a digest.
+
+    A hashed key has a bounded length whatever the arguments are, and still matches
+    the pattern of `get_cache_key_pattern`.
+    """
+    prefix = f"{prefix}:" if prefix else ""
+    if hash_args:
+        args_str = blake2b(args_str.encode(), digest_size=16).hexdigest()
+    return f"{prefix}{name}({args_str})"
+
+
 def get_cache_key(
     prefix: str,
     ignore_arg_types: List[ArgType],
@@ -48,18 +206,64 @@ def get_cache_key(
         `str`: Unique identifier for `func`, `*args` and `**kwargs` that can be used as a
             Redis key to retrieve cached API response data.
     """
+    builder = get_key_builder(func)
+    ignore_arg_types = get_ignore_arg_types(ignore_arg_types)
+    args_str = builder.get_args_str(ignore_arg_types, args, kwargs)
+    return format_cache_key(prefix, builder.name, args_str)
 
-    if not ignore_arg_types:
-        ignore_arg_types = []
-    ignore_arg_types.extend(ALWAYS_IGNORE_ARG_TYPES)
-    ignore_arg_types = list(set(ignore_arg_types))
-    prefix = f"{prefix}:" if prefix else ""
 
-    sig = signature(func)
-    sig_params = sig.parameters
-    func_args = get_func_args(sig, *args, **kwargs)
-    args_str = get_args_str(sig_params, func_args, ignore_arg_types)
-    return f"{prefix}{func.__module__}.{func.__name__}({args_str})"
+def get_route_cache_key(
+    prefix: str,
+    func: Callable,
+    request: Request,
+    vary: str = "",
+    hash_args: bool = False,
+) -> str:
+    """Generate a cache key for a request from its path, query and vary values.
+
+    Used by `CacheRoute`, which looks the response up before FastAPI resolves the
+    endpoint's dependencies, so the key can only depend on what the raw request
+    carries. Query parameters are sorted so that their order does not matter.
+
+    Args:
+        prefix (`str`): Customizable namespace value that will prefix all cache keys.
+        func (`Callable`): Path operation function for an API endpoint.
+        request (`Request`): Incoming request.
+        vary (`str`): Values the response varies by, e.g. "principal=42".
+        hash_args (`bool`): Replace the path, query and vary values by their digest.
+
+    Returns:
+        `str`: Redis key that matches the pattern of `get_cache_key_pattern`.
+    """
+    return get_path_cache_key(
+        prefix,
+        func,
+        request.url.path,
+        request.query_params.multi_items(),
+        vary,
+        hash_args,
+    )
+
+
+def get_path_cache_key(
+    prefix: str,
+    func: Callable,
+    path: str,
+    query: Iterable[Tuple[str, str]] = (),
+    vary: str = "",
+    hash_args: bool = False,
+) -> str:
+    """Generate the route cache key of a request of `path` and `query`."""
+    query_str = urlencode(sorted(query))
+    args_str = join_vary(f"path={path},query={query_str}", vary)
+    return format_cache_key(prefix, get_func_name(func), args_str, hash_args)
+
+
+def join_vary(args_str: str, vary: str) -> str:
+    """Append the `vary` values to the arguments part of a key."""
+    if not vary:
+        return args_str
+    return f"{args_str},{vary}" if args_str else vary
 
 
 def get_func_args(
@@ -69,16 +273,3 @@ def get_func_args(
     func_args = sig.bind(*args, **kwargs)
     func_args.apply_defaults()
     return func_args.arguments
-
-
-def get_args_str(
-    sig_params: SigParameters,
-    func_args: "OrderedDict[str, Any]",
-    ignore_arg_types: List[ArgType],
-) -> str:
-    """Return a string with the name and value of all args whose type is not included in `ignore_arg_types`"""
-    return ",".join(
-        f"{arg}={val}"
-        for arg, val in func_args.items()
-        if sig_params[arg].annotation not in ignore_arg_types
-    )
@@ -0,0 +1,292 @@
+"""listing.py"""
+import asyncio
+import json
+from inspect import Signature
+from time import perf_counter
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from fastapi import Request, Response
+from pydantic.fields import ModelField
+
+from cache.breaker import CacheUnavailable
+from app.db.context import read_fresh
+from cache.client import Cache
+from cache.entry import CacheEntry
+from cache.key_gen import get_func_name
+from cache.tags import format_tags, get_call_arguments
+from cache.types import ListCacheOptions
+from cache.util import dump_json, get_exit_stack, render_response_body
+
+
+class ListChunk(NamedTuple):
+    """One aligned chunk of a list: the ids of its items and the rest of the response.
+
+    `items` maps ids to items when they were just computed, and is None when the
+    chunk was read from the cache without its items.
+    """
+
+    ids: List[Any]
+    template: Any
+    items: Optional[Dict[Any, Any]] = None
+    ttl: int = 0
+    cache_hit: bool = False
+
+
+class ListFetcher:
+    """Serves any window of a list endpoint from chunks cached at aligned offsets.
+
+    A request for `skip`/`limit` reads the chunks of `chunk_size` items that cover
+    the window, each cached under the key of the call with the aligned `skip` and
+    `limit`, so overlapping windows share their entries. Chunks only hold the ids
+    of their items; the items are cached once each, tagged with `item_tag`, and
+    read with one round trip for the whole window. Invalidating the tag of an
+    item invalidates it in every window, without recomputing the chunks.
+    Chunks whose items are missing are computed again, without being stored.
+
+    The parts of the response besides the items are taken from the first chunk.
+    Chunks are looked up concurrently but computed one after another, as the
+    calls of one request share its arguments, e.g. its database session.
+    """
+
+    def __init__(
+        self,
+        func: Callable,
+        call: Callable[..., Awaitable[Any]],
+        namespace: Optional[str],
+        options: ListCacheOptions,
+        tags: Tuple[str, ...],
+        response_field: Optional[ModelField],
+        signature: Signature,
+        get_ttl: Callable[[], int],
+        stale_ttl: int,
+        early_refresh_beta: float,
+    ):
+        self.func = func
+        self.call = call
+        self.name = get_func_name(func)
+        self.namespace = namespace
+        self.options = options
+        self.tags = tags
+        self.response_field = response_field
+        self.signature = signature
+        self.get_ttl = get_ttl
+        self.stale_ttl = stale_ttl
+        self.early_refresh_beta = early_refresh_beta
+
+    async def fetch(
+        self,
+        redis_cache: Cache,
+        args: Tuple,
+        kwargs: Dict,
+        vary: str,
+        request: Optional[Request],
+        response: Optional[Response],
+    ) -> Any:
+        arguments = get_call_arguments(self.signature, args, kwargs)
+        skip = arguments.get(self.options.skip_arg) or 0
+        limit = arguments.get(self.options.limit_arg)
+        if not isinstance(limit, int) or limit <= 0 or skip < 0:
+            # unbounded or empty windows are not cached.
+            return await self.call(*args, **kwargs)
+
+        size = self.options.chunk_size
+        first, last = skip // size, (skip + limit - 1) // size
+        list_tags = format_tags(self.tags, arguments) if self.tags else ()
+        call_lock = asyncio.Lock()
+        chunks = await asyncio.gather(
+            *(
+                self._fetch_chunk(
+                    redis_cache, arguments, index, vary, list_tags, call_lock, request
+                )
+                for index in range(first, last + 1)
+            )
+        )
+        chunk_of: Dict[Any, int] = {}
+        for index, chunk in zip(range(first, last + 1), chunks):
+            chunk_of.update(dict.fromkeys(chunk.ids, index))
+        start = skip - first * size
+        ids = [item_id for chunk in chunks for item_id in chunk.ids]
+        ids = ids[start : start + limit]
+
+        items: Dict[Any, Any] = {}
+        for chunk in chunks:
+            items.update(chunk.items or {})
+        missing = [item_id for item_id in ids if item_id not in items]
+        if missing:
+            items.update(await self._load_items(redis_cache, missing, vary))
+        recompute = sorted(
+            {chunk_of[item_id] for item_id in ids if item_id not in items}
+        )
+        if recompute:
+            # the items are usually missing because they were invalidated.
+            with read_fresh(await redis_cache.recently_invalidated()):
+                for index in recompute:
+                    chunk = await self._compute_chunk(
+                        redis_cache, self._chunk_arguments(arguments, index), vary
+                    )
+                    items.update(chunk.items)
+            # items that left the list meanwhile are dropped from the window.
+            ids = [item_id for item_id in ids if item_id in items]
+
+        result = replace_items(
+            chunks[0].template,
+            self.options.items_field,
+            [items[item_id] for item_id in ids],
+        )
+        if request is None:
+            return result
+        body = dump_json(result)
+        entry = CacheEntry(body=body, etag=redis_cache.get_etag(body))
+        cache_hit = not recompute and all(chunk.cache_hit for chunk in chunks)
+        ttl = min(chunk.ttl for chunk in chunks)
+        return redis_cache.respond_from_cache(
+            request, entry, ttl, cache_hit=cache_hit, response=response
+        )
+
+    def _chunk_arguments(self, arguments: Dict, index: int) -> Dict:
+        size = self.options.chunk_size
+        return {
+            **arguments,
+            self.options.skip_arg: index * size,
+            self.options.limit_arg: size,
+        }
+
+    async def _fetch_chunk(
+        self,
+        redis_cache: Cache,
+        arguments: Dict,
+        index: int,
+        vary: str,
+        list_tags: Tuple[str, ...],
+        call_lock: asyncio.Lock,
+        request: Optional[Request],
+    ) -> ListChunk:
+        chunk_arguments = self._chunk_arguments(arguments, index)
+        key = redis_cache.get_cache_key(
+            self.func, self.namespace, (), chunk_arguments, vary
+        )
+
+        async def compute(generation: int) -> ListChunk:
+            # a background refresh shares the arguments, and so the session, with
+            # the chunks the request is still computing.
+            async with call_lock:
+                return await self._compute_chunk(
+                    redis_cache, chunk_arguments, vary, key, generation
+                )
+
+        def load(entry: CacheEntry, ttl: int) -> ListChunk:
+            chunk = redis_cache.decode(entry)
+            return ListChunk(chunk["ids"], chunk["template"], ttl=ttl, cache_hit=True)
+
+        return await redis_cache.fetch(
+            key,
+            self.namespace,
+            compute,
+            load,
+            stale_while_revalidate=self.stale_ttl,
+            early_refresh_beta=self.early_refresh_beta,
+            refresh=compute,
+            tags=list_tags,
+            endpoint=self.name,
+            exit_stack=get_exit_stack(request),
+        )
+
+    async def _compute_chunk(
+        self,
+        redis_cache: Cache,
+        chunk_arguments: Dict,
+        vary: str,
+        key: Optional[str] = None,
+        generation: int = 0,
+    ) -> ListChunk:
+        """Call the function for one chunk, cache its items and the chunk if `key`."""
+        try:
+            # read before the call, items must not be stamped with tag versions
+            # bumped after they were loaded.
+            epoch = await redis_cache.get_tag_epoch()
+        except CacheUnavailable:
+            epoch = None
+        start = perf_counter()
+        data = await self.call(**chunk_arguments)
+        delta = perf_counter() - start
+        body = (
+            data.body
+            if isinstance(data, Response)
+            else await render_response_body(self.response_field, data)
+        )
+        document = json.loads(body)
+        chunk_items = get_items(document, self.options.items_field)
+        template = replace_items(document, self.options.items_field, [])
+        ids = [item[self.options.id_field] for item in chunk_items]
+        ttl = self.get_ttl()
+        if key is not None:
+            await redis_cache.add_to_cache(
+                key,
+                {"ids": ids, "template": template},
+                ttl + self.stale_ttl,
+                generation,
+                delta,
+                self.namespace,
+                self.name,
+            )
+        if epoch is not None:
+            stored = [
+                (
+                    redis_cache.get_item_cache_key(
+                        self.func, self.namespace, item_id, vary
+                    ),
+                    self._item_tags(item_id),
+                    dump_json(item),
+                )
+                for item_id, item in zip(ids, chunk_items)
+            ]
+            try:
+                await redis_cache.add_many_to_cache(
+                    self.namespace, stored, ttl + self.stale_ttl, epoch
+                )
+            except CacheUnavailable:
+                pass
+        return ListChunk(ids, template, dict(zip(ids, chunk_items)), ttl)
+
+    async def _load_items(
+        self, redis_cache: Cache, ids: List[Any], vary: str
+    ) -> Dict[Any, Any]:
+        lookups = [
+            (
+                redis_cache.get_item_cache_key(
+                    self.func, self.namespace, item_id, vary
+                ),
+                self._item_tags(item_id),
+            )
+            for item_id in ids
+        ]
+        try:
+            entries = await redis_cache.check_cache_many(self.namespace, lookups)
+        except CacheUnavailable:
+            return {}
+        return {
+            item_id: json.loads(entry.body)
+            for item_id, entry in zip(ids, entries)
+            if entry is not None
+        }
+
+    def _item_tags(self, item_id: Any) -> Tuple[str, ...]:
+        if not self.options.item_tag:
+            return ()
+        return format_tags([self.options.item_tag], {self.options.id_field: item_id})
+
+
+def get_items(document: Any, items_field: Optional[str]) -> List[Any]:
+    """The list found at the dotted `items_field` of `document`, or `document`."""
+    if items_field:
+        for name in items_field.split("."):
+            document = document[name]
+    return document
+
+
+def replace_items(document: Any, items_field: Optional[str], items: List[Any]) -> Any:
+    """Copy of `document` with `items` at the dotted `items_field`."""
+    if not items_field:
+        return items
+    name, _, rest = items_field.partition(".")
+    return {**document, name: replace_items(document[name], rest or None, items)}
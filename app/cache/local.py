@@ -0,0 +1,114 @@
+"""local.py"""
+from collections import Counter, OrderedDict
+from time import monotonic
+from typing import Dict, NamedTuple, Optional, Sequence, Tuple
+
+from cache.entry import CacheEntry
+from cache.types import LocalCacheOptions
+
+
+class LocalEntry(NamedTuple):
+    entry: CacheEntry
+    expires_at: float
+    # when the entry expires in Redis, to report its remaining TTL
+    ttl_deadline: Optional[float]
+    tags: Tuple[str, ...] = ()
+
+
+class LocalCache:
+    """Bounded LRU of hot cache entries kept in the memory of one worker.
+
+    Entries are grouped by namespace so an invalidation drops a namespace at once,
+    and remember their tags so an invalidated tag drops the entries that have it.
+    Each namespace has its own size limit and TTL cap, taken from `namespaces` or
+    from `default`.
+    """
+
+    def __init__(
+        self,
+        default: Optional[LocalCacheOptions] = None,
+        namespaces: Optional[Dict[str, LocalCacheOptions]] = None,
+    ):
+        self.default = default
+        self.namespaces = namespaces or {}
+        self._entries: Dict[str, OrderedDict[str, LocalEntry]] = {}
+        self._epochs: Counter = Counter()
+        # bumped when entries of any namespace may have been dropped
+        self._global_epoch = 0
+
+    def options(self, namespace: str) -> Optional[LocalCacheOptions]:
+        """The options of `namespace`, or None if it is not cached in memory."""
+        options = self.namespaces.get(namespace, self.default)
+        if options is None or options.max_entries <= 0:
+            return None
+        return options
+
+    def epoch(self, namespace: str) -> int:
+        """Counter bumped by `drop`, read before a Redis lookup and passed to `set`."""
+        return self._epochs[namespace] + self._global_epoch
+
+    def get(self, namespace: str, key: str) -> Optional[Tuple[int, CacheEntry]]:
+        """Return the remaining Redis TTL and the entry of `key`, if it is held."""
+        entries = self._entries.get(namespace)
+        local = entries.get(key) if entries else None
+        if local is None:
+            return None
+        now = monotonic()
+        if now >= local.expires_at:
+            del entries[key]
+            return None
+        entries.move_to_end(key)
+        ttl = -1 if local.ttl_deadline is None else int(local.ttl_deadline - now)
+        return (ttl, local.entry)
+
+    def set(
+        self,
+        namespace: str,
+        key: str,
+        entry: CacheEntry,
+        ttl: int,
+        epoch: int,
+        tags: Tuple[str, ...] = (),
+    ) -> None:
+        """Hold `entry`, read from Redis with `ttl` seconds left, for a while.
+
+        Nothing is stored if `namespace` was dropped since `epoch` was read, as
+        the entry may predate the invalidation.
+        """
+        options = self.options(namespace)
+        if options is None or epoch != self.epoch(namespace):
+            return
+        now = monotonic()
+        lifetime = min(options.max_ttl, ttl) if ttl >= 0 else options.max_ttl
+        if lifetime <= 0:
+            return
+        ttl_deadline = now + ttl if ttl >= 0 else None
+        entries = self._entries.setdefault(namespace, OrderedDict())
+        entries[key] = LocalEntry(entry, now + lifetime, ttl_deadline, tags)
+        entries.move_to_end(key)
+        while len(entries) > options.max_entries:
+            entries.popitem(last=False)
+
+    def discard(self, namespace: str, key: str) -> None:
+        entries = self._entries.get(namespace)
+        if entries:
+            entries.pop(key, None)
+
+    def drop(self, namespace: str) -> None:
+        """Forget every entry of `namespace`."""
+        self._entries.pop(namespace, None)
+        self._epochs[namespace] += 1
+
+    def drop_tags(self, tags: Sequence[str]) -> None:
+        """Forget every entry tagged with one of `tags`."""
+        tags = set(tags)
+        for entries in self._entries.values():
+            dropped = [key for key, local in entries.items() if tags & set(local.tags)]
+            for key in dropped:
+                del entries[key]
+        self._global_epoch += 1
+
+    def clear(self) -> None:
+        """Forget every entry, e.g. when invalidation messages may have been missed."""
+        self._entries.clear()
+        self._global_epoch += 1
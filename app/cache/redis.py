@@ -1,35 +1,138 @@
 """redis.py"""
 import os
-from typing import Tuple
+from typing import List, Optional, Sequence, Tuple, Union
+from urllib.parse import parse_qs, unquote, urlsplit
 
 import redis.asyncio as redis
+from redis.asyncio.cluster import RedisCluster
+from redis.asyncio.sentinel import Sentinel
+
 from cache.enums import RedisStatus
+from cache.sharding import ShardedRedis
+
+CLUSTER_SCHEME = "redis+cluster"
+SENTINEL_SCHEME = "redis+sentinel"
+DEFAULT_SENTINEL_PORT = 26379
+
+RedisClient = Union[redis.Redis, RedisCluster, ShardedRedis]
+
 
+async def redis_connect(
+    host_url: Union[str, Sequence[str]],
+    connect_timeout: Optional[float] = None,
+    max_connections: Optional[int] = None,
+) -> Tuple[RedisStatus, RedisClient]:
+    """Attempt to connect to `host_url` and return a Redis client instance if successful.
 
-async def redis_connect(host_url: str) -> Tuple[RedisStatus, redis.Redis]:
-    """Attempt to connect to `host_url` and return a Redis client instance if successful."""
+    `host_url` selects the deployment:
+
+    * `redis://host:port/db`: a single node.
+    * `redis+sentinel://host1:26379,host2:26379/service_name/db`: the master of
+      `service_name`, found through the sentinels and followed on failover.
+    * `redis+cluster://host:port`: a Redis Cluster, discovered from one node.
+    * a list of `redis://` URLs: standalone nodes sharded by consistent hashing.
+
+    `max_connections` bounds the connection pool of every node.
+    """
     return (
-        await _connect(host_url)
+        await _connect(host_url, connect_timeout, max_connections)
         if os.environ.get("CACHE_ENV") != "TEST"
-        else _connect_fake()
+        else _connect_fake(host_url)
     )
 
 
 async def _connect(
-    host_url: str,
-) -> tuple[RedisStatus, redis.Redis]:  # pragma: no cover
+    host_url: Union[str, Sequence[str]],
+    connect_timeout: Optional[float] = None,
+    max_connections: Optional[int] = None,
+) -> tuple[RedisStatus, RedisClient]:  # pragma: no cover
+    options = {"socket_connect_timeout": connect_timeout}
+    if max_connections is not None:
+        options["max_connections"] = max_connections
     try:
-        redis_client = await redis.from_url(host_url)
+        redis_client = await _create_client(host_url, options)
         if await redis_client.ping():
             return (RedisStatus.CONNECTED, redis_client)
         return (RedisStatus.CONN_ERROR, None)
     except redis.AuthenticationError:
         return (RedisStatus.AUTH_ERROR, None)
-    except redis.ConnectionError:
+    except (redis.ConnectionError, redis.TimeoutError):
         return (RedisStatus.CONN_ERROR, None)
 
 
-def _connect_fake() -> Tuple[RedisStatus, redis.Redis]:
-    from fakeredis import FakeRedis
+async def _create_client(
+    host_url: Union[str, Sequence[str]], options: dict
+) -> RedisClient:  # pragma: no cover
+    if not isinstance(host_url, str):
+        return ShardedRedis(
+            [redis.from_url(url, **options) for url in host_url], names=host_url
+        )
+    scheme = urlsplit(host_url).scheme
+    if scheme == CLUSTER_SCHEME:
+        cluster = RedisCluster.from_url(
+            host_url.replace(CLUSTER_SCHEME, "redis", 1), **options
+        )
+        await cluster.initialize()
+        return cluster
+    if scheme == SENTINEL_SCHEME:
+        return _sentinel_master(host_url, options)
+    return await redis.from_url(host_url, **options)
+
+
+def _sentinel_master(host_url: str, options: dict) -> redis.Redis:  # pragma: no cover
+    url = urlsplit(host_url)
+    credentials, _, hosts = url.netloc.rpartition("@")
+    username, _, password = credentials.partition(":")
+    service_name, _, db = url.path.strip("/").partition("/")
+    sentinels: List[Tuple[str, int]] = []
+    for host in hosts.split(","):
+        name, _, port = host.partition(":")
+        sentinels.append((name, int(port or DEFAULT_SENTINEL_PORT)))
+    query = parse_qs(url.query)
+    sentinel = Sentinel(
+        sentinels,
+        sentinel_kwargs={
+            "password": query.get("sentinel_password", [None])[0],
+            "socket_connect_timeout": options["socket_connect_timeout"],
+        },
+        socket_connect_timeout=options["socket_connect_timeout"],
+    )
+    return sentinel.master_for(
+        service_name,
+        db=int(db or 0),
+        username=unquote(username) or None,
+        password=unquote(password) or None,
+        **{key: value for key, value in options.items() if key == "max_connections"},
+    )
+
+
+def _connect_fake(
+    host_url: Union[str, Sequence[str]]
+) -> Tuple[RedisStatus, RedisClient]:
+    from fakeredis import FakeServer
+    from fakeredis.aioredis import FakeRedis
 
+    if not isinstance(host_url, str):
+        # every shard is a separate server.
+        nodes = [FakeRedis(server=FakeServer()) for _ in host_url]
+        return (RedisStatus.CONNECTED, ShardedRedis(nodes, names=host_url))
     return (RedisStatus.CONNECTED, FakeRedis())
+
+
+def get_pubsub_client(client: RedisClient) -> Union[redis.Redis, ShardedRedis]:
+    """Client that publishes and subscribes to the cache's invalidation channels.
+
+    The asyncio cluster client has no pub/sub, so a connection to one node of the
+    cluster is used; cluster nodes forward published messages to each other.
+    """
+    if not isinstance(client, RedisCluster):
+        return client
+    node = client.get_default_node()  # pragma: no cover
+    kwargs = node.connection_kwargs  # pragma: no cover
+    return redis.Redis(  # pragma: no cover
+        host=node.host,
+        port=node.port,
+        username=kwargs.get("username"),
+        password=kwargs.get("password"),
+        ssl=kwargs.get("connection_class") is redis.SSLConnection,
+    )
@@ -0,0 +1,130 @@
+"""route.py"""
+from contextlib import AsyncExitStack
+from time import perf_counter
+from typing import Callable
+
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+from starlette.types import Message
+
+from cache.cache import calculate_ttl, resolve_ttl, route_cached_endpoint
+from cache.client import Cache
+from cache.entry import CacheEntry
+from cache.key_gen import get_func_name
+from cache.tags import format_tags, get_tag_fields
+from cache.util import response_is_cacheable
+
+
+class CacheRoute(APIRoute):
+    """Route class that serves `cache` hits before FastAPI resolves dependencies.
+
+    For endpoints decorated with `cache`, the key is built from the request path,
+    the sorted query string and the values the endpoint varies by (`vary_by`),
+    such as the principal returned by the cache's `principal_resolver`. A hit is
+    answered straight from Redis, so no dependency runs: no database session is
+    opened and the current user is not loaded. The endpoint's `auth_check` hook
+    runs instead, before the cache is read. Misses fall through to the normal
+    handler and successful JSON responses are stored under the same key.
+
+    Tags of the endpoint can only be resolved here from path parameters. Endpoints
+    whose tags reference other arguments, and lists cached in chunks, are left to
+    the `cache` decorator.
+
+    Use it as the `route_class` of a router:
+
+        router = APIRouter(route_class=CacheRoute)
+    """
+
+    # whether the route caches the responses of its endpoint, under route keys
+    caches_responses = False
+
+    def get_route_handler(self) -> Callable:
+        original_route_handler = super().get_route_handler()
+        options = getattr(self.endpoint, "__cache__", None)
+        if options is None:
+            return original_route_handler
+        path_params = {param.name for param in self.dependant.path_params}
+        if options.list_cache or not get_tag_fields(options.tags) <= path_params:
+            return original_route_handler
+        self.caches_responses = True
+        endpoint = self.endpoint
+        endpoint_name = get_func_name(endpoint)
+        stale_ttl = calculate_ttl(options.stale_while_revalidate)
+
+        async def custom_route_handler(request: Request) -> Response:
+            # the decorator leaves caching of this endpoint to the route.
+            token = route_cached_endpoint.set(endpoint)
+            try:
+                return await serve(request)
+            finally:
+                route_cached_endpoint.reset(token)
+
+        async def serve(request: Request) -> Response:
+            redis_cache = Cache()
+            if redis_cache.request_is_not_cacheable(
+                request
+            ) or not redis_cache.available:
+                return await original_route_handler(request)
+            vary = await redis_cache.resolve_vary(request, options.vary_by)
+            if vary is None or not await redis_cache.check_auth(
+                options.auth_check, request
+            ):
+                # the caller could not be verified, let the dependencies reject it.
+                return await original_route_handler(request)
+
+            key = redis_cache.get_route_cache_key(
+                endpoint, options.namespace, request, vary
+            )
+            tags = format_tags(options.tags, request.path_params)
+
+            def load(entry: CacheEntry, ttl: int) -> Response:
+                return redis_cache.respond_from_cache(request, entry, ttl)
+
+            async def run(request: Request, generation: int) -> Response:
+                start = perf_counter()
+                response = await original_route_handler(request)
+                delta = perf_counter() - start
+                if response_is_cacheable(response):
+                    ttl = resolve_ttl(options.expire, endpoint_name, options.namespace)
+                    entry = await redis_cache.add_to_cache(
+                        key,
+                        response,
+                        ttl + stale_ttl,
+                        generation,
+                        delta,
+                        options.namespace,
+                        endpoint_name,
+                    )
+                    if entry:
+                        redis_cache.set_response_headers(
+                            response, False, entry.etag, ttl
+                        )
+                return response
+
+            async def compute(generation: int) -> Response:
+                return await run(request, generation)
+
+            async def refresh(generation: int) -> Response:
+                # the request has been answered by now, so its dependencies get
+                # their own exit stack instead of the one FastAPI already closed.
+                async with AsyncExitStack() as stack:
+                    scope = {**request.scope, "fastapi_astack": stack}
+                    return await run(Request(scope, receive_empty_body), generation)
+
+            return await redis_cache.fetch(
+                key,
+                options.namespace,
+                compute,
+                load,
+                stale_while_revalidate=stale_ttl,
+                early_refresh_beta=options.early_refresh_beta,
+                refresh=refresh,
+                tags=tags,
+                endpoint=endpoint_name,
+            )
+
+        return custom_route_handler
+
+
+async def receive_empty_body() -> Message:
+    return {"type": "http.request", "body": b"", "more_body": False}
@@ -0,0 +1,223 @@
+"""sharding.py"""
+import asyncio
+from bisect import bisect
+from collections import defaultdict
+from hashlib import blake2b
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple, Union
+
+import redis.asyncio as redis
+
+VIRTUAL_NODES = 160
+
+
+class HashRing:
+    """Consistent hash ring that maps keys to nodes.
+
+    Every node is placed on the ring `virtual_nodes` times, so keys spread evenly
+    and adding or removing a node only moves the keys of its share of the ring.
+    """
+
+    def __init__(self, names: Sequence[str], virtual_nodes: int = VIRTUAL_NODES):
+        points = sorted(
+            (self.hash(f"{name}#{replica}"), index)
+            for index, name in enumerate(names)
+            for replica in range(virtual_nodes)
+        )
+        self._hashes = [point for point, _ in points]
+        self._nodes = [index for _, index in points]
+
+    def get_node(self, key: Union[str, bytes]) -> int:
+        """Index of the node that owns `key`."""
+        position = bisect(self._hashes, self.hash(key)) % len(self._hashes)
+        return self._nodes[position]
+
+    @staticmethod
+    def hash(value: Union[str, bytes]) -> int:
+        if isinstance(value, str):
+            value = value.encode()
+        return int.from_bytes(blake2b(value, digest_size=8).digest(), "big")
+
+
+class ShardedRedis:
+    """Standalone Redis nodes used as one cache, keys are placed by consistent hashing.
+
+    Implements the part of the `redis.asyncio.Redis` interface the cache uses.
+    Commands on a key go to the node that owns it, and pipelines run one pipeline
+    per node concurrently. Pub/sub uses the first node.
+    """
+
+    def __init__(
+        self, nodes: Sequence[redis.Redis], names: Optional[Sequence[str]] = None
+    ):
+        self.nodes = list(nodes)
+        self.ring = HashRing(names or [str(index) for index in range(len(nodes))])
+
+    def node(self, key: str) -> redis.Redis:
+        return self.nodes[self.ring.get_node(key)]
+
+    def pipeline(self, transaction: bool = True) -> "ShardedPipeline":
+        # commands on different nodes can not be transactional.
+        return ShardedPipeline(self)
+
+    async def scan_iter(
+        self, match: Optional[str] = None, count: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        for node in self.nodes:
+            async for key in node.scan_iter(match=match, count=count):
+                yield key
+
+    async def unlink(self, *keys: Union[str, bytes]) -> int:
+        groups = defaultdict(list)
+        for key in keys:
+            groups[self.ring.get_node(key)].append(key)
+        unlinked = await asyncio.gather(
+            *(self.nodes[index].unlink(*group) for index, group in groups.items())
+        )
+        return sum(unlinked)
+
+    async def ping(self) -> bool:
+        return all(await asyncio.gather(*(node.ping() for node in self.nodes)))
+
+    async def flushall(self) -> None:
+        await asyncio.gather(*(node.flushall() for node in self.nodes))
+
+    def get(self, name: str):
+        return self.node(name).get(name)
+
+    def set(self, name: str, *args, **kwargs):
+        return self.node(name).set(name, *args, **kwargs)
+
+    def exists(self, name: str):
+        return self.node(name).exists(name)
+
+    def delete(self, name: str):
+        return self.node(name).delete(name)
+
+    def incr(self, name: str):
+        return self.node(name).incr(name)
+
+    def incrby(self, name: str, amount: int = 1):
+        return self.node(name).incrby(name, amount)
+
+    def zpopmin(self, name: str, count: Optional[int] = None):
+        return self.node(name).zpopmin(name, count)
+
+    def ttl(self, name: str):
+        return self.node(name).ttl(name)
+
+    def publish(self, channel: str, message: str):
+        return self.nodes[0].publish(channel, message)
+
+    def pubsub(self, **kwargs):
+        return self.nodes[0].pubsub(**kwargs)
+
+    async def close(self) -> None:
+        await asyncio.gather(*(node.close() for node in self.nodes))
+
+
+class ShardedPipeline:
+    """Pipeline over `ShardedRedis`, returning results in the order of the commands."""
+
+    def __init__(self, sharded: ShardedRedis):
+        self.sharded = sharded
+        self._commands: List[Tuple[int, str, Tuple, Dict]] = []
+
+    async def __aenter__(self) -> "ShardedPipeline":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self._commands = []
+
+    def _add(self, node: int, command: str, *args, **kwargs) -> "ShardedPipeline":
+        self._commands.append((node, command, args, kwargs))
+        return self
+
+    def _add_key_command(
+        self, command: str, name: str, *args, **kwargs
+    ) -> "ShardedPipeline":
+        node = self.sharded.ring.get_node(name)
+        return self._add(node, command, name, *args, **kwargs)
+
+    def get(self, name: str) -> "ShardedPipeline":
+        return self._add_key_command("get", name)
+
+    def set(self, name: str, *args, **kwargs) -> "ShardedPipeline":
+        return self._add_key_command("set", name, *args, **kwargs)
+
+    def ttl(self, name: str) -> "ShardedPipeline":
+        return self._add_key_command("ttl", name)
+
+    def getrange(self, name: str, start: int, end: int) -> "ShardedPipeline":
+        return self._add_key_command("getrange", name, start, end)
+
+    def incr(self, name: str) -> "ShardedPipeline":
+        return self._add_key_command("incr", name)
+
+    def delete(self, name: str) -> "ShardedPipeline":
+        return self._add_key_command("delete", name)
+
+    def expire(self, name: str, time: int) -> "ShardedPipeline":
+        return self._add_key_command("expire", name, time)
+
+    def hincrby(self, name: str, key: str, amount: int = 1) -> "ShardedPipeline":
+        return self._add_key_command("hincrby", name, key, amount)
+
+    def hgetall(self, name: str) -> "ShardedPipeline":
+        return self._add_key_command("hgetall", name)
+
+    def hget(self, name: str, key: str) -> "ShardedPipeline":
+        return self._add_key_command("hget", name, key)
+
+    def hset(self, name: str, key: str, value) -> "ShardedPipeline":
+        return self._add_key_command("hset", name, key, value)
+
+    def hmget(self, name: str, keys: Sequence) -> "ShardedPipeline":
+        return self._add_key_command("hmget", name, keys)
+
+    def hdel(self, name: str, *keys) -> "ShardedPipeline":
+        return self._add_key_command("hdel", name, *keys)
+
+    def incrby(self, name: str, amount: int = 1) -> "ShardedPipeline":
+        return self._add_key_command("incrby", name, amount)
+
+    def zadd(self, name: str, mapping: Dict, **kwargs) -> "ShardedPipeline":
+        return self._add_key_command("zadd", name, mapping, **kwargs)
+
+    def zpopmin(self, name: str, count: Optional[int] = None) -> "ShardedPipeline":
+        return self._add_key_command("zpopmin", name, count)
+
+    def zcard(self, name: str) -> "ShardedPipeline":
+        return self._add_key_command("zcard", name)
+
+    def zrem(self, name: str, *values) -> "ShardedPipeline":
+        return self._add_key_command("zrem", name, *values)
+
+    def zrangebyscore(
+        self, name: str, min: Any, max: Any, **kwargs
+    ) -> "ShardedPipeline":
+        return self._add_key_command("zrangebyscore", name, min, max, **kwargs)
+
+    def exists(self, name: str) -> "ShardedPipeline":
+        return self._add_key_command("exists", name)
+
+    def publish(self, channel: str, message: str) -> "ShardedPipeline":
+        return self._add(0, "publish", channel, message)
+
+    async def execute(self) -> List[Any]:
+        groups: Dict[int, List[Tuple[int, str, Tuple, Dict]]] = defaultdict(list)
+        for position, (node, command, args, kwargs) in enumerate(self._commands):
+            groups[node].append((position, command, args, kwargs))
+        self._commands = []
+
+        async def run(node: int, commands: List[Tuple[int, str, Tuple, Dict]]):
+            async with self.sharded.nodes[node].pipeline(transaction=False) as pipe:
+                for _, command, args, kwargs in commands:
+                    getattr(pipe, command)(*args, **kwargs)
+                return await pipe.execute()
+
+        results: List[Any] = [None] * sum(len(group) for group in groups.values())
+        values = await asyncio.gather(*(run(*group) for group in groups.items()))
+        for commands, node_values in zip(groups.values(), values):
+            for (position, *_), value in zip(commands, node_values):
+                results[position] = value
+        return results
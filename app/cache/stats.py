@@ -0,0 +1,143 @@
+"""stats.py"""
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+)
+
+
+class Histogram:
+    """Counts of observed values per bucket, with their sum, as Prometheus does."""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """(upper bound, observations up to it) of every bucket, ending with +Inf."""
+        bounds = [f"{bucket:g}" for bucket in self.buckets] + ["+Inf"]
+        total = 0
+        cumulative = []
+        for bound, count in zip(bounds, self.counts):
+            total += count
+            cumulative.append((bound, total))
+        return cumulative
+
+
+class CacheStats:
+    """In-process event counters and latencies of the cache client.
+
+    Counters are kept per namespace, and for the events of `Cache.fetch` also per
+    endpoint. Latencies of Redis operations are kept per namespace and operation.
+    """
+
+    def __init__(self):
+        self._counters: Dict[str, Counter] = defaultdict(Counter)
+        self._endpoint_counters: Dict[str, Counter] = defaultdict(Counter)
+        self._latencies: Dict[Tuple[str, str], Histogram] = defaultdict(Histogram)
+
+    def incr(
+        self,
+        namespace: str,
+        event: str,
+        amount: int = 1,
+        endpoint: Optional[str] = None,
+    ) -> None:
+        self._counters[namespace][event] += amount
+        if endpoint:
+            self._endpoint_counters[endpoint][event] += amount
+
+    def get(self, namespace: str, event: str) -> int:
+        return self._counters[namespace][event]
+
+    def get_endpoint(self, endpoint: str, event: str) -> int:
+        return self._endpoint_counters[endpoint][event]
+
+    def observe(self, namespace: str, operation: str, seconds: float) -> None:
+        """Record that a Redis `operation` for `namespace` took `seconds`."""
+        self._latencies[(namespace, operation)].observe(seconds)
+
+    def latency(self, namespace: str, operation: str) -> Histogram:
+        return self._latencies[(namespace, operation)]
+
+    def compression_ratio(self, namespace: str) -> float:
+        """Uncompressed over stored size of the bodies `namespace` compressed."""
+        events = self._counters[namespace]
+        if not events["compressed_bytes"]:
+            return 1.0
+        return events["uncompressed_bytes"] / events["compressed_bytes"]
+
+    def hit_ratio(self, namespace: str) -> float:
+        """Share of the lookups of `namespace` answered from the cache."""
+        events = self._counters[namespace]
+        served = events["hit"] + events["stale"]
+        lookups = served + events["miss"]
+        return served / lookups if lookups else 0.0
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        return {namespace: dict(events) for namespace, events in self._counters.items()}
+
+    def render(self) -> str:
+        """All counters and latencies in the Prometheus text exposition format."""
+        lines = ["# TYPE cache_events_total counter"]
+        for namespace, events in sorted(self._counters.items(), key=_by_label):
+            for event, count in sorted(events.items()):
+                labels = _labels(namespace=namespace, event=event)
+                lines.append(f"cache_events_total{{{labels}}} {count}")
+        lines.append("# TYPE cache_endpoint_events_total counter")
+        for endpoint, events in sorted(self._endpoint_counters.items()):
+            for event, count in sorted(events.items()):
+                labels = _labels(endpoint=endpoint, event=event)
+                lines.append(f"cache_endpoint_events_total{{{labels}}} {count}")
+        lines.append("# TYPE cache_redis_latency_seconds histogram")
+        latencies = sorted(self._latencies.items(), key=_by_label)
+        for (namespace, operation), histogram in latencies:
+            labels = _labels(namespace=namespace, operation=operation)
+            for bound, count in histogram.cumulative():
+                bucket = f'{labels},le="{bound}"'
+                lines.append(f"cache_redis_latency_seconds_bucket{{{bucket}}} {count}")
+            lines.append(f"cache_redis_latency_seconds_sum{{{labels}}} {histogram.sum}")
+            lines.append(
+                f"cache_redis_latency_seconds_count{{{labels}}} {histogram.count}"
+            )
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        self._counters.clear()
+        self._endpoint_counters.clear()
+        self._latencies.clear()
+
+
+def _by_label(item: Tuple) -> str:
+    # a namespace of None, for values stored outside any namespace, sorts as "None".
+    return str(item[0])
+
+
+def _labels(**labels: str) -> str:
+    return ",".join(
+        f'{name}="{_escape(str(value or ""))}"' for name, value in labels.items()
+    )
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,32 @@
+"""tags.py"""
+import re
+from inspect import Signature
+from string import Formatter
+from typing import Any, Dict, FrozenSet, Mapping, Sequence, Tuple
+
+FIELD_ROOT = re.compile(r"[.\[]")
+
+
+def get_tag_fields(tags: Sequence[str]) -> FrozenSet[str]:
+    """Return the names of the arguments referenced by the `tags` templates.
+
+    `"user:{current_user.id}"` references the `current_user` argument.
+    """
+    return frozenset(
+        FIELD_ROOT.split(field_name, 1)[0]
+        for tag in tags
+        for _, field_name, _, _ in Formatter().parse(tag)
+        if field_name
+    )
+
+
+def format_tags(tags: Sequence[str], arguments: Mapping[str, Any]) -> Tuple[str, ...]:
+    """Fill the `tags` templates, e.g. `"user:{user_id}"`, with `arguments`."""
+    return tuple(tag.format_map(arguments) for tag in tags)
+
+
+def get_call_arguments(signature: Signature, args: Tuple, kwargs: Dict) -> Dict:
+    """Return every argument of a call by name, including defaulted ones."""
+    bound = signature.bind_partial(*args, **kwargs)
+    bound.apply_defaults()
+    return bound.arguments
@@ -1,5 +1,126 @@
+from dataclasses import dataclass, field
+from datetime import timedelta
 from inspect import Parameter
-from typing import Mapping, Type
+from typing import Awaitable, Callable, Mapping, Optional, Tuple, Type, Union
+
+from fastapi import Request
 
 ArgType = Type[object]
 SigParameters = Mapping[str, Parameter]
+AuthCheck = Callable[[Request], Union[bool, Awaitable[bool]]]
+
+# values of `vary_by`, headers are given as "header:<name>"
+VARY_PRINCIPAL = "principal"
+VARY_ROLE = "role"
+VARY_HEADER_PREFIX = "header:"
+
+# eviction policies of `NamespaceQuota`
+EVICT_LRU = "lru"
+EVICT_LFU = "lfu"
+
+
+@dataclass(frozen=True)
+class ListCacheOptions:
+    """List mode of `cache` for endpoints that return a window of an ordered list.
+
+    The list is cached in chunks of `chunk_size` items aligned on multiples of
+    `chunk_size`, whatever window (`skip_arg`, `limit_arg`) is requested. A chunk
+    holds the ids (`id_field`) of its items, the items are cached once each and
+    tagged with `item_tag`, e.g. `"user:{id}"`, filled from the item. The items
+    are found at the dotted `items_field` of the response, or are the response.
+    """
+
+    chunk_size: int = 100
+    id_field: str = "id"
+    item_tag: Optional[str] = None
+    items_field: Optional[str] = None
+    skip_arg: str = "skip"
+    limit_arg: str = "limit"
+
+
+@dataclass(frozen=True)
+class CacheOptions:
+    """Caching options attached to a function decorated with `cache`."""
+
+    namespace: str | None
+    expire: Union[int, timedelta, "AdaptiveTTL"]
+    stale_while_revalidate: int | timedelta = 0
+    early_refresh_beta: float = 0
+    tags: Tuple[str, ...] = ()
+    vary_by: Tuple[str, ...] = (VARY_PRINCIPAL,)
+    auth_check: Optional[AuthCheck] = None
+    list_cache: Optional[ListCacheOptions] = None
+
+
+@dataclass(frozen=True)
+class LocalCacheOptions:
+    """Limits of the in-process cache tier of a namespace.
+
+    `max_entries` bounds the number of entries each worker keeps, 0 disables the
+    tier. `max_ttl` caps the seconds an entry is served from memory, which also
+    bounds how stale it can be if an invalidation message is missed.
+    """
+
+    max_entries: int = 128
+    max_ttl: float = 5.0
+
+
+@dataclass(frozen=True)
+class AdaptiveTTL:
+    """Bounds of a TTL chosen from the traffic of the cached function.
+
+    Passed as `expire` to `cache`. The TTL stays within `min_ttl` and `max_ttl`
+    seconds; families whose entries serve at least one hit per
+    `byte_seconds_per_hit` bytes stored for a second get `max_ttl`, less
+    efficient ones less, and entries never outlive the observed interval between
+    invalidations. `initial_ttl` is used until traffic was observed, and defaults
+    to `min_ttl`.
+    """
+
+    min_ttl: int = 60
+    max_ttl: int = 86400
+    initial_ttl: Optional[int] = None
+    byte_seconds_per_hit: float = 60 * 1024
+
+
+@dataclass(frozen=True)
+class NamespaceQuota:
+    """Budget of a namespace in Redis, enforced by evicting its own entries.
+
+    When a write takes the namespace over `max_entries` entries or `max_bytes`
+    stored bytes, the least recently (`EVICT_LRU`) or least frequently
+    (`EVICT_LFU`) read entries of the namespace are evicted. None leaves a limit
+    unbounded.
+    """
+
+    max_entries: Optional[int] = None
+    max_bytes: Optional[int] = None
+    policy: str = EVICT_LRU
+
+
+@dataclass(frozen=True)
+class WriteThrough:
+    """Cached endpoint whose entry a write replaces with the value it returns.
+
+    Passed to `invalidate`. `endpoint` is the function decorated with `cache`,
+    its arguments are taken by name from the write, or formatted from the
+    templates of `arguments`, e.g. `{"user_id": "{current_user.id}"}`.
+    """
+
+    endpoint: Callable
+    arguments: Mapping[str, str] = field(default_factory=dict)
+
+
+@dataclass(frozen=True)
+class TableInvalidation:
+    """Cache entries that depend on the rows of a table, for `DatabaseListener`.
+
+    `row_tags` are invalidated when a row changes, formatted with its primary key
+    as `{pk}`, e.g. `"user:{pk}"`. `list_tags` are also invalidated when rows are
+    inserted or deleted. Truncating the table, or missing its notifications while
+    disconnected, invalidates `namespace` and `list_tags`.
+    """
+
+    row_tags: Tuple[str, ...] = ()
+    list_tags: Tuple[str, ...] = ()
+    namespace: Optional[str] = None
@@ -1,4 +1,5 @@
 from base64 import b64decode, b64encode
+from contextlib import AsyncExitStack
 from functools import partial
 import json
 from datetime import date, datetime
@@ -15,9 +16,22 @@ from pathlib import PurePath
 from types import GeneratorType
 from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Union
 
+from fastapi import Request
+from fastapi.dependencies.utils import get_typed_return_annotation
+from fastapi.responses import JSONResponse, Response
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
 from pydantic import BaseModel
+from pydantic.fields import ModelField
 from pydantic.json import ENCODERS_BY_TYPE
+from pydantic.utils import lenient_issubclass
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+CACHEABLE_MEDIA_TYPE = "application/json"
 DATETIME_AWARE = "%m/%d/%Y %I:%M:%S %p %z"
 DATE_ONLY = "%m/%d/%Y"
 
@@ -64,6 +78,49 @@ def deserialize_json(json_str):
     return json.loads(json_str, object_hook=object_hook)
 
 
+def get_response_field(func: Callable) -> Optional[ModelField]:
+    """Build the response field FastAPI derives from the return annotation of `func`."""
+    annotation = get_typed_return_annotation(func)
+    if annotation is None or lenient_issubclass(annotation, Response):
+        return None
+    try:
+        return create_response_field(name=f"Response_{func.__name__}", type_=annotation)
+    except Exception:
+        return None
+
+
+async def render_response_body(field: Optional[ModelField], content: Any) -> bytes:
+    """Render `content` to the JSON bytes FastAPI would send for a response `field`.
+
+    Validating through the response model keeps fields it excludes (such as
+    hashed passwords) out of the cache, so hits can be sent as stored.
+    """
+    content = await serialize_response(field=field, response_content=content)
+    return dump_json(content)
+
+
+def dump_json(content: Any) -> bytes:
+    """Render JSON-compatible `content` like `JSONResponse`, with orjson if there."""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return JSONResponse(content).body
+
+
+def get_exit_stack(request: Optional[Request]) -> Optional[AsyncExitStack]:
+    """Return the exit stack closing the dependencies of `request`, if any."""
+    if request is None:
+        return None
+    return request.scope.get("fastapi_astack")
+
+
+def response_is_cacheable(response: Response) -> bool:
+    return (
+        response.status_code == 200
+        and hasattr(response, "body")
+        and response.headers.get("content-type", "").startswith(CACHEABLE_MEDIA_TYPE)
+    )
+
+
 SetIntStr = Set[Union[int, str]]
 DictIntStrAny = Dict[Union[int, str], Any]
 
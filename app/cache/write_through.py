@@ -0,0 +1,116 @@
+"""write_through.py"""
+from inspect import signature
+from typing import Any, Callable, Dict, Optional, Sequence
+
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+from pydantic import ValidationError
+
+from cache.client import Cache
+from cache.entry import CacheEntry
+from cache.enums import RedisEvent
+from cache.key_gen import get_func_name
+from cache.tags import format_tags
+from cache.types import CacheOptions, WriteThrough
+from cache.util import get_response_field, render_response_body, response_is_cacheable
+
+
+class EntryWriter:
+    """Stores the value returned by a write as the entry of a cached endpoint.
+
+    The entry is the one the endpoint would cache for the arguments of the write,
+    under the route key if a `CacheRoute` caches the endpoint, and under the key
+    of the decorator otherwise. Only endpoints whose entries are shared by every
+    caller (no `vary_by`) and that are not lists cached in chunks qualify.
+    """
+
+    def __init__(
+        self,
+        target: WriteThrough,
+        options: CacheOptions,
+        get_ttl: Callable[[], int],
+        stale_ttl: int,
+    ):
+        self.endpoint = target.endpoint
+        self.name = get_func_name(target.endpoint)
+        if options.vary_by or options.list_cache:
+            raise ValueError(
+                f"{self.name} can not be written through, its entries vary by "
+                "the caller or are chunks of a list"
+            )
+        self.templates = dict(target.arguments)
+        self.options = options
+        self.parameters = tuple(signature(target.endpoint).parameters)
+        self.response_field = get_response_field(target.endpoint)
+        self.get_ttl = get_ttl
+        self.stale_ttl = stale_ttl
+
+    async def write(
+        self,
+        redis_cache: Cache,
+        arguments: Dict,
+        value: Any,
+        request: Optional[Request],
+        invalidated_tags: Sequence[str],
+    ) -> Optional[CacheEntry]:
+        """Store `value`, returned by a write called with `arguments`, and bump tags.
+
+        Returns None, having changed nothing, if `value` is not a successful JSON
+        response of the endpoint.
+        """
+        if isinstance(value, Response):
+            if not response_is_cacheable(value):
+                return None
+            body = value.body
+        else:
+            try:
+                body = await render_response_body(self.response_field, value)
+            except ValidationError as e:
+                redis_cache.log(RedisEvent.FAILED_TO_CACHE_KEY, msg=str(e))
+                return None
+        call_arguments = self.get_arguments(arguments)
+        return await redis_cache.write_through(
+            self.get_key(redis_cache, call_arguments, request),
+            self.options.namespace,
+            body,
+            self.get_ttl() + self.stale_ttl,
+            format_tags(self.options.tags, call_arguments),
+            invalidated_tags,
+            self.name,
+        )
+
+    def get_arguments(self, arguments: Dict) -> Dict:
+        """Arguments of the endpoint, from the `arguments` of the write."""
+        values = {
+            **arguments,
+            **{
+                name: template.format_map(arguments)
+                for name, template in self.templates.items()
+            },
+        }
+        return {name: values[name] for name in self.parameters if name in values}
+
+    def get_key(
+        self, redis_cache: Cache, arguments: Dict, request: Optional[Request]
+    ) -> str:
+        route = self.get_route(request) if request is not None else None
+        if route is None:
+            return redis_cache.get_cache_key(
+                self.endpoint, self.options.namespace, (), arguments
+            )
+        path_params = {name: arguments[name] for name in route.param_convertors}
+        path = request.scope.get("root_path", "") + route.url_path_for(
+            route.name, **path_params
+        )
+        return redis_cache.get_path_cache_key(
+            self.endpoint, self.options.namespace, path
+        )
+
+    def get_route(self, request: Request) -> Optional[APIRoute]:
+        """The route of the app that caches the responses of the endpoint, if any."""
+        for route in request.app.routes:
+            if getattr(route, "endpoint", None) is self.endpoint and getattr(
+                route, "caches_responses", False
+            ):
+                return route
+        return None
@@ -0,0 +1,99 @@
+"""
+Microbenchmark of cache key generation.
+
+Compares the per-call cost of the original key generation, which inspected and
+bound the signature on every call, with the precompiled `CacheKeyBuilder`.
+
+run
+```shell
+poetry run python -m tests.benchmarks.bench_key_gen
+```
+"""
+from inspect import signature
+from timeit import repeat
+
+from fastapi import Request, Response
+
+from cache.key_gen import (
+    ALWAYS_IGNORE_ARG_TYPES,
+    format_cache_key,
+    get_ignore_arg_types,
+    get_key_builder,
+)
+
+CALLS = 100_000
+
+
+class Session:
+    pass
+
+
+class User:
+    pass
+
+
+async def read_users(
+    db: Session, skip: int = 0, limit: int = 100, current_user: User = None
+):
+    pass
+
+
+KWARGS = {"db": Session(), "skip": 0, "limit": 100, "current_user": User()}
+IGNORE_ARG_TYPES = [Request, Response, Session, User]
+
+
+def legacy_get_cache_key(prefix, ignore_arg_types, func, *args, **kwargs) -> str:
+    """Key generation as it was before the builders, minus the list mutation."""
+    ignore_arg_types = list(set([*ignore_arg_types, *ALWAYS_IGNORE_ARG_TYPES]))
+    prefix = f"{prefix}:" if prefix else ""
+    sig = signature(func)
+    func_args = sig.bind(*args, **kwargs)
+    func_args.apply_defaults()
+    args_str = ",".join(
+        f"{arg}={val}"
+        for arg, val in func_args.arguments.items()
+        if sig.parameters[arg].annotation not in ignore_arg_types
+    )
+    return f"{prefix}{func.__module__}.{func.__name__}({args_str})"
+
+
+def compiled_get_cache_key(prefix, ignore_arg_types, func, hash_args, **kwargs) -> str:
+    builder = get_key_builder(func)
+    args_str = builder.get_args_str(ignore_arg_types, (), kwargs)
+    return format_cache_key(prefix, builder.name, args_str, hash_args)
+
+
+def per_call_us(stmt) -> float:
+    return min(repeat(stmt, number=CALLS, repeat=5)) / CALLS * 1_000_000
+
+
+def main() -> None:
+    ignore_arg_types = get_ignore_arg_types(IGNORE_ARG_TYPES)
+    results = {
+        "legacy": per_call_us(
+            lambda: legacy_get_cache_key(
+                "api-cache|user", IGNORE_ARG_TYPES, read_users, **KWARGS
+            )
+        ),
+        "compiled": per_call_us(
+            lambda: compiled_get_cache_key(
+                "api-cache|user", ignore_arg_types, read_users, False, **KWARGS
+            )
+        ),
+        "compiled+hashed": per_call_us(
+            lambda: compiled_get_cache_key(
+                "api-cache|user", ignore_arg_types, read_users, True, **KWARGS
+            )
+        ),
+    }
+    for name, cost in results.items():
+        print(f"{name:>16}: {cost:6.2f} us/call")
+    assert legacy_get_cache_key(
+        "api-cache|user", IGNORE_ARG_TYPES, read_users, **KWARGS
+    ) == compiled_get_cache_key(
+        "api-cache|user", ignore_arg_types, read_users, False, **KWARGS
+    )
+
+
+if __name__ == "__main__":
+    main()
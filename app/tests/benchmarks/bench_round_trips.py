@@ -0,0 +1,133 @@
+"""
+Database round trips of the write endpoints of users.
+
+Counts the statements, BEGINs and COMMITs sent to Postgres by the database work
+of each endpoint, as it was before the writes returned their rows (existence
+check, INSERT/UPDATE, COMMIT, then a SELECT to refresh the object) and as it is
+with `INSERT/UPDATE ... RETURNING`. Runs against the test database, whose
+tables it creates and drops.
+
+run
+```shell
+poetry run python -m tests.benchmarks.bench_round_trips
+```
+"""
+import asyncio
+from typing import Awaitable, Callable
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, models, schemas
+from app.core.config import settings
+from app.core.security import get_password_hash
+from app.db.base_class import Base
+
+Scenario = Callable[[AsyncSession, int], Awaitable[None]]
+
+
+class RoundTrips:
+    """Counts the round trips made through an engine."""
+
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self.add)
+        event.listen(engine, "begin", self.add)
+        event.listen(engine, "commit", self.add)
+
+    def add(self, *args, **kwargs) -> None:
+        self.count += 1
+
+
+async def legacy_create_user(db: AsyncSession, index: int) -> None:
+    user_in = schemas.UserCreate(
+        email=f"legacy{index}@example.com", password="password"
+    )
+    if await crud.user.get_by_email(db, email=user_in.email):
+        return
+    user = models.User(
+        email=user_in.email, hashed_password=get_password_hash(user_in.password)
+    )
+    db.add(user)
+    await db.commit()
+    await db.refresh(user)
+
+
+async def create_user(db: AsyncSession, index: int) -> None:
+    user_in = schemas.UserCreate(email=f"user{index}@example.com", password="password")
+    await crud.user.create(db, obj_in=user_in)
+
+
+async def legacy_update_user(db: AsyncSession, index: int) -> None:
+    user = await crud.user.get(db, id=index)
+    user.full_name = f"Legacy {index}"
+    db.add(user)
+    await db.commit()
+    await db.refresh(user)
+
+
+async def update_user(db: AsyncSession, index: int) -> None:
+    await crud.user.update_by_id(
+        db, id=index, obj_in=schemas.UserUpdate(full_name=f"User {index}")
+    )
+
+
+async def legacy_update_user_me(db: AsyncSession, index: int) -> None:
+    user = await crud.user.get(db, id=index)
+    user.full_name = f"Legacy me {index}"
+    db.add(user)
+    await db.commit()
+    await db.refresh(user)
+
+
+async def update_user_me(db: AsyncSession, index: int) -> None:
+    # the current user is loaded by the authentication dependency.
+    user = await crud.user.get(db, id=index)
+    await crud.user.update(
+        db, db_obj=user, obj_in=schemas.UserUpdate(full_name=f"Me {index}")
+    )
+
+
+SCENARIOS: dict[str, tuple[Scenario, Scenario]] = {
+    "POST /users/": (legacy_create_user, create_user),
+    "PUT /users/{user_id}": (legacy_update_user, update_user),
+    "PUT /users/update/me": (legacy_update_user_me, update_user_me),
+}
+
+
+async def run(calls: int = 1) -> dict[str, tuple[float, float]]:
+    url = str(settings.SQLALCHEMY_TEST_DATABASE_URI).replace(
+        "postgresql://", "postgresql+asyncpg://", 1
+    )
+    engine = create_async_engine(url)
+    round_trips = RoundTrips(engine.sync_engine)
+    session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    results = {}
+    for name, (legacy, current) in SCENARIOS.items():
+        counts = []
+        for scenario in (legacy, current):
+            round_trips.count = 0
+            for index in range(1, calls + 1):
+                async with session() as db:
+                    await scenario(db, index)
+            counts.append(round_trips.count / calls)
+        results[name] = (counts[0], counts[1])
+    await engine.dispose()
+    return results
+
+
+def main() -> None:
+    engine = create_engine(settings.SQLALCHEMY_TEST_DATABASE_URI)
+    Base.metadata.create_all(engine)
+    try:
+        results = asyncio.run(run(calls=10))
+    finally:
+        Base.metadata.drop_all(engine)
+    print(f"{'endpoint':>24}  {'legacy':>6}  {'returning':>9}")
+    for name, (legacy, current) in results.items():
+        print(f"{name:>24}  {legacy:6.1f}  {current:9.1f}")
+
+
+if __name__ == "__main__":
+    main()
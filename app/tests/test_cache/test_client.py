@@ -0,0 +1,572 @@
+import asyncio
+import os
+
+from redis.asyncio import Redis
+
+from app.db.context import fresh_reads
+from cache import Cache, cache
+from cache.compression import ZlibCompressor
+from cache.entry import CacheEntry, get_namespace_generation
+from cache.enums import CircuitState
+from cache.key_gen import get_func_name
+from cache.types import (
+    AdaptiveTTL,
+    ListCacheOptions,
+    LocalCacheOptions,
+    NamespaceQuota,
+)
+
+os.environ["CACHE_ENV"] = "TEST"
+
+
+async def init_cache() -> Cache:
+    redis_cache = Cache()
+    await redis_cache.init(host_url="redis://localhost", prefix="test-client")
+    await redis_cache.redis.flushall()
+    return redis_cache
+
+
+def test_invalidate_bumps_generation_and_purges_keys():
+    async def scenario():
+        redis_cache = await init_cache()
+        key = "test-client|users:module.func(id=1)"
+        _, entry, generation = await redis_cache.check_cache(key, "users")
+        assert entry is None
+        await redis_cache.add_to_cache(key, {"id": 1}, 60, generation)
+
+        _, entry, _ = await redis_cache.check_cache(key, "users")
+        assert redis_cache.decode(entry) == {"id": 1}
+
+        await redis_cache.invalidate("users")
+        _, entry, new_generation = await redis_cache.check_cache(key, "users")
+        assert entry is None
+        assert get_namespace_generation(new_generation) == 1
+
+        await asyncio.gather(*redis_cache._purge_tasks.values())
+        assert not await redis_cache.redis.exists(key)
+        assert await redis_cache.redis.exists(redis_cache.get_generation_key("users"))
+
+    asyncio.run(scenario())
+
+
+def test_purge_keeps_entries_written_after_the_invalidation():
+    async def scenario():
+        redis_cache = await init_cache()
+        old_key = "test-client|users:module.func(id=5)"
+        new_key = "test-client|users:module.func(id=6)"
+        _, _, generation = await redis_cache.check_cache(old_key, "users", ["user:5"])
+        await redis_cache.add_to_cache(old_key, {"id": 5}, 60, generation)
+
+        redis_cache.purge_on_invalidate = False
+        await redis_cache.invalidate("users")
+        _, _, generation = await redis_cache.check_cache(new_key, "users", ["user:6"])
+        await redis_cache.add_to_cache(new_key, {"id": 6}, 60, generation)
+        redis_cache.schedule_purge("users")
+        await asyncio.gather(*redis_cache._purge_tasks.values())
+
+        assert not await redis_cache.redis.exists(old_key)
+        _, entry, _ = await redis_cache.check_cache(new_key, "users", ["user:6"])
+        assert redis_cache.decode(entry) == {"id": 6}
+
+    asyncio.run(scenario())
+
+
+def test_entry_written_under_old_generation_is_ignored():
+    async def scenario():
+        redis_cache = await init_cache()
+        key = "test-client|users:module.func(id=2)"
+        _, _, generation = await redis_cache.check_cache(key, "users")
+        # the namespace is invalidated while the value is being computed
+        await redis_cache.invalidate("users")
+        await redis_cache.add_to_cache(key, {"id": 2}, 60, generation)
+
+        _, entry, _ = await redis_cache.check_cache(key, "users")
+        assert entry is None
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_misses_compute_once():
+    async def scenario():
+        redis_cache = await init_cache()
+        key = "test-client|users:module.func(id=3)"
+        computed = []
+
+        async def compute(generation):
+            computed.append(generation)
+            await asyncio.sleep(0.01)
+            await redis_cache.add_to_cache(key, {"id": 3}, 60, generation)
+            return {"id": 3}
+
+        def load(entry, ttl):
+            return {"id": 3}
+
+        results = await asyncio.gather(
+            *(redis_cache.fetch(key, "users", compute, load) for _ in range(10))
+        )
+        assert results == [{"id": 3}] * 10
+        assert len(computed) == 1
+        assert redis_cache.stats.get("users", "coalesced") == 9
+
+    asyncio.run(scenario())
+
+
+def test_miss_waits_for_value_computed_by_another_worker():
+    async def scenario():
+        redis_cache = await init_cache()
+        key = "test-client|users:module.func(id=4)"
+        await redis_cache.redis.set(f"{key}#lock", "other-worker", px=1000)
+
+        async def other_worker():
+            await asyncio.sleep(0.02)
+            await redis_cache.add_to_cache(key, {"id": 4}, 60)
+
+        async def compute(generation):
+            raise AssertionError("the value is computed by the other worker")
+
+        _, result = await asyncio.gather(
+            other_worker(),
+            redis_cache.fetch(key, "users", compute, lambda entry, ttl: entry),
+        )
+        assert redis_cache.decode(result) == {"id": 4}
+        assert redis_cache.stats.get("users", "lock_waited") == 1
+
+    asyncio.run(scenario())
+
+
+def test_stale_entry_is_served_while_refreshed_in_background():
+    async def scenario():
+        redis_cache = await init_cache()
+        key = "test-client|users:module.func(id=5)"
+        # 30 seconds left of a 60 seconds grace window: the entry is stale
+        await redis_cache.add_to_cache(key, {"version": 1}, 30)
+        refreshed = asyncio.Event()
+
+        async def compute(generation):
+            raise AssertionError("stale entries are not computed inline")
+
+        async def refresh(generation):
+            await redis_cache.add_to_cache(key, {"version": 2}, 120, generation)
+            refreshed.set()
+
+        def load(entry, ttl):
+            return redis_cache.decode(entry), ttl
+
+        result = await redis_cache.fetch(
+            key,
+            "users",
+            compute,
+            load,
+            stale_while_revalidate=60,
+            refresh=refresh,
+        )
+        assert result == ({"version": 1}, 0)
+
+        await asyncio.wait_for(refreshed.wait(), 1)
+        result = await redis_cache.fetch(
+            key, "users", compute, load, stale_while_revalidate=60, refresh=refresh
+        )
+        assert result == ({"version": 2}, 60)
+        assert redis_cache.stats.get("users", "refreshed") == 1
+
+    asyncio.run(scenario())
+
+
+def test_stale_decorated_entry_is_served_before_it_is_refreshed():
+    async def scenario():
+        redis_cache = await init_cache()
+        versions = [1, 2]
+        computing = asyncio.Event()
+
+        @cache(namespace="reports", expire=60, stale_while_revalidate=60)
+        async def read_report(report_id: int):
+            version = versions.pop(0)
+            if version > 1:
+                await computing.wait()
+            return {"id": report_id, "version": version}
+
+        assert await read_report(report_id=1) == {"id": 1, "version": 1}
+        key = redis_cache.get_cache_key(
+            read_report.__wrapped__, "reports", (), {"report_id": 1}
+        )
+        # 30 seconds left of the grace window: the entry is stale
+        await redis_cache.redis.expire(key, 30)
+
+        # the refresh is still computing when the stale entry is returned
+        stale = await asyncio.wait_for(read_report(report_id=1), 1)
+        assert stale == {"id": 1, "version": 1}
+        assert redis_cache._refresh_tasks
+
+        computing.set()
+        await asyncio.gather(*redis_cache._refresh_tasks)
+        assert await read_report(report_id=1) == {"id": 1, "version": 2}
+        assert redis_cache.stats.get("reports", "refreshed") == 1
+
+    asyncio.run(scenario())
+
+
+def test_large_values_are_stored_compressed():
+    async def scenario():
+        redis_cache = await init_cache()
+        key = "test-client|users:module.func(limit=100)"
+        users = [{"id": i, "email": f"user{i}@example.com"} for i in range(100)]
+        entry = await redis_cache.add_to_cache(key, users, 60, namespace="users")
+
+        stored = CacheEntry.unpack(await redis_cache.redis.get(key))
+        assert stored.compression == ZlibCompressor.compressor_id
+        assert len(stored.body) < len(entry.body)
+
+        _, cached, _ = await redis_cache.check_cache(key, "users")
+        assert cached.body == entry.body
+        assert redis_cache.decode(cached) == users
+        assert redis_cache.stats.compression_ratio("users") > 1
+
+    asyncio.run(scenario())
+
+
+def test_local_tier_is_dropped_when_another_worker_invalidates():
+    async def scenario():
+        redis_cache = Cache()
+        await redis_cache.init(
+            host_url="redis://localhost",
+            prefix="test-client",
+            local_cache=LocalCacheOptions(max_entries=2, max_ttl=60),
+        )
+        await redis_cache.redis.flushall()
+        await asyncio.sleep(0.01)  # let the invalidation listener subscribe
+        key = "test-client|users:module.func(id=6)"
+        await redis_cache.add_to_cache(key, {"id": 6}, 60, namespace="users")
+        await redis_cache.check_cache(key, "users")
+
+        await redis_cache.redis.delete(key)
+        _, entry, _ = await redis_cache.check_cache(key, "users")
+        assert redis_cache.decode(entry) == {"id": 6}
+        assert redis_cache.stats.get("users", "local_hit") == 1
+
+        # another worker bumps the generation and announces it
+        await redis_cache.redis.incr(redis_cache.get_generation_key("users"))
+        await redis_cache.redis.publish(redis_cache.get_invalidation_channel(), "users")
+        await asyncio.sleep(0.01)
+        _, entry, _ = await redis_cache.check_cache(key, "users")
+        assert entry is None
+
+    asyncio.run(scenario())
+
+
+def test_cache_is_bypassed_while_redis_fails():
+    async def scenario():
+        redis_cache = Cache()
+        await redis_cache.init(
+            host_url="redis://localhost",
+            prefix="test-client",
+            failure_threshold=1,
+            reset_timeout=60,
+        )
+        # nothing listens on port 1
+        redis_cache.redis = Redis(port=1)
+        computed = []
+
+        async def compute(generation):
+            computed.append(generation)
+            return "computed"
+
+        result = await redis_cache.fetch(
+            "test-client|users:module.func(id=7)", "users", compute, None
+        )
+
+        assert result == "computed"
+        assert computed == [0]
+        assert redis_cache.stats.get("users", "bypassed") == 1
+        assert redis_cache.breaker.state == CircuitState.OPEN
+        assert not redis_cache.available
+
+    asyncio.run(scenario())
+
+
+def test_sharded_nodes_share_generations_and_purges():
+    async def scenario():
+        redis_cache = Cache()
+        await redis_cache.init(
+            host_url=["redis://node-1", "redis://node-2", "redis://node-3"],
+            prefix="test-client",
+        )
+        await redis_cache.redis.flushall()
+        keys = [f"test-client|users:module.func(id={i})" for i in range(20)]
+        for key in keys:
+            _, _, generation = await redis_cache.check_cache(key, "users", ["user:1"])
+            await redis_cache.add_to_cache(key, {"key": key}, 60, generation)
+        assert len({redis_cache.redis.ring.get_node(key) for key in keys}) == 3
+
+        _, entry, _ = await redis_cache.check_cache(keys[0], "users", ["user:1"])
+        assert redis_cache.decode(entry) == {"key": keys[0]}
+        await redis_cache.invalidate_tags(["user:1"])
+        _, entry, _ = await redis_cache.check_cache(keys[0], "users", ["user:1"])
+        assert entry is None
+
+        await redis_cache.invalidate("users")
+        await asyncio.gather(*redis_cache._purge_tasks.values())
+        for key in keys:
+            assert not await redis_cache.redis.exists(key)
+
+    asyncio.run(scenario())
+
+
+def test_sharded_nodes_enforce_namespace_quotas():
+    async def scenario():
+        redis_cache = Cache()
+        await redis_cache.init(
+            host_url=["redis://node-1", "redis://node-2", "redis://node-3"],
+            prefix="test-client",
+            quotas={"users": NamespaceQuota(max_entries=5)},
+        )
+        await redis_cache.redis.flushall()
+        keys = [f"test-client|users:module.func(id={i})" for i in range(8)]
+        for key in keys:
+            await redis_cache.add_to_cache(key, {"key": key}, 60, namespace="users")
+
+        for key in keys[:3]:
+            assert not await redis_cache.redis.exists(key)
+        usage = (await redis_cache.get_usage())["users"]
+        assert usage["entries"] == 5
+        assert usage["evicted"] == 3
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_lookups_share_one_pipeline():
+    async def scenario():
+        redis_cache = Cache()
+        await redis_cache.init(
+            host_url="redis://localhost", prefix="test-client", auto_pipeline=True
+        )
+        await redis_cache.redis.flushall()
+        keys = [f"test-client|users:module.func(id={i})" for i in range(10)]
+        await asyncio.gather(
+            *(redis_cache.add_to_cache(key, {"key": key}, 60) for key in keys)
+        )
+        assert redis_cache.batcher.batches == 1
+
+        results = await asyncio.gather(
+            *(redis_cache.check_cache(key, "users") for key in keys)
+        )
+        assert [redis_cache.decode(entry) for _, entry, _ in results] == [
+            {"key": key} for key in keys
+        ]
+        assert redis_cache.batcher.batches == 2
+        assert redis_cache.batcher.commands == 10 + 10 * 3
+
+    asyncio.run(scenario())
+
+
+def test_fetch_counts_hits_misses_and_latencies():
+    async def scenario():
+        redis_cache = await init_cache()
+        key = "test-client|users:module.func(id=8)"
+
+        async def compute(generation):
+            await redis_cache.add_to_cache(key, {"id": 8}, 60, generation)
+            return {"id": 8}
+
+        def load(entry, ttl):
+            return redis_cache.decode(entry)
+
+        for _ in range(3):
+            await redis_cache.fetch(key, "users", compute, load, endpoint="module.func")
+
+        assert redis_cache.stats.get("users", "miss") == 1
+        assert redis_cache.stats.get("users", "hit") == 2
+        assert redis_cache.stats.get_endpoint("module.func", "hit") == 2
+        assert redis_cache.stats.hit_ratio("users") == 2 / 3
+        assert redis_cache.stats.latency("users", "lookup").count == 3
+        metrics = redis_cache.stats.render()
+        assert 'cache_events_total{namespace="users",event="hit"} 2' in metrics
+        assert (
+            'cache_redis_latency_seconds_count{namespace="users",operation="lookup"} 3'
+            in metrics
+        )
+
+    asyncio.run(scenario())
+
+
+def test_adaptive_ttl_follows_reads_and_invalidations():
+    async def scenario():
+        redis_cache = await init_cache()
+
+        @cache(namespace="profiles", expire=AdaptiveTTL(min_ttl=60, max_ttl=3600))
+        async def read_profile(profile_id: int):
+            return {"id": profile_id}
+
+        family = get_func_name(read_profile)
+        for _ in range(20):
+            assert await read_profile(1) == {"id": 1}
+        assert redis_cache.ttl_advisor.get_ttl(family) == 60
+
+        # one small entry read 20 times is worth keeping for the longest
+        await redis_cache.flush_ttl_stats()
+        assert redis_cache.ttl_advisor.get_ttl(family) == 3600
+
+        # invalidated more often than it is read
+        for _ in range(40):
+            await redis_cache.invalidate("profiles")
+        await redis_cache.flush_ttl_stats()
+        assert redis_cache.ttl_advisor.get_ttl(family) == 60
+        assert redis_cache.ttl_advisor.snapshot()[family]["invalidations"] == 40
+
+    asyncio.run(scenario())
+
+
+def test_namespace_over_quota_evicts_least_recently_read_entries():
+    async def scenario():
+        redis_cache = Cache()
+        await redis_cache.init(
+            host_url="redis://localhost",
+            prefix="test-client",
+            quotas={"users": NamespaceQuota(max_entries=3)},
+        )
+        await redis_cache.redis.flushall()
+        keys = [f"test-client|users:module.func(id={i})" for i in range(4)]
+        for key in keys[:3]:
+            await redis_cache.add_to_cache(key, {"key": key}, 60, namespace="users")
+        # the first key is read, so the second one is the least recently read
+        await redis_cache.check_cache(keys[0], "users")
+        await redis_cache.add_to_cache(keys[3], {"key": keys[3]}, 60, namespace="users")
+
+        assert not await redis_cache.redis.exists(keys[1])
+        for key in (keys[0], keys[2], keys[3]):
+            assert await redis_cache.redis.exists(key)
+        usage = (await redis_cache.get_usage())["users"]
+        assert usage["entries"] == 3
+        assert usage["evicted"] == 1
+        stored = [await redis_cache.redis.strlen(key) for key in keys if key != keys[1]]
+        assert usage["bytes"] == sum(stored)
+
+    asyncio.run(scenario())
+
+
+def test_expired_entries_do_not_count_towards_the_quota():
+    async def scenario():
+        redis_cache = Cache()
+        await redis_cache.init(
+            host_url="redis://localhost",
+            prefix="test-client",
+            quotas={"users": NamespaceQuota(max_entries=2)},
+        )
+        await redis_cache.redis.flushall()
+        keys = [f"test-client|users:module.func(id={i})" for i in range(4)]
+        for key in keys[:2]:
+            await redis_cache.add_to_cache(key, {"key": key}, 1, namespace="users")
+        await asyncio.sleep(1.1)
+        for key in keys[2:]:
+            await redis_cache.add_to_cache(key, {"key": key}, 60, namespace="users")
+
+        for key in keys[2:]:
+            assert await redis_cache.redis.exists(key)
+        usage = (await redis_cache.get_usage())["users"]
+        assert usage["entries"] == 2
+        assert usage["evicted"] == 0
+        stored = [await redis_cache.redis.strlen(key) for key in keys[2:]]
+        assert usage["bytes"] == sum(stored)
+
+    asyncio.run(scenario())
+
+
+def test_entries_gone_from_redis_are_not_counted_as_evicted():
+    async def scenario():
+        redis_cache = Cache()
+        await redis_cache.init(
+            host_url="redis://localhost",
+            prefix="test-client",
+            quotas={"users": NamespaceQuota(max_entries=2)},
+        )
+        await redis_cache.redis.flushall()
+        keys = [f"test-client|users:module.func(id={i})" for i in range(3)]
+        for key in keys:
+            if key == keys[2]:
+                # removed by Redis itself, e.g. under its maxmemory-policy
+                await redis_cache.redis.delete(keys[0])
+            await redis_cache.add_to_cache(key, {"key": key}, 60, namespace="users")
+
+        assert await redis_cache.redis.exists(keys[1], keys[2]) == 2
+        usage = (await redis_cache.get_usage())["users"]
+        assert usage["entries"] == 2
+        assert usage["evicted"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_overlapping_windows_share_chunks_and_items():
+    async def scenario():
+        redis_cache = await init_cache()
+        names = {i: f"user {i}" for i in range(25)}
+        calls = []
+
+        @cache(
+            namespace="lists",
+            expire=60,
+            list_cache=ListCacheOptions(chunk_size=10, item_tag="item:{id}"),
+        )
+        async def read_items(skip: int = 0, limit: int = 10):
+            calls.append(skip)
+            ids = range(skip, min(skip + limit, len(names)))
+            return [{"id": i, "name": names[i]} for i in ids]
+
+        first = await read_items(skip=5, limit=10)
+        assert [item["id"] for item in first] == list(range(5, 15))
+        second = await read_items(skip=8, limit=15)
+        assert [item["id"] for item in second] == list(range(8, 23))
+        # every aligned chunk was computed once
+        assert calls == [0, 10, 20]
+
+        names[12] = "renamed"
+        await redis_cache.invalidate_tags(["item:12"])
+        third = await read_items(skip=10, limit=5)
+        assert third[2] == {"id": 12, "name": "renamed"}
+        assert calls == [0, 10, 20, 10]
+        assert redis_cache.stats.get("lists", "item_hit") > 0
+
+    asyncio.run(scenario())
+
+
+def test_chunks_of_one_window_are_computed_one_at_a_time():
+    async def scenario():
+        await init_cache()
+        running = []
+
+        @cache(namespace="lists", expire=60, list_cache=ListCacheOptions(chunk_size=10))
+        async def read_rows(skip: int = 0, limit: int = 10):
+            # like a request's database session, which allows one query at a time
+            assert not running, "concurrent call"
+            running.append(skip)
+            await asyncio.sleep(0.01)
+            running.pop()
+            return [{"id": i} for i in range(skip, skip + limit)]
+
+        rows = await read_rows(skip=5, limit=30)
+        assert [row["id"] for row in rows] == list(range(5, 35))
+
+    asyncio.run(scenario())
+
+
+def test_misses_shortly_after_an_invalidation_read_fresh():
+    async def scenario():
+        redis_cache = await init_cache()
+        redis_cache.fresh_reads_window = 0.2
+        key = "test-client|users:module.func(id=4)"
+        reads = []
+
+        async def compute(generation):
+            reads.append(fresh_reads.get())
+            return {"id": 4}
+
+        def load(entry, ttl):
+            return redis_cache.decode(entry)
+
+        await redis_cache.fetch(key, "users", compute, load)
+        await redis_cache.invalidate_tags(["user:4"])
+        await redis_cache.fetch(key, "users", compute, load)
+        await asyncio.sleep(0.3)
+        await redis_cache.fetch(key, "users", compute, load)
+        assert reads == [False, True, False]
+        assert not fresh_reads.get()
+
+    asyncio.run(scenario())
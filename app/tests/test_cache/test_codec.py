@@ -0,0 +1,32 @@
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import pytest
+
+from cache.codec import JSONCodec, MsgPackCodec, ORJSONCodec, get_codec
+from cache.entry import CacheEntry
+
+VALUE = {
+    "id": 1,
+    "created": datetime(2022, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+    "balance": Decimal("10.25"),
+    "avatar": b"\x89PNG",
+    "tags": ["a", "b"],
+}
+
+
+@pytest.mark.parametrize("codec", [ORJSONCodec(), MsgPackCodec()])
+def test_special_types_round_trip(codec):
+    assert codec.decode(codec.encode(VALUE)) == VALUE
+
+
+def test_entry_is_decoded_with_the_codec_that_wrote_it():
+    json_codec, msgpack_codec = JSONCodec(), MsgPackCodec()
+    entries = [
+        CacheEntry(body=codec.encode({"id": 1}), codec_id=codec.codec_id).pack()
+        for codec in (json_codec, msgpack_codec)
+    ]
+
+    for data in entries:
+        entry = CacheEntry.unpack(data)
+        assert get_codec(entry.codec_id).decode(entry.body) == {"id": 1}
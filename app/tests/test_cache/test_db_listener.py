@@ -0,0 +1,40 @@
+import asyncio
+import os
+
+from cache import Cache
+from cache.db_listener import DatabaseListener
+from cache.types import TableInvalidation
+
+os.environ["CACHE_ENV"] = "TEST"
+
+
+def test_row_changes_invalidate_their_tags_once_across_workers():
+    async def scenario():
+        redis_cache = Cache()
+        await redis_cache.init(host_url="redis://localhost", prefix="test-listener")
+        await redis_cache.redis.flushall()
+        tables = {
+            "user": TableInvalidation(
+                row_tags=("user:{pk}",), list_tags=("user:list",), namespace="user"
+            )
+        }
+        workers = [DatabaseListener("postgresql://", tables) for _ in range(2)]
+        update = {"table": "user", "op": "UPDATE", "pk": "7", "txid": 100}
+        insert = {"table": "user", "op": "INSERT", "pk": "8", "txid": 101}
+        other = {"table": "item", "op": "UPDATE", "pk": "7", "txid": 101}
+
+        for worker in workers:
+            await worker.handle([update, insert, other])
+
+        async def version(tag):
+            return int(await redis_cache.redis.get(redis_cache.get_tag_key(tag)) or 0)
+
+        assert await version("user:7") == 1
+        assert await version("user:8") == 1
+        assert await version("user:list") == 1
+
+        await workers[0].invalidate_tables()
+        assert await redis_cache.redis.get(redis_cache.get_generation_key("user"))
+        assert await version("user:list") == 2
+
+    asyncio.run(scenario())
@@ -0,0 +1,111 @@
+import asyncio
+import os
+
+from fastapi import APIRouter, Depends, FastAPI
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+from cache import Cache, cache, invalidate
+
+os.environ["CACHE_ENV"] = "TEST"
+
+
+class Account(BaseModel):
+    id: int
+    name: str
+
+
+router = APIRouter()
+# whether the session of each report request was open when the report was read
+session_states = []
+
+
+def get_session():
+    session = {"open": True}
+    try:
+        yield session
+    finally:
+        session["open"] = False
+
+
+@router.get("/accounts/{account_id}")
+@cache(namespace="accounts", expire=60, tags=["account:{account_id}"])
+async def read_account(account_id: int) -> Account:
+    return {"id": account_id, "name": "account", "password": "secret"}
+
+
+@router.put("/accounts/{account_id}")
+@invalidate(tags=["account:{account_id}"])
+async def update_account(account_id: int) -> Account:
+    return {"id": account_id, "name": "account"}
+
+
+@router.get("/reports/{report_id}")
+@cache(namespace="reports", expire=60, stale_while_revalidate=60)
+async def read_report(report_id: int, session: dict = Depends(get_session)):
+    await asyncio.sleep(0.01)
+    session_states.append(session["open"])
+    return {"id": report_id, "version": len(session_states)}
+
+
+def start_application() -> FastAPI:
+    app = FastAPI()
+    app.include_router(router)
+
+    @app.on_event("startup")
+    async def startup():
+        await Cache().init(host_url="redis://localhost", prefix="test-decorator")
+
+    return app
+
+
+def test_hit_returns_stored_bytes_with_etag():
+    with TestClient(start_application()) as client:
+        miss = client.get("/accounts/1")
+        hit = client.get("/accounts/1")
+
+    assert miss.headers["X-FastAPI-Cache"] == "Miss"
+    assert hit.headers["X-FastAPI-Cache"] == "Hit"
+    # the stored body went through the response model
+    assert hit.content == miss.content == b'{"id":1,"name":"account"}'
+    assert hit.headers["ETag"] == miss.headers["ETag"] == Cache.get_etag(hit.content)
+
+
+def test_conditional_request_gets_not_modified():
+    with TestClient(start_application()) as client:
+        etag = client.get("/accounts/2").headers["ETag"]
+        response = client.get("/accounts/2", headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["ETag"] == etag
+
+
+def test_invalidating_a_tag_keeps_the_rest_of_the_namespace():
+    with TestClient(start_application()) as client:
+        client.get("/accounts/3")
+        client.get("/accounts/4")
+        client.put("/accounts/3")
+        updated = client.get("/accounts/3")
+        untouched = client.get("/accounts/4")
+
+    assert updated.headers["X-FastAPI-Cache"] == "Miss"
+    assert untouched.headers["X-FastAPI-Cache"] == "Hit"
+
+
+def test_stale_hit_keeps_the_dependencies_open_for_the_refresh():
+    with TestClient(start_application()) as client:
+        client.get("/reports/1")
+        redis = Cache().redis
+        [key] = client.portal.call(redis.keys, "test-decorator|reports:*")
+        # 30 seconds left of the grace window: the entry is stale
+        client.portal.call(redis.expire, key, 30)
+        stale = client.get("/reports/1")
+        refreshed = client.get("/reports/1")
+
+    assert stale.json() == {"id": 1, "version": 1}
+    assert stale.headers["Cache-Control"] == "max-age=0"
+    # the response was not held back by the refresh, which ran afterwards with the
+    # session of the request still open
+    assert refreshed.json() == {"id": 1, "version": 2}
+    assert session_states == [True, True]
@@ -0,0 +1,34 @@
+from fastapi import Request
+
+from cache.key_gen import get_cache_key, get_ignore_arg_types, get_key_builder
+
+
+class Session:
+    pass
+
+
+async def read_items(db: Session, skip: int = 0, limit: int = 100):
+    pass
+
+
+def test_keyword_and_positional_calls_build_the_same_key():
+    ignore_arg_types = [Session]
+
+    by_keyword = get_cache_key("prefix", ignore_arg_types, read_items, db=Session())
+    by_position = get_cache_key("prefix", ignore_arg_types, read_items, Session(), 0)
+
+    expected = f"prefix:{__name__}.read_items(skip=0,limit=100)"
+    assert by_keyword == by_position == expected
+    assert ignore_arg_types == [Session]
+
+
+def test_ignore_arg_types_are_compiled_once():
+    ignore_arg_types = get_ignore_arg_types([Session, Request])
+    builder = get_key_builder(read_items)
+
+    first = builder.included_args(ignore_arg_types)
+    second = builder.included_args(ignore_arg_types)
+
+    assert first is second
+    assert [name for name, _ in first] == ["skip", "limit"]
+    assert len(ignore_arg_types) == len(get_ignore_arg_types(ignore_arg_types))
@@ -0,0 +1,135 @@
+import os
+
+from fastapi import APIRouter, Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from cache import Cache, CacheRoute, cache, invalidate
+from cache.types import WriteThrough
+
+os.environ["CACHE_ENV"] = "TEST"
+
+calls = {"dependency": 0, "endpoint": 0, "role": 0, "note": 0}
+notes = {1: "draft"}
+
+
+def get_resource() -> str:
+    calls["dependency"] += 1
+    return "resource"
+
+
+def principal_from_header(request) -> str | None:
+    return request.headers.get("x-principal")
+
+
+@cache(namespace="roles", expire=60, vary_by=())
+async def get_role(principal: str) -> str:
+    calls["role"] += 1
+    return "admin" if principal.startswith("admin") else "member"
+
+
+async def role_from_principal(request) -> str | None:
+    principal = await Cache().resolve_principal(request)
+    return await get_role(principal) if principal else principal
+
+
+async def allow_admins(request) -> bool:
+    return await Cache().resolve_role(request) == "admin"
+
+
+router = APIRouter(route_class=CacheRoute)
+
+
+@router.get("/items/")
+@cache(namespace="items", expire=60)
+async def read_items(skip: int = 0, resource: str = Depends(get_resource)):
+    calls["endpoint"] += 1
+    return {"skip": skip, "resource": resource}
+
+
+@router.get("/reports/{report_id}")
+@cache(namespace="reports", expire=60, vary_by=(), auth_check=allow_admins)
+async def read_report(report_id: int):
+    return {"id": report_id}
+
+
+@router.get("/notes/{note_id}")
+@cache(namespace="notes", expire=60, vary_by=(), tags=["note:{note_id}"])
+async def read_note(note_id: int):
+    calls["note"] += 1
+    return {"id": note_id, "text": notes[note_id]}
+
+
+@router.put("/notes/{note_id}")
+@invalidate(tags=["note:{note_id}"], write_through=[WriteThrough(read_note)])
+async def update_note(note_id: int, text: str):
+    notes[note_id] = text
+    return {"id": note_id, "text": text}
+
+
+def start_application() -> FastAPI:
+    app = FastAPI()
+    app.include_router(router)
+
+    @app.on_event("startup")
+    async def startup():
+        await Cache().init(
+            host_url="redis://localhost",
+            prefix="test-cache",
+            principal_resolver=principal_from_header,
+            role_resolver=role_from_principal,
+        )
+
+    return app
+
+
+def test_cache_hit_skips_dependencies():
+    headers = {"x-principal": "1"}
+    with TestClient(start_application()) as client:
+        first = client.get("/items/?skip=1", headers=headers)
+        second = client.get("/items/?skip=1", headers=headers)
+
+    assert first.json() == second.json() == {"skip": 1, "resource": "resource"}
+    assert first.headers["X-FastAPI-Cache"] == "Miss"
+    assert second.headers["X-FastAPI-Cache"] == "Hit"
+    assert (calls["dependency"], calls["endpoint"]) == (1, 1)
+
+
+def test_cache_key_is_scoped_to_principal():
+    with TestClient(start_application()) as client:
+        client.get("/items/?skip=2", headers={"x-principal": "1"})
+        response = client.get("/items/?skip=2", headers={"x-principal": "2"})
+
+    assert response.headers["X-FastAPI-Cache"] == "Miss"
+
+
+def test_unverified_principal_is_not_cached():
+    with TestClient(start_application()) as client:
+        client.get("/items/?skip=3")
+        response = client.get("/items/?skip=3")
+
+    assert "X-FastAPI-Cache" not in response.headers
+
+
+def test_entry_is_shared_by_callers_that_pass_the_auth_check():
+    with TestClient(start_application()) as client:
+        first = client.get("/reports/1", headers={"x-principal": "admin-1"})
+        second = client.get("/reports/1", headers={"x-principal": "admin-2"})
+        denied = client.get("/reports/1", headers={"x-principal": "member-1"})
+        client.get("/reports/2", headers={"x-principal": "admin-1"})
+
+    assert first.headers["X-FastAPI-Cache"] == "Miss"
+    assert second.headers["X-FastAPI-Cache"] == "Hit"
+    assert "X-FastAPI-Cache" not in denied.headers
+    # roles are resolved by a cached function, once per principal
+    assert calls["role"] == 3
+
+
+def test_write_through_replaces_the_entry_of_the_route():
+    with TestClient(start_application()) as client:
+        client.get("/notes/1")
+        client.put("/notes/1?text=final")
+        response = client.get("/notes/1")
+
+    assert response.headers["X-FastAPI-Cache"] == "Hit"
+    assert response.json() == {"id": 1, "text": "final"}
+    assert calls["note"] == 1
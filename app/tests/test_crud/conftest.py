@@ -0,0 +1,20 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+
+from app import models
+from app.core.config import settings
+from app.db.base_class import Base
+
+
+@pytest.fixture
+def postgres():
+    """The engine of the test database, skipped when it is not running."""
+    engine = create_engine(settings.SQLALCHEMY_TEST_DATABASE_URI)
+    try:
+        Base.metadata.create_all(engine, tables=[models.User.__table__])
+    except OperationalError as e:
+        pytest.skip(f"the test database is not available: {e}")
+    yield engine
+    Base.metadata.drop_all(engine, tables=[models.User.__table__])
+    engine.dispose()
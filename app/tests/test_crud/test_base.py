@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import Session
+
+from app import crud, models
+from app.db.base_class import Base
+from app.crud.base import UNIQUE_VIOLATION, AlreadyExists, raise_for_integrity_error
+
+
+class DriverError(Exception):
+    def __init__(self, pgcode):
+        super().__init__("violation")
+        self.pgcode = pgcode
+
+
+def test_unique_violations_raise_already_exists():
+    error = IntegrityError("INSERT", {}, DriverError(UNIQUE_VIOLATION))
+    with pytest.raises(AlreadyExists):
+        raise_for_integrity_error(error)
+
+
+def test_other_integrity_errors_are_raised_as_is():
+    # a not-null violation
+    error = IntegrityError("INSERT", {}, DriverError("23502"))
+    with pytest.raises(IntegrityError):
+        raise_for_integrity_error(error)
+
+
+def test_remove_deletes_rows_of_models_without_a_soft_delete_column():
+    sql = str(
+        crud.user.get_remove_statement(1).compile(dialect=postgresql.dialect())
+    )
+    assert sql.startswith('DELETE FROM "user" WHERE "user".id = ')
+    assert "RETURNING" in sql
+
+
+def test_pending_data_holds_the_changed_columns():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine, tables=[models.User.__table__])
+    with Session(engine) as db:
+        db.add(models.User(id=1, email="user@example.com", hashed_password="x"))
+        db.commit()
+        user = db.get(models.User, 1)
+        assert crud.user.get_pending_data(user) == {}
+        user.full_name = "Name"
+        assert crud.user.get_pending_data(user) == {"full_name": "Name"}
+
+
+def test_update_writes_pending_changes_of_the_object(postgres):
+    with Session(postgres) as db:
+        user = crud.user.create(
+            db, obj_in={"email": "user@example.com", "hashed_password": "x"}
+        )
+        user.full_name = "Name"
+        user = crud.user.update(db, db_obj=user, obj_in={"is_active": False})
+
+    assert (user.full_name, user.is_active) == ("Name", False)
+
+
+def test_async_bulk_writes_return_loaded_objects(postgres):
+    async def scenario():
+        engine = create_async_engine(postgres.url.set(drivername="postgresql+asyncpg"))
+        # expires its objects on commit, which could only be loaded again
+        # with an await.
+        async with AsyncSession(engine) as db:
+            users = await crud.user.create_many(
+                db,
+                objs_in=[
+                    {"email": f"user{i}@example.com", "hashed_password": "x"}
+                    for i in range(3)
+                ],
+            )
+            assert [user.email for user in users] == [
+                f"user{i}@example.com" for i in range(3)
+            ]
+        await engine.dispose()
+
+    asyncio.run(scenario())
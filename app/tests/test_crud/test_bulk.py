@@ -0,0 +1,139 @@
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.future import select
+from sqlalchemy.orm import Session
+
+from app import crud, models
+from app.crud.bulk import (
+    MAX_BIND_PARAMETERS,
+    get_chunks,
+    get_insert_statement,
+    get_update_statement,
+    get_upsert_statement,
+)
+
+table = models.User.__table__
+
+
+def compile_sql(statement) -> str:
+    return str(statement.compile(dialect=postgresql.dialect()))
+
+
+def test_chunks_group_rows_by_columns_and_keep_their_positions():
+    rows = [{"a": 1}, {"a": 2, "b": 2}, {"a": 3}, {"a": 4}, {"a": 5, "b": 5}]
+    chunks = list(get_chunks(rows, chunk_size=2))
+    assert [positions for positions, _ in chunks] == [[0, 2], [3], [1, 4]]
+    assert chunks[2][1] == [rows[1], rows[4]]
+
+    wide = [{str(column): 0 for column in range(10)}] * 5000
+    sizes = [len(chunk) for _, chunk in get_chunks(wide, chunk_size=5000)]
+    assert max(sizes) * 10 <= MAX_BIND_PARAMETERS
+    assert sum(sizes) == 5000
+
+
+def test_insert_is_one_statement_returning_the_rows():
+    rows = [
+        {"email": f"user{index}@example.com", "hashed_password": "x"}
+        for index in range(3)
+    ]
+    sql = compile_sql(get_insert_statement(table, rows))
+    assert sql.count("INSERT") == 1
+    assert "%(email_m2)s" in sql
+    assert 'RETURNING "user".created' in sql
+
+
+def test_upsert_updates_the_other_columns_on_conflict():
+    rows = [{"email": "b@example.com", "hashed_password": "x", "full_name": "B"}]
+    sql = compile_sql(get_upsert_statement(table, rows, [models.User.email.key]))
+    assert "ON CONFLICT (email) DO UPDATE SET" in sql
+    assert "hashed_password = excluded.hashed_password" in sql
+    assert "full_name = excluded.full_name" in sql
+    assert "email = excluded.email" not in sql
+    assert "modified = " in sql
+    assert "RETURNING" in sql
+
+
+def test_update_joins_the_new_values_of_every_row():
+    rows = [{"id": 1, "full_name": "A"}, {"id": 2, "full_name": "B"}]
+    sql = compile_sql(get_update_statement(table, rows))
+    assert sql.count("UPDATE") == 1
+    assert "UNION ALL" in sql
+    assert "CAST(%(param_1)s AS INTEGER) AS id" in sql
+    assert 'WHERE "user".id = source.id' in sql
+    assert "RETURNING" in sql
+
+
+def make_users(count: int, prefix: str = "user") -> list[dict]:
+    return [
+        {"email": f"{prefix}{index}@example.com", "hashed_password": "x"}
+        for index in range(count)
+    ]
+
+
+def test_create_many_returns_the_inserted_rows_in_order(postgres):
+    with Session(postgres) as db:
+        users = crud.user.create_many(db, objs_in=make_users(5), chunk_size=2)
+
+    assert [user.email for user in users] == [
+        f"user{index}@example.com" for index in range(5)
+    ]
+    assert len({user.id for user in users}) == 5
+    assert all(user.created and user.is_active for user in users)
+
+
+def test_upsert_many_updates_rows_holding_the_conflict_keys(postgres):
+    with Session(postgres) as db:
+        [existing] = crud.user.create_many(db, objs_in=make_users(1))
+        users = crud.user.upsert_many(
+            db,
+            objs_in=[
+                {"email": "new@example.com", "hashed_password": "x"},
+                {**make_users(1)[0], "full_name": "Old"},
+                {**make_users(1)[0], "full_name": "Updated"},
+            ],
+            conflict_keys=[models.User.email],
+        )
+        count = db.scalar(select(func.count()).select_from(table))
+
+    assert [user.email for user in users] == ["new@example.com", "user0@example.com"]
+    assert users[1].id == existing.id
+    assert users[1].full_name == "Updated"
+    assert users[1].modified > existing.modified
+    assert count == 2
+
+
+def test_update_many_sets_the_values_and_modified_of_each_row(postgres):
+    with Session(postgres) as db:
+        first, second = crud.user.create_many(db, objs_in=make_users(2))
+        users = crud.user.update_many(
+            db,
+            objs_in={
+                second.id: {"full_name": "Second"},
+                first.id: {"full_name": "First", "is_active": False},
+                0: {"full_name": "Missing"},
+            },
+        )
+
+    assert [user.id for user in users] == [second.id, first.id]
+    assert [user.full_name for user in users] == ["Second", "First"]
+    assert [user.is_active for user in users] == [True, False]
+    assert users[0].modified > second.modified
+    assert users[1].modified > first.modified
+
+
+def test_bulk_writes_beyond_the_bind_parameter_limit_are_chunked(postgres):
+    # 4 values a row, more than MAX_BIND_PARAMETERS for the whole list
+    rows = [{**row, "full_name": "A", "is_active": True} for row in make_users(9000)]
+    with Session(postgres) as db:
+        users = crud.user.create_many(db, objs_in=rows, chunk_size=len(rows))
+        updated = crud.user.update_many(
+            db,
+            objs_in={user.id: {"full_name": "B"} for user in users},
+            chunk_size=len(rows),
+        )
+        names = db.scalars(select(models.User.full_name).distinct()).all()
+
+    assert len(rows) * 4 > MAX_BIND_PARAMETERS
+    assert [user.email for user in users] == [row["email"] for row in rows]
+    assert [user.id for user in updated] == [user.id for user in users]
+    assert names == ["B"]
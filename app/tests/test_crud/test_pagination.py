@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, models
+from app.crud.pagination import InvalidCursor
+from app.db.base_class import Base
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine, tables=[models.User.__table__])
+    session = sessionmaker(bind=engine)()
+    start = datetime(2023, 1, 1, tzinfo=timezone.utc)
+    for index in range(1, 8):
+        session.add(
+            models.User(
+                id=index,
+                email=f"user{index}@example.com",
+                hashed_password="x",
+                # users 2k and 2k+1 were created at the same time
+                created=start + timedelta(days=index // 2),
+            )
+        )
+    session.commit()
+    yield session
+    session.close()
+
+
+def test_cursors_walk_every_row_once_in_both_directions(db):
+    order_by = ("-created", "email")
+    pages = [crud.user.get_page(db, limit=3, order_by=order_by)]
+    while pages[-1].next_cursor:
+        cursor = pages[-1].next_cursor
+        pages.append(crud.user.get_page(db, cursor=cursor, limit=3, order_by=order_by))
+
+    ids = [[user.id for user in page.items] for page in pages]
+    assert ids == [[6, 7, 4], [5, 2, 3], [1]]
+    assert pages[0].prev_cursor is None
+
+    back = crud.user.get_page(
+        db, cursor=pages[2].prev_cursor, limit=3, order_by=order_by
+    )
+    assert [user.id for user in back.items] == [5, 2, 3]
+    assert back.prev_cursor is not None
+
+
+@pytest.mark.parametrize(
+    "order_by, expected",
+    [(("created",), [1, 2, 4, 5, 7, 3, 6]), (("-created",), [6, 3, 7, 5, 4, 2, 1])],
+)
+def test_rows_without_a_sort_value_are_paged_after_the_others(db, order_by, expected):
+    for user_id in (3, 6):
+        db.get(models.User, user_id).created = None
+    db.commit()
+
+    pages = [crud.user.get_page(db, limit=2, order_by=order_by)]
+    while pages[-1].next_cursor:
+        cursor = pages[-1].next_cursor
+        pages.append(crud.user.get_page(db, cursor=cursor, limit=2, order_by=order_by))
+    assert [user.id for page in pages for user in page.items] == expected
+
+    back = [pages[-1]]
+    while back[-1].prev_cursor:
+        cursor = back[-1].prev_cursor
+        back.append(crud.user.get_page(db, cursor=cursor, limit=2, order_by=order_by))
+    assert [user.id for page in reversed(back) for user in page.items] == expected
+
+
+def test_cursor_of_another_order_is_rejected(db):
+    page = crud.user.get_page(db, limit=2, order_by=("email",))
+    with pytest.raises(InvalidCursor):
+        crud.user.get_page(db, cursor=page.next_cursor, limit=2)
+    with pytest.raises(InvalidCursor):
+        crud.user.get_page(db, cursor="not-a-cursor", limit=2)
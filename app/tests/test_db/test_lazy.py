@@ -0,0 +1,126 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine, insert, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.future import select
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, models
+from app.core.config import settings
+from app.db.base_class import Base
+from app.db.lazy import LazyAsyncSession, LazySession
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine, tables=[models.User.__table__])
+    with engine.begin() as connection:
+        connection.execute(
+            insert(models.User.__table__).values(
+                id=1, email="user@example.com", hashed_password="x"
+            )
+        )
+    session = LazySession(bind=engine, expire_on_commit=False)
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def postgres():
+    """The test database with one user, skipped when it is not running."""
+    engine = create_engine(settings.SQLALCHEMY_TEST_DATABASE_URI)
+    try:
+        Base.metadata.create_all(engine, tables=[models.User.__table__])
+    except OperationalError as e:
+        pytest.skip(f"the test database is not available: {e}")
+    with engine.begin() as connection:
+        connection.execute(
+            insert(models.User.__table__).values(
+                id=1, email="user@example.com", hashed_password="x"
+            )
+        )
+    yield settings.SQLALCHEMY_TEST_DATABASE_URI
+    Base.metadata.drop_all(engine, tables=[models.User.__table__])
+    engine.dispose()
+
+
+def test_read_only_transactions_are_released(db):
+    assert not db.in_transaction()
+    user = crud.user.get(db, id=1)
+    assert db.can_release()
+    db.release()
+    assert not db.in_transaction()
+    # loaded objects stay usable.
+    assert user.email == "user@example.com"
+
+
+def test_transactions_that_wrote_are_kept(db):
+    db.execute(
+        update(models.User.__table__)
+        .where(models.User.id == 1)
+        .values(full_name="Name")
+    )
+    db.release()
+    assert db.in_transaction()
+    db.commit()
+
+    db.scalars(select(models.User)).all()
+    db.release()
+    assert not db.in_transaction()
+
+
+def test_pending_changes_and_explicit_transactions_are_kept(db):
+    user = crud.user.get(db, id=1)
+    user.full_name = "Name"
+    db.release()
+    assert db.in_transaction()
+    db.rollback()
+
+    db.begin()
+    crud.user.get(db, id=1)
+    db.release()
+    assert db.in_transaction()
+    db.commit()
+
+    crud.user.get(db, id=1)
+    db.release()
+    assert not db.in_transaction()
+
+
+def test_async_reads_return_their_connection_and_writes_keep_it(postgres):
+    async def scenario():
+        engine = create_async_engine(
+            str(postgres).replace("postgresql://", "postgresql+asyncpg://", 1)
+        )
+        async_session = sessionmaker(
+            bind=engine,
+            class_=LazyAsyncSession,
+            sync_session_class=LazySession,
+            autocommit=False,
+            autoflush=False,
+            expire_on_commit=False,
+        )
+        async with async_session() as db:
+            user = await crud.user.get(db, id=1)
+            assert engine.pool.checkedout() == 0
+            users = await crud.user.get_multi(db)
+            assert engine.pool.checkedout() == 0
+            assert users == [user]
+
+            await db.execute(
+                update(models.User.__table__)
+                .where(models.User.id == 1)
+                .values(full_name="Name")
+                .returning(models.User.id)
+            )
+            assert engine.pool.checkedout() == 1
+            await crud.user.get(db, id=1)
+            assert engine.pool.checkedout() == 1
+            await db.commit()
+            assert engine.pool.checkedout() == 0
+        await engine.dispose()
+
+    asyncio.run(scenario())
@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine, insert
+from sqlalchemy.future import select
+from sqlalchemy.pool import QueuePool
+
+from app import crud, models
+from app.db.context import read_fresh
+from app.db.base_class import Base
+from app.db.routing import (
+    LEAST_CONNECTIONS,
+    ReplicaPool,
+    RoutingSession,
+    set_scope,
+    use_primary,
+)
+
+
+def make_database(email: str):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine, tables=[models.User.__table__])
+    with engine.begin() as connection:
+        connection.execute(
+            insert(models.User.__table__).values(
+                id=1, email=email, hashed_password="x"
+            )
+        )
+    return engine
+
+
+@pytest.fixture
+def primary():
+    return make_database("primary@example.com")
+
+
+@pytest.fixture
+def replicas():
+    return ReplicaPool(
+        [make_database("replica1@example.com"), make_database("replica2@example.com")]
+    )
+
+
+def read_email(session: RoutingSession) -> str:
+    return session.scalars(select(models.User.email)).one()
+
+
+def test_reads_go_to_the_replicas_in_turn(primary, replicas):
+    emails = []
+    for _ in range(3):
+        with RoutingSession(bind=primary, replicas=replicas) as session:
+            emails += [read_email(session), read_email(session)]
+    assert emails == [
+        "replica1@example.com",
+        "replica1@example.com",
+        "replica2@example.com",
+        "replica2@example.com",
+        "replica1@example.com",
+        "replica1@example.com",
+    ]
+
+
+def test_session_reads_its_writes_and_its_scope_the_next_ones(primary, replicas):
+    with RoutingSession(bind=primary, replicas=replicas) as session:
+        set_scope(session, "7")
+        assert read_email(session) == "replica1@example.com"
+        session.add(models.User(id=2, email="new@example.com", hashed_password="x"))
+        session.flush()
+        assert crud.user.get(session, id=2).email == "new@example.com"
+        session.commit()
+
+    with RoutingSession(bind=primary, replicas=replicas) as session:
+        set_scope(session, "7")
+        assert crud.user.get(session, id=2) is not None
+    with RoutingSession(bind=primary, replicas=replicas) as session:
+        set_scope(session, "8")
+        assert crud.user.get(session, id=2) is None
+
+
+def test_pinned_reads_go_to_the_primary(primary, replicas):
+    with RoutingSession(bind=primary, replicas=replicas) as session:
+        assert crud.user.get(session, id=1, primary=True).email == "primary@example.com"
+        assert read_email(session) == "replica1@example.com"
+        use_primary(session)
+        assert read_email(session) == "primary@example.com"
+
+
+def test_fresh_reads_go_to_the_primary(primary, replicas):
+    with RoutingSession(bind=primary, replicas=replicas) as session:
+        with read_fresh():
+            assert read_email(session) == "primary@example.com"
+        assert read_email(session) == "replica1@example.com"
+
+
+def test_unhealthy_replicas_are_skipped(primary, replicas):
+    async def get_lag(replica):
+        if replica is replicas.replicas[0]:
+            raise OSError("connection refused")
+        return 30.0
+
+    replicas.get_lag = get_lag
+    replicas.max_lag = 60.0
+    asyncio.run(replicas.check_replica(replicas.replicas[0]))
+    asyncio.run(replicas.check_replica(replicas.replicas[1]))
+    assert [replica.healthy for replica in replicas.replicas] == [False, True]
+    with RoutingSession(bind=primary, replicas=replicas) as session:
+        assert read_email(session) == "replica2@example.com"
+
+    replicas.max_lag = 10.0
+    asyncio.run(replicas.check_replica(replicas.replicas[1]))
+    with RoutingSession(bind=primary, replicas=replicas) as session:
+        assert read_email(session) == "primary@example.com"
+
+
+def test_least_connections_picks_the_idlest_replica():
+    replicas = ReplicaPool(
+        [create_engine("sqlite://", poolclass=QueuePool) for _ in range(2)],
+        selection=LEAST_CONNECTIONS,
+    )
+    first = replicas.replicas[0].bind.connect()
+    try:
+        assert replicas.choose() is replicas.replicas[1]
+    finally:
+        first.close()
+    assert replicas.choose() is replicas.replicas[0]